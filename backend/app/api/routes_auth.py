@@ -4,14 +4,13 @@ import logging
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import RedirectResponse
-from sqlmodel import Session
 
 from app.core.config import Settings, get_settings
 from app.db import crud
 from app.db.models import GmailAccountToken
-from app.db.session import get_session
+from app.db.session import run_db
 from app.gmail import client as gmail_client
-from app.gmail import oauth
+from app.gmail import oauth, tokens
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +44,6 @@ async def auth_start(
 async def auth_callback(
     code: str = Query(...),
     state: str = Query(...),
-    session: Session = Depends(get_session),
     settings: Settings = Depends(get_settings),
 ):
     if not oauth.verify_state(state, settings.oauth_state_secret):
@@ -83,7 +81,8 @@ async def auth_callback(
         expires_at=expires_at,
     )
 
-    saved = crud.upsert_account_token(session, token)
+    saved = await run_db(crud.upsert_account_token, token)
+    tokens.invalidate_account_cache()
 
     logger.info(
         "oauth_callback success account_id=%s email=%s has_refresh_token=%s",
@@ -1,79 +1,339 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import dataclasses
+import hashlib
+import heapq
+import itertools
+import json
 import logging
-from datetime import date, datetime, timedelta
-from typing import Optional
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlmodel import Session
 
-from app.db import crud
+from app.core.config import Settings, get_settings
+from app.db import crud, fts
 from app.db.models import GmailAccountToken
-from app.db.session import get_session
+from app.db.session import get_session, run_db
+from app.gmail import cache as message_cache
+from app.gmail import attachment_store
+from app.gmail import backfill as gmail_backfill
 from app.gmail import client as gmail_client
-from app.gmail import oauth
+from app.gmail import content as gmail_content
+from app.gmail import planner, query_cache, quota, semantic
+from app.gmail import sync as gmail_sync
+from app.gmail import tokens
+from app.gmail import watch as gmail_watch
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used without it
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/gmail", tags=["gmail"])
 
+_FIELDS_DESCRIPTION = "Comma-separated summary fields to fetch and return: " + ",".join(
+    gmail_client.SUMMARY_FIELDS
+)
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode("utf-8")
 
-def _needs_refresh(account: GmailAccountToken) -> bool:
-    if not account.expires_at:
-        return False
-    return datetime.utcnow() >= (account.expires_at - timedelta(seconds=60))
 
+def _json_response(payload) -> Response:
+    # Payloads here are plain JSON types already; skip FastAPI's jsonable_encoder pass.
+    return Response(_dumps(payload), media_type="application/json")
 
-async def _get_valid_access_token(session: Session, account: GmailAccountToken) -> str:
-    if not _needs_refresh(account):
-        return account.access_token
 
-    if not account.refresh_token:
-        raise HTTPException(status_code=401, detail="No refresh token stored; re-auth required")
+def _parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    try:
+        return gmail_client.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
 
-    logger.info("token_refresh start account_id=%s email=%s", account.id, account.email)
+async def _get_valid_access_token(account: GmailAccountToken) -> str:
     try:
-        refreshed = await oauth.refresh_access_token(account.refresh_token)
+        return await tokens.get_valid_access_token(account)
+    except tokens.TokenRefreshError as e:
+        raise HTTPException(status_code=401 if e.reauth_required else 502, detail=str(e)) from e
+
+
+def _find_account(
+    session: Session, account_id: Optional[int], email: Optional[str]
+) -> Optional[GmailAccountToken]:
+    if account_id is not None:
+        return crud.get_account_by_id(session, account_id)
+    if email is not None:
+        return crud.get_account_by_email(session, email)
+    return crud.get_latest_account(session)
+
+
+async def _resolve_account(account_id: Optional[int], email: Optional[str]) -> GmailAccountToken:
+    account = tokens.cached_account(account_id, email)
+    if account is None:
+        account = await run_db(_find_account, account_id, email)
+        if account:
+            tokens.cache_account(account_id, email, account)
+    if not account:
+        raise HTTPException(status_code=404, detail="No connected Gmail account found")
+    quota.bind_account(account.id)
+    return account
+
+
+def _query_fingerprint(account_id: int, q: str) -> str:
+    return hashlib.sha256(f"{account_id}:{q}".encode("utf-8")).hexdigest()[:16]
+
+
+def _encode_cursor(account_id: int, q: str, page_token: str) -> str:
+    payload = {"a": account_id, "f": _query_fingerprint(account_id, q), "t": page_token}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("utf-8")
+
+
+def _decode_cursor(cursor: str, account_id: int, q: str) -> str:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("utf-8")))
+        page_token = payload["t"]
+        matches = payload["a"] == account_id and payload["f"] == _query_fingerprint(account_id, q)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not matches:
+        raise HTTPException(status_code=400, detail="Cursor does not match this account and query")
+    return page_token
+
+
+def _gmail_http_error(e: httpx.HTTPStatusError, *, not_found: Optional[str] = None) -> HTTPException:
+    status = e.response.status_code
+    if status == 429:
+        retry_after = e.response.headers.get("retry-after")
+        return HTTPException(
+            status_code=429,
+            detail="Gmail rate limit exceeded",
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
+    if status == 404 and not_found:
+        return HTTPException(status_code=404, detail=not_found)
+    return HTTPException(status_code=502, detail="Gmail fetch failed")
+
+
+async def _list_ids(
+    access_token: str,
+    q: str,
+    max_results: int,
+    page_token: Optional[str],
+    *,
+    kind: str = "messages",
+) -> tuple[list[str], Optional[str]]:
+    lister = gmail_client.list_threads_page if kind == "threads" else gmail_client.list_messages_page
+    try:
+        page = await lister(access_token, q=q, max_results=max_results, page_token=page_token)
+    except httpx.HTTPStatusError as e:
+        logger.exception("gmail_fetch list_failed")
+        raise _gmail_http_error(e) from e
     except Exception as e:
-        logger.exception("token_refresh failed")
-        raise HTTPException(status_code=502, detail="Token refresh failed") from e
+        logger.exception("gmail_fetch list_failed")
+        raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+    return [item["id"] for item in page.get(kind, [])], page.get("nextPageToken")
 
-    new_access_token = refreshed.get("access_token")
-    expires_at = oauth.compute_expires_at(refreshed.get("expires_in"))
 
-    if not new_access_token:
-        raise HTTPException(status_code=502, detail="Refresh response missing access_token")
+async def _list_page(
+    access_token: str,
+    account: GmailAccountToken,
+    q: str,
+    max_results: int,
+    cursor: Optional[str],
+    *,
+    kind: str = "messages",
+) -> tuple[list[str], Optional[str]]:
+    # kind is "messages" or "threads"; thread cursors are fingerprinted separately so
+    # a messages cursor cannot be replayed against /threads.
+    cursor_q = q if kind == "messages" else f"{kind}:{q}"
+    page_token = _decode_cursor(cursor, account.id, cursor_q) if cursor else None
+    ids, next_token = await _list_ids(access_token, q, max_results, page_token, kind=kind)
+    next_cursor = _encode_cursor(account.id, cursor_q, next_token) if next_token else None
+    return ids, next_cursor
 
-    crud.update_tokens(
-        session,
-        account,
-        access_token=new_access_token,
-        expires_at=expires_at,
-        scope=refreshed.get("scope", account.scope),
-        token_type=refreshed.get("token_type", account.token_type),
-    )
-    return new_access_token
+
+def _message_error(message_id: str, exc: BaseException) -> dict:
+    status = None
+    if isinstance(exc, gmail_client.GmailApiError):
+        status = exc.status_code
+    elif isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    return {"id": message_id, "status": status, "error": exc.__class__.__name__}
 
 
 @router.get("/accounts")
 def list_accounts(session: Session = Depends(get_session)):
-    # Minimal: list last connected account
-    latest = crud.get_latest_account(session)
-    if not latest:
-        return {"accounts": []}
+    # Most recently connected first
     return {
         "accounts": [
             {
-                "id": latest.id,
-                "email": latest.email,
-                "scope": latest.scope,
-                "expires_at": latest.expires_at,
-                "updated_at": latest.updated_at,
+                "id": account.id,
+                "email": account.email,
+                "scope": account.scope,
+                "expires_at": account.expires_at,
+                "updated_at": account.updated_at,
             }
+            for account in crud.list_accounts(session)
         ]
     }
 
 
+@router.get("/quota")
+def quota_stats():
+    return quota.scheduler.stats()
+
+
+@router.get("/cache")
+async def cache_stats(settings: Settings = Depends(get_settings)):
+    stats = {"query_cache": query_cache.cache.stats()}
+    if settings.attachment_store_enabled:
+        stats["attachment_store"] = await attachment_store.stats()
+    return stats
+
+
+_PLAN_SOURCES = {"local": "local", "split": "hybrid", "upstream": "gmail"}
+
+
+def _plan_cursor_q(query: planner.StructuredQuery) -> str:
+    return f"plan:{query.gmail_query}"
+
+
+async def _start_plan(
+    account: GmailAccountToken, query: planner.StructuredQuery, cursor: Optional[str]
+) -> Tuple[planner.Plan, Optional[str], str]:
+    # Returns the plan and where this page starts: phase "l" (local offset) or "u"
+    # (upstream page token), as planner.encode_position describes.
+    if cursor:
+        try:
+            phase, boundary_ms, value = planner.decode_position(
+                _decode_cursor(cursor, account.id, _plan_cursor_q(query))
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail="Invalid cursor") from e
+        return planner.plan_for_boundary(query, boundary_ms, reason="cursor"), phase, value
+    plan = await planner.plan_query(account.id, query)
+    phase, value = ("u", "") if plan.mode == "upstream" else ("l", "0")
+    return plan, phase, value
+
+
+def _plan_cache_key(
+    account: GmailAccountToken,
+    query: planner.StructuredQuery,
+    plan: planner.Plan,
+    max_results: int,
+    cursor: Optional[str],
+    projection: Optional[Tuple[str, ...]],
+    settings: Settings,
+) -> Optional[str]:
+    # Only purely upstream answers are cached; local ones are cheaper than a cache lookup.
+    if not settings.query_cache_enabled or plan.mode != "upstream":
+        return None
+    return query_cache.make_key(account.id, _plan_cursor_q(query), max_results, cursor, projection)
+
+
+async def _fetch_planned(
+    account: GmailAccountToken,
+    query: planner.StructuredQuery,
+    max_results: int,
+    cursor: Optional[str],
+    projection: Optional[Tuple[str, ...]],
+    settings: Settings,
+    *,
+    started: Optional[Tuple[planner.Plan, Optional[str], str]] = None,
+) -> dict:
+    # source=auto: the planner picks local, upstream or local-then-upstream (split) and the
+    # response says which in "explain". Results stay newest first across the two parts.
+    # started: _start_plan's result, when the caller has planned already.
+    q = query.gmail_query
+    cursor_q = _plan_cursor_q(query)
+    plan, phase, value = started or await _start_plan(account, query, cursor)
+
+    cache_key = _plan_cache_key(account, query, plan, max_results, cursor, projection, settings)
+    if cache_key is not None:
+        cached = await query_cache.cache.get(account.id, cache_key)
+        if cached is not None:
+            logger.info("gmail_fetch query_cache_hit account_id=%s q=%s", account.id, q)
+            return cached
+
+    summaries: List[gmail_client.MessageSummary] = []
+    errors = []
+    next_position = None
+    # None: that part was not consulted for this page.
+    local_results = upstream_results = None
+
+    if phase == "l":
+        offset = int(value)
+        rows = await planner.search_local(account.id, query, plan, offset=offset, limit=max_results + 1)
+        summaries = [message_cache.row_to_summary(r) for r in rows[:max_results]]
+        local_results = len(summaries)
+        if len(rows) > max_results:
+            next_position = planner.encode_position("l", plan.boundary_ms, offset + max_results)
+        elif plan.mode == "split":
+            # Local part exhausted: fill the rest of the page from Gmail.
+            phase, value = "u", ""
+            if len(summaries) == max_results:
+                next_position = planner.encode_position("u", plan.boundary_ms, "")
+                phase = None
+
+    if phase == "u":
+        access_token = await _get_valid_access_token(account)
+        message_ids, next_token = await _list_ids(
+            access_token, planner.upstream_query(query, plan), max_results - len(summaries), value or None
+        )
+        try:
+            fetched, failures = await message_cache.load_summaries(
+                account, access_token, message_ids, fields=projection
+            )
+        except Exception as e:
+            logger.exception("gmail_fetch failed")
+            raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+        for message_id, exc in failures.items():
+            logger.warning("gmail_fetch message_failed id=%s error=%r", message_id, exc)
+            errors.append(_message_error(message_id, exc))
+        summaries.extend(fetched)
+        upstream_results = len(fetched)
+        if next_token:
+            next_position = planner.encode_position("u", plan.boundary_ms, next_token)
+
+    logger.info(
+        "gmail_fetch_planned account_id=%s plan=%s reason=%s q=%s local=%s upstream=%s",
+        account.id,
+        plan.mode,
+        plan.reason,
+        q,
+        local_results,
+        upstream_results,
+    )
+    payload = {
+        "query": q,
+        "source": _PLAN_SOURCES[plan.mode],
+        "messages": [gmail_client.summary_to_dict(s, projection) for s in summaries],
+        "errors": errors,
+        "next_cursor": _encode_cursor(account.id, cursor_q, next_position) if next_position else None,
+        "explain": planner.explain(
+            query, plan, local_results=local_results, upstream_results=upstream_results
+        ),
+    }
+    if cache_key is not None and not errors:
+        await query_cache.cache.set(account.id, cache_key, payload)
+    return payload
+
+
 @router.get("/messages")
 async def fetch_messages(
     from_email: Optional[str] = Query(default=None, alias="from"),
@@ -83,20 +343,22 @@ async def fetch_messages(
     max_results: int = Query(default=10, ge=1, le=50),
     account_id: Optional[int] = Query(default=None),
     email: Optional[str] = Query(default=None),
-    session: Session = Depends(get_session),
+    source: str = Query(default="auto", pattern="^(auto|gmail|local)$"),
+    cursor: Optional[str] = Query(default=None),
+    fields: Optional[str] = Query(default=None, description=_FIELDS_DESCRIPTION),
+    settings: Settings = Depends(get_settings),
 ):
-    account = None
-    if account_id is not None:
-        account = crud.get_account_by_id(session, account_id)
-    elif email is not None:
-        account = crud.get_account_by_email(session, email)
-    else:
-        account = crud.get_latest_account(session)
+    projection = _parse_fields(fields)
+    account = await _resolve_account(account_id, email)
 
-    if not account:
-        raise HTTPException(status_code=404, detail="No connected Gmail account found")
-
-    access_token = await _get_valid_access_token(session, account)
+    if source == "auto":
+        query = planner.parse_query(
+            from_email=from_email,
+            after_date=date_after,
+            context=context,
+            context_field=context_field,
+        )
+        return _json_response(await _fetch_planned(account, query, max_results, cursor, projection, settings))
 
     q = gmail_client.build_gmail_query(
         from_email=from_email,
@@ -105,6 +367,50 @@ async def fetch_messages(
         context_field=context_field,
     )
 
+    if source == "local":
+        # Local pages are offsets into the ranked results; one extra row says whether
+        # another page follows.
+        cursor_q = f"local:{q}"
+        offset = _decode_cursor(cursor, account.id, cursor_q) if cursor else "0"
+        if not offset.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        offset = int(offset)
+        try:
+            rows = await run_db(
+                fts.search_messages,
+                account.id,
+                from_email=from_email,
+                after_date=date_after,
+                context=context,
+                context_field=context_field,
+                limit=max_results + 1,
+                offset=offset,
+            )
+        except fts.UnsupportedLocalQuery as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        next_cursor = None
+        if len(rows) > max_results:
+            rows = rows[:max_results]
+            next_cursor = _encode_cursor(account.id, cursor_q, str(offset + max_results))
+        logger.info(
+            "gmail_fetch_local account_id=%s q=%s offset=%s results=%s", account.id, q, offset, len(rows)
+        )
+        messages = [
+            gmail_client.summary_to_dict(message_cache.row_to_summary(r), projection) for r in rows
+        ]
+        return _json_response(
+            {"query": q, "source": "local", "messages": messages, "errors": [], "next_cursor": next_cursor}
+        )
+
+    cache_key = query_cache.make_key(account.id, q, max_results, cursor, projection)
+    if settings.query_cache_enabled:
+        cached = await query_cache.cache.get(account.id, cache_key)
+        if cached is not None:
+            logger.info("gmail_fetch query_cache_hit account_id=%s q=%s", account.id, q)
+            return _json_response(cached)
+
+    access_token = await _get_valid_access_token(account)
+
     logger.info(
         "gmail_fetch account_id=%s email=%s q=%s max_results=%s",
         account.id,
@@ -113,13 +419,701 @@ async def fetch_messages(
         max_results,
     )
 
+    message_ids, next_cursor = await _list_page(access_token, account, q, max_results, cursor)
     try:
-        msgs = await gmail_client.list_messages(access_token, q=q, max_results=max_results)
-        summaries = []
-        for m in msgs:
-            full = await gmail_client.get_message_metadata(access_token, m["id"])
-            summaries.append(gmail_client.to_summary(full).__dict__)
-        return {"query": q, "messages": summaries}
+        summaries, failures = await message_cache.load_summaries(
+            account, access_token, message_ids, fields=projection
+        )
     except Exception as e:
         logger.exception("gmail_fetch failed")
         raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+
+    errors = []
+    for message_id, exc in failures.items():
+        logger.warning("gmail_fetch message_failed id=%s error=%r", message_id, exc)
+        errors.append(_message_error(message_id, exc))
+
+    payload = {
+        "query": q,
+        "messages": [gmail_client.summary_to_dict(s, projection) for s in summaries],
+        "errors": errors,
+        "next_cursor": next_cursor,
+    }
+    # Partial results (per-message failures) are not worth replaying.
+    if settings.query_cache_enabled and not errors:
+        await query_cache.cache.set(account.id, cache_key, payload)
+    return _json_response(payload)
+
+
+@router.get("/threads")
+async def fetch_threads(
+    from_email: Optional[str] = Query(default=None, alias="from"),
+    date_after: Optional[date] = Query(default=None, alias="date"),
+    context: Optional[str] = Query(default=None),
+    context_field: str = Query(default="subject", pattern="^(subject|any)$"),
+    max_results: int = Query(default=10, ge=1, le=50),
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    cursor: Optional[str] = Query(default=None),
+    fields: Optional[str] = Query(default=None, description=_FIELDS_DESCRIPTION),
+    settings: Settings = Depends(get_settings),
+):
+    # One threads.list plus one threads.get per thread (batched), instead of a
+    # messages.get per message; each thread carries its message summaries, oldest first.
+    projection = _parse_fields(fields)
+    account = await _resolve_account(account_id, email)
+
+    q = gmail_client.build_gmail_query(
+        from_email=from_email,
+        after_date=date_after,
+        context=context,
+        context_field=context_field,
+    )
+
+    cache_key = query_cache.make_key(account.id, f"threads:{q}", max_results, cursor, projection)
+    if settings.query_cache_enabled:
+        cached = await query_cache.cache.get(account.id, cache_key)
+        if cached is not None:
+            logger.info("gmail_threads query_cache_hit account_id=%s q=%s", account.id, q)
+            return _json_response(cached)
+
+    access_token = await _get_valid_access_token(account)
+
+    logger.info(
+        "gmail_threads account_id=%s email=%s q=%s max_results=%s",
+        account.id,
+        account.email,
+        q,
+        max_results,
+    )
+
+    thread_ids, next_cursor = await _list_page(
+        access_token, account, q, max_results, cursor, kind="threads"
+    )
+    try:
+        threads, failures = await message_cache.load_threads(
+            account, access_token, thread_ids, fields=projection
+        )
+    except Exception as e:
+        logger.exception("gmail_threads failed")
+        raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+
+    errors = []
+    for thread_id, exc in failures.items():
+        logger.warning("gmail_threads thread_failed id=%s error=%r", thread_id, exc)
+        errors.append(_message_error(thread_id, exc))
+
+    payload = {
+        "query": q,
+        "threads": [gmail_client.thread_to_dict(t, projection) for t in threads],
+        "errors": errors,
+        "next_cursor": next_cursor,
+    }
+    if settings.query_cache_enabled and not errors:
+        await query_cache.cache.set(account.id, cache_key, payload)
+    return _json_response(payload)
+
+
+def _payload_lines(payload: dict) -> Iterator[bytes]:
+    # A response that is already complete (local, split or cached), in the stream format.
+    messages = payload["messages"]
+    for index, message in enumerate(messages):
+        yield _dumps({"type": "message", "index": index, "message": message}) + b"\n"
+    trailer = {"type": "end", "count": len(messages)}
+    trailer.update((k, v) for k, v in payload.items() if k != "messages")
+    yield _dumps(trailer) + b"\n"
+
+
+@router.get("/messages/stream")
+async def stream_messages(
+    from_email: Optional[str] = Query(default=None, alias="from"),
+    date_after: Optional[date] = Query(default=None, alias="date"),
+    context: Optional[str] = Query(default=None),
+    context_field: str = Query(default="subject", pattern="^(subject|any)$"),
+    max_results: int = Query(default=10, ge=1, le=50),
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    source: str = Query(default="auto", pattern="^(auto|gmail)$"),
+    cursor: Optional[str] = Query(default=None),
+    fields: Optional[str] = Query(default=None, description=_FIELDS_DESCRIPTION),
+    settings: Settings = Depends(get_settings),
+):
+    # NDJSON: one {"type": "message"} line per summary as soon as it is available,
+    # then a {"type": "end"} trailer with the query and per-message errors. source=auto
+    # plans like /messages; only a plan that has to ask Gmail is worth streaming, the
+    # others (and query cache hits) are written out at once.
+    projection = _parse_fields(fields)
+    account = await _resolve_account(account_id, email)
+
+    q = gmail_client.build_gmail_query(
+        from_email=from_email,
+        after_date=date_after,
+        context=context,
+        context_field=context_field,
+    )
+
+    plan = query = cache_key = None
+    if source == "auto":
+        query = planner.parse_query(
+            from_email=from_email,
+            after_date=date_after,
+            context=context,
+            context_field=context_field,
+        )
+        started = await _start_plan(account, query, cursor)
+        plan, phase, value = started
+        cache_key = _plan_cache_key(account, query, plan, max_results, cursor, projection, settings)
+        cached = await query_cache.cache.get(account.id, cache_key) if cache_key is not None else None
+        if cached is not None:
+            logger.info("gmail_stream query_cache_hit account_id=%s q=%s", account.id, q)
+            return StreamingResponse(_payload_lines(cached), media_type="application/x-ndjson")
+        if plan.mode != "upstream":
+            payload = await _fetch_planned(
+                account, query, max_results, cursor, projection, settings, started=started
+            )
+            return StreamingResponse(_payload_lines(payload), media_type="application/x-ndjson")
+
+    access_token = await _get_valid_access_token(account)
+    logger.info(
+        "gmail_stream account_id=%s email=%s q=%s max_results=%s source=%s",
+        account.id,
+        account.email,
+        q,
+        max_results,
+        source,
+    )
+
+    if plan is None:
+        message_ids, next_cursor = await _list_page(access_token, account, q, max_results, cursor)
+    else:
+        message_ids, next_token = await _list_ids(
+            access_token, planner.upstream_query(query, plan), max_results, value or None
+        )
+        next_position = planner.encode_position("u", plan.boundary_ms, next_token) if next_token else None
+        next_cursor = _encode_cursor(account.id, _plan_cursor_q(query), next_position) if next_position else None
+    positions = {mid: i for i, mid in enumerate(message_ids)}
+
+    async def _lines():
+        errors = []
+        streamed: Dict[str, dict] = {}
+        try:
+            async for message_id, result in message_cache.iter_summaries(
+                account, access_token, message_ids, fields=projection
+            ):
+                if isinstance(result, BaseException):
+                    logger.warning("gmail_stream message_failed id=%s error=%r", message_id, result)
+                    errors.append(_message_error(message_id, result))
+                    continue
+                streamed[message_id] = gmail_client.summary_to_dict(result, projection)
+                line = {
+                    "type": "message",
+                    "index": positions[message_id],
+                    "message": streamed[message_id],
+                }
+                yield _dumps(line) + b"\n"
+        except Exception as e:
+            logger.exception("gmail_stream failed")
+            errors.append({"id": None, "status": None, "error": e.__class__.__name__})
+        trailer = {
+            "type": "end",
+            "query": q,
+            "count": len(message_ids),
+            "errors": errors,
+            "next_cursor": next_cursor,
+        }
+        if plan is not None:
+            trailer["source"] = _PLAN_SOURCES[plan.mode]
+            trailer["explain"] = planner.explain(
+                query, plan, local_results=None, upstream_results=len(streamed)
+            )
+        yield _dumps(trailer) + b"\n"
+        # The same entry /messages would have cached for this page.
+        if cache_key is not None and not errors:
+            payload = {k: v for k, v in trailer.items() if k not in ("type", "count")}
+            payload["messages"] = [streamed[mid] for mid in message_ids if mid in streamed]
+            await query_cache.cache.set(account.id, cache_key, payload)
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+@router.post("/sync")
+async def sync_mailbox(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    full: bool = Query(default=False),
+):
+    account = await _resolve_account(account_id, email)
+    access_token = await _get_valid_access_token(account)
+
+    try:
+        result = await gmail_sync.sync_account(account, access_token, full=full)
+    except Exception as e:
+        logger.exception("gmail_sync failed account_id=%s", account.id)
+        raise HTTPException(status_code=502, detail="Gmail sync failed") from e
+    return result.__dict__
+
+
+def _watch_to_dict(watch) -> dict:
+    return {
+        "account_id": watch.account_id,
+        "topic_name": watch.topic_name,
+        "label_ids": watch.label_ids.split(",") if watch.label_ids else [],
+        "history_id": watch.history_id,
+        "expires_at": watch.expires_at,
+        "last_notification_at": watch.last_notification_at,
+        "notifications": watch.notifications,
+    }
+
+
+@router.post("/watch")
+async def start_watch(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+):
+    # Registers (or renews) push notifications for the account via users.watch.
+    account = await _resolve_account(account_id, email)
+    access_token = await _get_valid_access_token(account)
+    try:
+        watch = await gmail_watch.register(account, access_token)
+    except gmail_watch.WatchNotConfigured as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+    except httpx.HTTPStatusError as e:
+        logger.exception("gmail_watch register_failed account_id=%s", account.id)
+        raise _gmail_http_error(e) from e
+    return _watch_to_dict(watch)
+
+
+@router.delete("/watch")
+async def stop_watch(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+):
+    account = await _resolve_account(account_id, email)
+    access_token = await _get_valid_access_token(account)
+    try:
+        removed = await gmail_watch.unregister(account, access_token)
+    except httpx.HTTPStatusError as e:
+        logger.exception("gmail_watch stop_failed account_id=%s", account.id)
+        raise _gmail_http_error(e) from e
+    return {"account_id": account.id, "stopped": removed}
+
+
+@router.get("/watch")
+async def watch_status(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+):
+    account = await _resolve_account(account_id, email)
+    watch = await run_db(crud.get_watch, account.id)
+    if watch is None:
+        raise HTTPException(status_code=404, detail="No watch for this account")
+    return _watch_to_dict(watch)
+
+
+@router.post("/push", status_code=204)
+async def receive_push(
+    request: Request,
+    token: Optional[str] = Query(default=None),
+    settings: Settings = Depends(get_settings),
+):
+    # Pub/Sub push endpoint. Any 2xx acknowledges the message; errors make Pub/Sub
+    # redeliver, so only bad credentials and malformed envelopes are rejected. The sync
+    # runs in the background so the acknowledgement is immediate.
+    if not settings.gmail_push_token:
+        raise HTTPException(status_code=503, detail="Push notifications are not configured")
+    if not gmail_watch.verify_push_token(token):
+        raise HTTPException(status_code=403, detail="Invalid push token")
+    try:
+        notification = gmail_watch.parse_push(await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if settings.gmail_push_subscription and notification.subscription != settings.gmail_push_subscription:
+        raise HTTPException(status_code=403, detail="Unexpected subscription")
+
+    outcome = await gmail_watch.handle_push(notification)
+    logger.info(
+        "gmail_push email=%s history_id=%s message_id=%s outcome=%s",
+        notification.email,
+        notification.history_id,
+        notification.message_id,
+        outcome,
+    )
+    return Response(status_code=204)
+
+
+@router.post("/backfill")
+async def start_backfill(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    include_bodies: bool = Query(default=False),
+    max_messages: Optional[int] = Query(default=None, ge=0),
+    restart: bool = Query(default=False),
+):
+    # Starts (or resumes) the background import of the whole mailbox into the local mirror.
+    account = await _resolve_account(account_id, email)
+    access_token = await _get_valid_access_token(account)
+    try:
+        job = await gmail_backfill.start(
+            account,
+            access_token,
+            include_bodies=include_bodies,
+            max_messages=max_messages,
+            restart=restart,
+        )
+    except httpx.HTTPStatusError as e:
+        raise _gmail_http_error(e) from e
+    return gmail_backfill.job_to_dict(job)
+
+
+@router.post("/backfill/pause")
+async def pause_backfill(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+):
+    account = await _resolve_account(account_id, email)
+    job = await gmail_backfill.pause(account.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No backfill for this account")
+    return gmail_backfill.job_to_dict(job)
+
+
+@router.get("/backfill")
+async def backfill_status(
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+):
+    account = await _resolve_account(account_id, email)
+    job = await gmail_backfill.status(account.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No backfill for this account")
+    return gmail_backfill.job_to_dict(job)
+
+
+async def _search_account(
+    account: GmailAccountToken, q: str, max_results: int
+) -> Tuple[List[gmail_client.MessageSummary], Dict[str, BaseException]]:
+    # Runs in its own task, so the quota binding only applies to this account's calls.
+    quota.bind_account(account.id)
+    access_token = await tokens.get_valid_access_token(account)
+    msgs = await gmail_client.list_messages(access_token, q=q, max_results=max_results)
+    summaries, failures = await message_cache.load_summaries(
+        account, access_token, [m["id"] for m in msgs]
+    )
+    summaries.sort(key=lambda s: s.internal_date or 0, reverse=True)
+    return summaries, failures
+
+
+@router.get("/search")
+async def search_accounts(
+    from_email: Optional[str] = Query(default=None, alias="from"),
+    date_after: Optional[date] = Query(default=None, alias="date"),
+    context: Optional[str] = Query(default=None),
+    context_field: str = Query(default="subject", pattern="^(subject|any)$"),
+    max_results: int = Query(default=10, ge=1, le=50),
+    account_id: List[int] = Query(default=[]),
+    settings: Settings = Depends(get_settings),
+):
+    # Same query across several mailboxes (all by default), newest first overall.
+    accounts = await run_db(crud.list_accounts, account_id or None)
+    if not accounts:
+        raise HTTPException(status_code=404, detail="No connected Gmail account found")
+
+    q = gmail_client.build_gmail_query(
+        from_email=from_email,
+        after_date=date_after,
+        context=context,
+        context_field=context_field,
+    )
+    logger.info(
+        "gmail_search accounts=%s q=%s max_results=%s", [a.id for a in accounts], q, max_results
+    )
+
+    semaphore = asyncio.Semaphore(max(1, settings.multi_account_concurrency))
+
+    async def _bounded(account: GmailAccountToken):
+        async with semaphore:
+            return await asyncio.wait_for(
+                _search_account(account, q, max_results),
+                timeout=settings.multi_account_timeout_seconds,
+            )
+
+    results = await asyncio.gather(*(_bounded(a) for a in accounts), return_exceptions=True)
+
+    streams = []
+    account_status = []
+    for account, result in zip(accounts, results):
+        status = {"id": account.id, "email": account.email}
+        if isinstance(result, asyncio.TimeoutError):
+            logger.warning("gmail_search account_timeout account_id=%s", account.id)
+            account_status.append({**status, "status": "timeout", "count": 0, "errors": []})
+            continue
+        if isinstance(result, BaseException):
+            logger.warning("gmail_search account_failed account_id=%s error=%r", account.id, result)
+            account_status.append(
+                {**status, "status": "error", "count": 0, "errors": [result.__class__.__name__]}
+            )
+            continue
+
+        summaries, failures = result
+        errors = [_message_error(mid, exc) for mid, exc in failures.items()]
+        account_status.append({**status, "status": "ok", "count": len(summaries), "errors": errors})
+        # A list, not a generator: heapq.merge consumes the streams after this loop ends.
+        streams.append(
+            [
+                {**gmail_client.summary_to_dict(s), "account_id": account.id, "account_email": account.email}
+                for s in summaries
+            ]
+        )
+
+    # k-way merge of the per-account lists (each already newest-first); stops after max_results.
+    merged = heapq.merge(*streams, key=lambda m: m["internal_date"] or 0, reverse=True)
+    return _json_response(
+        {
+            "query": q,
+            "messages": list(itertools.islice(merged, max_results)),
+            "accounts": account_status,
+        }
+    )
+
+
+@router.get("/semantic")
+async def semantic_search(
+    q: List[str] = Query(..., description="Query text; repeat for reformulations, scored in one pass"),
+    k: int = Query(default=10, ge=1, le=100),
+    min_score: float = Query(default=0.0, ge=0.0, lt=1.0),
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    fields: Optional[str] = Query(default=None, description=_FIELDS_DESCRIPTION),
+    settings: Settings = Depends(get_settings),
+):
+    # Nearest cached messages by embedding similarity; never calls Gmail. Each hit reports
+    # its cosine score and which of the queries it matched best.
+    if not settings.semantic_search_enabled:
+        raise HTTPException(status_code=503, detail="Semantic search is disabled")
+    queries = [text.strip() for text in q if text.strip()]
+    if not queries or len(queries) > 20:
+        raise HTTPException(status_code=400, detail="Pass between 1 and 20 non-empty q values")
+    projection = _parse_fields(fields)
+    account = await _resolve_account(account_id, email)
+
+    hits, index = await run_db(semantic.search, account.id, queries, k=k, min_score=min_score)
+    logger.info(
+        "gmail_semantic account_id=%s queries=%s rows=%s hits=%s", account.id, len(queries), index["rows"], len(hits)
+    )
+    messages = [
+        {
+            **gmail_client.summary_to_dict(message_cache.row_to_summary(hit.message), projection),
+            "score": round(hit.score, 4),
+            "query": hit.query,
+        }
+        for hit in hits
+    ]
+    return _json_response({"queries": queries, "messages": messages, "index": index})
+
+
+@router.get("/messages/{message_id}")
+async def get_message_content(
+    message_id: str,
+    format: str = Query(default="full", pattern="^(full|raw)$"),
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    settings: Settings = Depends(get_settings),
+):
+    # Headers, text/html bodies and the attachment list of one message. Large bodies are
+    # refused (413) rather than buffered; text is capped at message_text_max_bytes.
+    account = await _resolve_account(account_id, email)
+    access_token = await _get_valid_access_token(account)
+    logger.info("gmail_message account_id=%s id=%s format=%s", account.id, message_id, format)
+
+    try:
+        if format == "full":
+            message = await gmail_client.get_message(
+                access_token, message_id, format="full", max_bytes=settings.message_max_bytes
+            )
+            result = gmail_content.content_from_full(
+                message, max_text_bytes=settings.message_text_max_bytes
+            )
+        else:
+            chunks = await gmail_client.stream_raw_message(
+                access_token,
+                message_id,
+                max_bytes=settings.message_max_bytes,
+                chunk_size=settings.gmail_stream_chunk_bytes,
+            )
+            parser = gmail_content.RawMessageParser()
+            async for chunk in chunks:
+                parser.feed(chunk)
+            result = parser.close(message_id, max_text_bytes=settings.message_text_max_bytes)
+    except gmail_content.ContentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    except httpx.HTTPStatusError as e:
+        raise _gmail_http_error(e, not_found="Message not found") from e
+    except Exception as e:
+        logger.exception("gmail_message failed id=%s", message_id)
+        raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+
+    if settings.attachment_store_enabled:
+        # Lets downloads by attachment id find (and link) the right part in the store.
+        refs = {a.attachment_id: a.part_id for a in result.attachments if a.attachment_id and a.part_id}
+        if refs:
+            await run_db(crud.save_attachment_refs, account.id, message_id, refs)
+
+    # Feeds local full-text search when the message is in the local mirror.
+    if result.text:
+        await run_db(fts.index_message_body, account.id, message_id, result.text)
+    return _json_response(dataclasses.asdict(result))
+
+
+async def _open_stream(opener, what: str):
+    # Starts the upstream download before the response is committed, so 404/429/limits
+    # still map to a status code. A limit hit mid-stream aborts the response.
+    try:
+        chunks = await opener()
+        first = await anext(chunks, b"")
+    except gmail_content.ContentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    except httpx.HTTPStatusError as e:
+        raise _gmail_http_error(e, not_found=f"{what} not found") from e
+    except Exception as e:
+        logger.exception("gmail_download failed what=%s", what)
+        raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+
+    async def _body():
+        if first:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return _body()
+
+
+@router.get("/messages/{message_id}/raw")
+async def download_raw_message(
+    message_id: str,
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    settings: Settings = Depends(get_settings),
+):
+    account = await _resolve_account(account_id, email)
+    access_token = await _get_valid_access_token(account)
+    logger.info("gmail_raw account_id=%s id=%s", account.id, message_id)
+
+    body = await _open_stream(
+        lambda: gmail_client.stream_raw_message(
+            access_token,
+            message_id,
+            max_bytes=settings.message_max_bytes,
+            chunk_size=settings.gmail_stream_chunk_bytes,
+        ),
+        "Message",
+    )
+    return StreamingResponse(
+        body,
+        media_type="message/rfc822",
+        headers={"Content-Disposition": f'attachment; filename="{message_id}.eml"'},
+    )
+
+
+@router.get("/messages/{message_id}/attachments/{attachment_id}")
+async def download_attachment(
+    message_id: str,
+    attachment_id: str,
+    part_id: Optional[str] = Query(default=None),
+    filename: Optional[str] = Query(default=None),
+    mime_type: str = Query(default="application/octet-stream"),
+    account_id: Optional[int] = Query(default=None),
+    email: Optional[str] = Query(default=None),
+    settings: Settings = Depends(get_settings),
+):
+    # attachment_id, part_id, filename and mime_type come from the attachments list of
+    # GET /gmail/messages/{id}. part_id is the stable key for the local attachment store;
+    # attachment ids change between Gmail fetches. The store only trusts the part id that
+    # listing recorded for attachment_id; a different one is rejected.
+    account = await _resolve_account(account_id, email)
+    disposition = "attachment"
+    if filename:
+        disposition += f"; filename*=UTF-8''{quote(filename, safe='')}"
+
+    if settings.attachment_store_enabled:
+        return await _serve_from_store(
+            account, message_id, attachment_id, part_id, filename, mime_type, disposition, settings
+        )
+
+    access_token = await _get_valid_access_token(account)
+    logger.info("gmail_attachment account_id=%s id=%s", account.id, message_id)
+    body = await _open_stream(
+        lambda: gmail_client.stream_attachment(
+            access_token,
+            message_id,
+            attachment_id,
+            max_bytes=settings.attachment_max_bytes,
+            chunk_size=settings.gmail_stream_chunk_bytes,
+        ),
+        "Attachment",
+    )
+    return StreamingResponse(body, media_type=mime_type, headers={"Content-Disposition": disposition})
+
+
+async def _serve_from_store(
+    account: GmailAccountToken,
+    message_id: str,
+    attachment_id: str,
+    part_id: Optional[str],
+    filename: Optional[str],
+    mime_type: str,
+    disposition: str,
+    settings: Settings,
+) -> StreamingResponse:
+    known_part = await run_db(crud.get_attachment_ref, account.id, message_id, attachment_id)
+    if part_id is not None and known_part is not None and part_id != known_part:
+        raise HTTPException(status_code=400, detail="part_id does not match attachment_id")
+    # Unverified downloads are still stored (and deduplicated) but never linked to a part.
+    part_id = known_part
+
+    blob, handle = None, None
+    if part_id is not None:
+        blob = await run_db(crud.get_linked_attachment, account.id, message_id, part_id)
+        if blob is not None:
+            handle = attachment_store.open_blob(blob.sha256)
+
+    hit = handle is not None
+    if not hit:
+        access_token = await _get_valid_access_token(account)
+        try:
+            blob = await attachment_store.fetch_to_store(
+                access_token,
+                account.id,
+                message_id,
+                attachment_id,
+                part_id=part_id,
+                filename=filename,
+                mime_type=mime_type,
+            )
+        except gmail_content.ContentTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e)) from e
+        except httpx.HTTPStatusError as e:
+            raise _gmail_http_error(e, not_found="Attachment not found") from e
+        except Exception as e:
+            logger.exception("gmail_attachment store_failed id=%s", message_id)
+            raise HTTPException(status_code=502, detail="Gmail fetch failed") from e
+        handle = attachment_store.open_blob(blob.sha256)
+        if handle is None:
+            raise HTTPException(status_code=503, detail="Attachment evicted; retry")
+
+    logger.info(
+        "gmail_attachment account_id=%s id=%s part_id=%s store_hit=%s",
+        account.id,
+        message_id,
+        part_id,
+        hit,
+    )
+    return StreamingResponse(
+        attachment_store.iter_blob(handle, settings.gmail_stream_chunk_bytes),
+        media_type=mime_type,
+        headers={
+            "Content-Disposition": disposition,
+            "Content-Length": str(blob.size),
+            "ETag": f'"{blob.sha256}"',
+            "X-Attachment-Store": "hit" if hit else "miss",
+        },
+    )
@@ -18,8 +18,18 @@ class Settings(BaseSettings):
     app_env: str = "dev"
     app_name: str = "gmail_agents"
     log_level: str = "INFO"
+    # "text" or "json" (one object per line, for log shippers).
+    log_format: str = "text"
+    # Prometheus exposition at /metrics (plus per-route timing middleware).
+    metrics_enabled: bool = True
 
     database_url: str = "sqlite:///./app.db"
+    # Connection pool; async routes run DB work on an executor sized to match.
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_timeout_seconds: float = 30.0
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 16384
 
     # OAuth / Google
     google_client_id: str = ""
@@ -30,6 +40,109 @@ class Settings(BaseSettings):
     google_auth_url: str = "https://accounts.google.com/o/oauth2/v2/auth"
     google_token_url: str = "https://oauth2.googleapis.com/token"
 
+    # Outbound HTTP (shared client for Google API + OAuth traffic)
+    http_timeout_seconds: float = 20.0
+    http_connect_timeout_seconds: float = 5.0
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_seconds: float = 30.0
+    # Requires the optional `h2` package (pip install "httpx[http2]").
+    http_http2: bool = False
+
+    # Gmail API (overridable to point at a local stand-in, e.g. the benchmark server)
+    gmail_api_base: str = "https://gmail.googleapis.com/gmail/v1"
+    gmail_batch_url: str = "https://gmail.googleapis.com/batch/gmail/v1"
+    gmail_metadata_concurrency: int = 10
+    # Sub-requests per multipart batch call (Gmail caps this at 100).
+    gmail_batch_size: int = 50
+    gmail_batch_max_retries: int = 2
+    # Per-account quota scheduler (Gmail allows 250 quota units per user per second)
+    gmail_quota_units_per_second: float = 250
+    gmail_quota_burst_units: float = 250
+    gmail_max_retries: int = 4
+    gmail_backoff_base_seconds: float = 0.5
+    gmail_backoff_max_seconds: float = 32.0
+
+    # Message bodies and attachments (GET /gmail/messages/{id}[/raw|/attachments/...]).
+    message_max_bytes: int = 25 * 1024 * 1024
+    message_text_max_bytes: int = 1024 * 1024
+    attachment_max_bytes: int = 25 * 1024 * 1024
+    gmail_stream_chunk_bytes: int = 64 * 1024
+
+    # Content-addressed attachment store (dedupes identical attachments across messages).
+    attachment_store_enabled: bool = True
+    attachment_store_dir: str = "./attachments"
+    attachment_store_max_bytes: int = 2 * 1024 * 1024 * 1024
+    attachment_store_unreferenced_grace_seconds: int = 3600
+
+    # Multi-account search (/gmail/search)
+    multi_account_concurrency: int = 8
+    multi_account_timeout_seconds: float = 10.0
+
+    # Local message metadata cache (0 disables the corresponding limit)
+    message_cache_enabled: bool = True
+    message_cache_max_rows_per_account: int = 50000
+    message_cache_max_age_days: int = 90
+
+    # Query result cache for /gmail/messages ("memory" per process, or "db" to share
+    # entries between uvicorn workers through the database)
+    query_cache_enabled: bool = True
+    query_cache_backend: str = "memory"
+    query_cache_ttl_seconds: float = 30.0
+    query_cache_max_entries: int = 1000
+
+    # Incremental sync: cap on messages pulled by a full resync.
+    sync_full_max_messages: int = 2000
+
+    # Semantic search (/gmail/semantic) over cached messages: embedder ("hashing", the
+    # built-in offline one, or "package.module:factory"), its dimension, where the
+    # per-account vector matrices live, and rows scored per NumPy batch.
+    semantic_search_enabled: bool = True
+    semantic_embedder: str = "hashing"
+    semantic_dim: int = 256
+    semantic_index_dir: str = "./semantic_index"
+    semantic_batch_rows: int = 65536
+
+    # Query planner (/gmail/messages?source=auto): the local mirror answers the range it
+    # covers only while its last sync is this recent, or, up to the push limit, while an
+    # unfiltered push watch (GMAIL_WATCH_LABEL_IDS empty) keeps it current.
+    query_planner_max_staleness_seconds: float = 300.0
+    query_planner_push_max_staleness_seconds: float = 3600.0
+
+    # Bulk backfill (POST /gmail/backfill): metadata batches (and body fetches) in flight
+    # per job, list page size, and whether interrupted jobs resume at startup.
+    backfill_workers: int = 8
+    backfill_page_size: int = 500
+    backfill_resume_on_startup: bool = True
+    # A running job whose checkpoint is older than this may be taken over by another process.
+    backfill_stale_seconds: int = 300
+
+    # Push notifications (users.watch -> Cloud Pub/Sub -> POST /gmail/push?token=...).
+    # The topic is "projects/<project>/topics/<topic>"; the push subscription's endpoint
+    # URL must carry gmail_push_token. If gmail_push_subscription is set, pushes from any
+    # other subscription are rejected.
+    gmail_pubsub_topic: str = ""
+    gmail_push_token: str = ""
+    gmail_push_subscription: str = ""
+    gmail_watch_label_ids: str = "INBOX"
+    # Watches expiring within renew_before are renewed by a background task.
+    gmail_watch_renew_enabled: bool = True
+    gmail_watch_renew_before_seconds: int = 86400
+    gmail_watch_renew_interval_seconds: int = 3600
+
+    # Token refresh: request-path skew, plus a background refresher that renews
+    # tokens expiring within the lead window so requests rarely wait on Google.
+    token_refresh_skew_seconds: int = 60
+    token_background_refresh_enabled: bool = True
+    token_refresh_lead_seconds: int = 300
+    token_refresh_interval_seconds: int = 60
+    # Across workers, one process refreshes an account at a time under a database lease;
+    # the others poll the account row until the new token lands.
+    token_refresh_lease_seconds: float = 30.0
+    token_refresh_lease_poll_seconds: float = 0.2
+    # Account rows (and their tokens) are reused for this long before rereading SQLite.
+    token_cache_ttl_seconds: float = 15.0
+
     # Security
     oauth_state_secret: str = "change-me"
 
@@ -1,15 +1,28 @@
 from __future__ import annotations
 
 import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 import uuid
+from datetime import datetime, timezone
+from typing import Optional
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 request_id_ctx: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
 
+# Records are handed to a listener thread; only it touches stdout, so a slow pipe or
+# terminal never stalls the event loop.
+_listener: Optional[logging.handlers.QueueListener] = None
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] [request_id=%(request_id)s] %(message)s"
+_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
 
 class RequestIdFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
@@ -17,31 +30,112 @@ class RequestIdFilter(logging.Filter):
         return True
 
 
-def configure_logging(level: str) -> None:
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() bakes the message into the text layout. Resolve only what may
+    # not survive the thread hop (args, traceback objects) and leave layout to the listener.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _build_formatter(fmt: str) -> logging.Formatter:
+    if fmt == "json":
+        return JsonFormatter()
+    return logging.Formatter(fmt=_TEXT_FORMAT, datefmt=_DATE_FORMAT)
+
+
+def configure_logging(level: str, *, fmt: str = "text") -> None:
+    global _listener
+    stop_logging()
+
     root = logging.getLogger()
     root.setLevel(level.upper())
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(level.upper())
-    handler.addFilter(RequestIdFilter())
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(_build_formatter(fmt))
 
-    formatter = logging.Formatter(
-        fmt="%(asctime)s %(levelname)s [%(name)s] [request_id=%(request_id)s] %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S%z",
-    )
-    handler.setFormatter(formatter)
+    # The filter runs on the producer side, where the request_id context is still set.
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+    queue_handler.setLevel(level.upper())
+    queue_handler.addFilter(RequestIdFilter())
 
     root.handlers.clear()
-    root.addHandler(handler)
+    root.addHandler(queue_handler)
+
+    # uvicorn installs its own stdout handlers; send its records (access log included)
+    # through the same queue.
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    # Drains the queue, then logs straight to the stream so late records are not lost.
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _QueueHandler):
+            root.removeHandler(handler)
+            for target in listener.handlers:
+                target.addFilter(RequestIdFilter())
+                root.addHandler(target)
+
+
+class RequestIdMiddleware:
+    # Pure ASGI: BaseHTTPMiddleware runs each request in an extra task and buffers
+    # streaming bodies through a memory stream.
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rid = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                rid = value.decode("latin-1")
+                break
+        rid = rid or uuid.uuid4().hex
 
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-Id"] = rid
+            await send(message)
 
-class RequestIdMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        rid = request.headers.get("X-Request-Id") or uuid.uuid4().hex
         token = request_id_ctx.set(rid)
         try:
-            response = await call_next(request)
-            response.headers["X-Request-Id"] = rid
-            return response
+            await self.app(scope, receive, send_wrapper)
         finally:
             request_id_ctx.reset(token)
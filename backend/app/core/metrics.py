@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import time
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Upstream calls sit behind network latency and quota waits, so buckets reach further out
+# than the route defaults.
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent serving HTTP requests, by route template.",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served.",
+)
+
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Time per upstream Google call (each retry attempt counts), by operation and status.",
+    ["service", "operation", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+UPSTREAM_REQUESTS_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight",
+    "Upstream Google calls currently awaiting a response.",
+    ["service"],
+)
+
+TOKEN_REFRESH_TOTAL = Counter(
+    "token_refresh_total",
+    "Access token refreshes by result (success, failure, coalesced, reused).",
+    ["result"],
+)
+TOKEN_REFRESH_DURATION = Histogram(
+    "token_refresh_duration_seconds",
+    "Time to refresh an access token, including the database write.",
+    buckets=_LATENCY_BUCKETS,
+)
+
+MESSAGE_CACHE_LOOKUPS = Counter(
+    "message_cache_lookups_total",
+    "Message metadata cache lookups by result (hit, miss).",
+    ["result"],
+)
+
+
+def observe_upstream(service: str, operation: str, status: str, started: float) -> None:
+    UPSTREAM_REQUEST_DURATION.labels(service, operation, status).observe(time.perf_counter() - started)
+
+
+class _StatsCollector(Collector):
+    # Reads stats the modules already keep, at scrape time, so the hot path pays nothing.
+    def describe(self) -> Iterator:
+        # Registering would otherwise call collect() while app.gmail is still importing.
+        return iter(())
+
+    def collect(self) -> Iterator:
+        # Imported here: app.gmail imports this module.
+        from app.gmail import query_cache, quota, tokens
+
+        stats = query_cache.cache.stats()
+        lookups = CounterMetricFamily(
+            "query_cache_lookups", "Query result cache lookups by result.", labels=["result"]
+        )
+        lookups.add_metric(["hit"], stats["hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        yield GaugeMetricFamily(
+            "query_cache_hit_ratio", "Query result cache hit ratio since start.", value=stats["hit_ratio"] or 0.0
+        )
+        yield CounterMetricFamily(
+            "query_cache_evictions", "Query result cache LRU evictions.", value=stats["evictions"]
+        )
+        yield CounterMetricFamily(
+            "query_cache_invalidations",
+            "Query result cache entries dropped on mailbox change.",
+            value=stats["invalidations"],
+        )
+        if stats["size"] is not None:
+            yield GaugeMetricFamily("query_cache_entries", "Query result cache entries.", value=stats["size"])
+
+        scheduler = quota.scheduler.stats()
+        queue_depth = GaugeMetricFamily(
+            "gmail_quota_queue_depth", "Gmail calls waiting for quota budget.", labels=["bucket"]
+        )
+        throttled = CounterMetricFamily(
+            "gmail_quota_throttled", "Gmail rate-limit responses that paused a quota bucket.", labels=["bucket"]
+        )
+        waited = CounterMetricFamily(
+            "gmail_quota_wait_seconds", "Time spent waiting for Gmail quota budget.", labels=["bucket"]
+        )
+        for key, bucket in scheduler["buckets"].items():
+            queue_depth.add_metric([key], bucket["queue_depth"])
+            throttled.add_metric([key], bucket["throttled"])
+            waited.add_metric([key], bucket["wait_seconds"])
+        yield queue_depth
+        yield throttled
+        yield waited
+
+        yield GaugeMetricFamily(
+            "token_refresh_in_flight", "Token refreshes currently running.", value=tokens.inflight_count()
+        )
+
+
+REGISTRY.register(_StatsCollector())
+
+
+class MetricsMiddleware:
+    # Pure ASGI (no BaseHTTPMiddleware) so streaming responses are not buffered and the
+    # timing covers the whole body.
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            # The router stores the matched route in the scope; label by its template so
+            # path parameters do not explode cardinality. Static files and 404s share "other".
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], getattr(route, "path", "other"), status
+            ).observe(time.perf_counter() - started)
+
+
+def metrics_endpoint(_: Request) -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,10 @@
+from __future__ import annotations
+
+import os
+import socket
+import uuid
+
+# Identifies this worker process in database rows it owns (backfill jobs, token refresh
+# leases): host:pid:nonce. The nonce tells a restarted process apart from its previous
+# incarnation when the pid is reused (e.g. pid 1 in a container).
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
@@ -1,11 +1,28 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
 
-from sqlmodel import Session, desc, select
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, delete, desc, func, or_, select, update
 
-from app.db.models import GmailAccountToken
+from app.db.models import (
+    AttachmentBlob,
+    GmailAccountToken,
+    GmailAttachmentRef,
+    GmailBackfillJob,
+    GmailMessageAttachment,
+    GmailMessageMetadata,
+    GmailQueryCacheEntry,
+    GmailSemanticVector,
+    GmailSyncCoverage,
+    GmailSyncState,
+    GmailTokenRefreshLease,
+    GmailWatch,
+)
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit.
+_IN_CHUNK_SIZE = 500
 
 
 def get_latest_account(session: Session) -> Optional[GmailAccountToken]:
@@ -13,6 +30,13 @@ def get_latest_account(session: Session) -> Optional[GmailAccountToken]:
     return session.exec(statement).first()
 
 
+def list_accounts(session: Session, account_ids: Optional[List[int]] = None) -> List[GmailAccountToken]:
+    statement = select(GmailAccountToken).order_by(desc(GmailAccountToken.updated_at))
+    if account_ids:
+        statement = statement.where(col(GmailAccountToken.id).in_(account_ids))
+    return list(session.exec(statement))
+
+
 def get_account_by_email(session: Session, email: str) -> Optional[GmailAccountToken]:
     statement = select(GmailAccountToken).where(GmailAccountToken.email == email)
     return session.exec(statement).first()
@@ -22,6 +46,15 @@ def get_account_by_id(session: Session, account_id: int) -> Optional[GmailAccoun
     return session.get(GmailAccountToken, account_id)
 
 
+def list_accounts_expiring_before(session: Session, cutoff: datetime) -> List[GmailAccountToken]:
+    statement = select(GmailAccountToken).where(
+        col(GmailAccountToken.refresh_token).is_not(None),
+        col(GmailAccountToken.expires_at).is_not(None),
+        GmailAccountToken.expires_at <= cutoff,
+    )
+    return list(session.exec(statement))
+
+
 def upsert_account_token(session: Session, token: GmailAccountToken) -> GmailAccountToken:
     now = datetime.utcnow()
     existing = None
@@ -72,3 +105,660 @@ def update_tokens(
     session.commit()
     session.refresh(account)
     return account
+
+
+def acquire_refresh_lease(session: Session, account_id: int, *, owner: str, ttl_seconds: float) -> bool:
+    # True if owner now holds the lease: it was free, expired, or already owner's.
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    if session.get(GmailTokenRefreshLease, account_id) is None:
+        session.add(GmailTokenRefreshLease(account_id=account_id, owner=owner, expires_at=expires_at))
+        try:
+            session.commit()
+            return True
+        except IntegrityError:
+            # Another process inserted it first.
+            session.rollback()
+    result = session.exec(
+        update(GmailTokenRefreshLease)
+        .where(
+            GmailTokenRefreshLease.account_id == account_id,
+            or_(GmailTokenRefreshLease.expires_at < now, GmailTokenRefreshLease.owner == owner),
+        )
+        .values(owner=owner, expires_at=expires_at)
+    )
+    session.commit()
+    return bool(result.rowcount)
+
+
+def release_refresh_lease(session: Session, account_id: int, *, owner: str) -> None:
+    session.exec(
+        delete(GmailTokenRefreshLease).where(
+            GmailTokenRefreshLease.account_id == account_id, GmailTokenRefreshLease.owner == owner
+        )
+    )
+    session.commit()
+
+
+def get_cached_messages(
+    session: Session, account_id: int, message_ids: List[str]
+) -> Dict[str, GmailMessageMetadata]:
+    found: Dict[str, GmailMessageMetadata] = {}
+    for i in range(0, len(message_ids), _IN_CHUNK_SIZE):
+        chunk = message_ids[i : i + _IN_CHUNK_SIZE]
+        statement = select(GmailMessageMetadata).where(
+            GmailMessageMetadata.account_id == account_id,
+            col(GmailMessageMetadata.message_id).in_(chunk),
+        )
+        for row in session.exec(statement):
+            found[row.message_id] = row
+    return found
+
+
+def get_cached_messages_by_row_ids(
+    session: Session, row_ids: List[int]
+) -> Dict[int, GmailMessageMetadata]:
+    found: Dict[int, GmailMessageMetadata] = {}
+    for i in range(0, len(row_ids), _IN_CHUNK_SIZE):
+        chunk = row_ids[i : i + _IN_CHUNK_SIZE]
+        statement = select(GmailMessageMetadata).where(col(GmailMessageMetadata.id).in_(chunk))
+        for row in session.exec(statement):
+            found[row.id] = row
+    return found
+
+
+def upsert_cached_messages(
+    session: Session, account_id: int, rows: Iterable[GmailMessageMetadata]
+) -> None:
+    rows = list(rows)
+    if not rows:
+        return
+
+    now = datetime.utcnow()
+    existing = get_cached_messages(session, account_id, [r.message_id for r in rows])
+    for row in rows:
+        current = existing.get(row.message_id)
+        if current:
+            current.thread_id = row.thread_id
+            current.snippet = row.snippet
+            current.from_email = row.from_email
+            current.subject = row.subject
+            current.date = row.date
+            current.internal_date = row.internal_date
+            current.label_ids = row.label_ids
+            current.cached_at = now
+            session.add(current)
+        else:
+            row.account_id = account_id
+            row.cached_at = now
+            session.add(row)
+            existing[row.message_id] = row
+    session.commit()
+
+
+def get_cached_message_ids(session: Session, account_id: int) -> Set[str]:
+    statement = select(GmailMessageMetadata.message_id).where(
+        GmailMessageMetadata.account_id == account_id
+    )
+    return set(session.exec(statement))
+
+
+def delete_cached_messages(session: Session, account_id: int, message_ids: Iterable[str]) -> int:
+    # Messages gone from the mailbox also release their attachment blobs.
+    message_ids = list(message_ids)
+    removed = 0
+    for i in range(0, len(message_ids), _IN_CHUNK_SIZE):
+        chunk = message_ids[i : i + _IN_CHUNK_SIZE]
+        _unlink_attachments(session, account_id, chunk)
+        result = session.exec(
+            delete(GmailMessageMetadata).where(
+                GmailMessageMetadata.account_id == account_id,
+                col(GmailMessageMetadata.message_id).in_(chunk),
+            )
+        )
+        removed += result.rowcount or 0
+    session.commit()
+    return removed
+
+
+def update_cached_labels(
+    session: Session, account_id: int, labels: Dict[str, List[str]], *, touch: bool = False
+) -> int:
+    # touch also renews cached_at, for rows just confirmed against Gmail.
+    rows = get_cached_messages(session, account_id, list(labels))
+    now = datetime.utcnow()
+    for message_id, row in rows.items():
+        row.label_ids = ",".join(labels[message_id])
+        if touch:
+            row.cached_at = now
+        session.add(row)
+    session.commit()
+    return len(rows)
+
+
+def evict_cached_messages(
+    session: Session,
+    account_id: int,
+    *,
+    max_rows: int,
+    max_age: Optional[timedelta] = None,
+) -> int:
+    # Goes through delete_cached_messages so evicted rows release their attachment blobs too.
+    expired: List[str] = []
+    if max_age:
+        cutoff = datetime.utcnow() - max_age
+        expired = list(
+            session.exec(
+                select(GmailMessageMetadata.message_id).where(
+                    GmailMessageMetadata.account_id == account_id,
+                    GmailMessageMetadata.cached_at < cutoff,
+                )
+            )
+        )
+
+    overflow_ids: List[str] = []
+    if max_rows > 0:
+        count = session.exec(
+            select(func.count()).select_from(GmailMessageMetadata).where(
+                GmailMessageMetadata.account_id == account_id
+            )
+        ).one()
+        overflow = count - len(expired) - max_rows
+        if overflow > 0:
+            oldest = (
+                select(GmailMessageMetadata.message_id)
+                .where(GmailMessageMetadata.account_id == account_id)
+                .order_by(GmailMessageMetadata.cached_at)
+            )
+            if max_age:
+                oldest = oldest.where(GmailMessageMetadata.cached_at >= cutoff)
+            overflow_ids = list(session.exec(oldest.limit(overflow)))
+
+    victims = expired + overflow_ids
+    if not victims:
+        return 0
+    return delete_cached_messages(session, account_id, victims)
+
+
+def get_sync_state(session: Session, account_id: int) -> Optional[GmailSyncState]:
+    statement = select(GmailSyncState).where(GmailSyncState.account_id == account_id)
+    return session.exec(statement).first()
+
+
+def save_sync_state(
+    session: Session,
+    account_id: int,
+    *,
+    history_id: Optional[str],
+    full: bool = False,
+) -> GmailSyncState:
+    now = datetime.utcnow()
+    state = get_sync_state(session, account_id) or GmailSyncState(account_id=account_id)
+    state.history_id = history_id
+    state.last_synced_at = now
+    if full:
+        state.last_full_sync_at = now
+    session.add(state)
+    session.commit()
+    session.refresh(state)
+    return state
+
+
+def get_sync_coverage(session: Session, account_id: int) -> Optional[GmailSyncCoverage]:
+    return session.get(GmailSyncCoverage, account_id)
+
+
+def save_sync_coverage(
+    session: Session, account_id: int, *, covered_since: int, source: str
+) -> GmailSyncCoverage:
+    coverage = session.get(GmailSyncCoverage, account_id) or GmailSyncCoverage(
+        account_id=account_id, covered_since=covered_since, source=source
+    )
+    coverage.covered_since = covered_since
+    coverage.source = source
+    coverage.recorded_at = datetime.utcnow()
+    session.add(coverage)
+    session.commit()
+    session.refresh(coverage)
+    return coverage
+
+
+def clear_sync_coverage(session: Session, account_id: int) -> bool:
+    result = session.exec(delete(GmailSyncCoverage).where(GmailSyncCoverage.account_id == account_id))
+    session.commit()
+    return bool(result.rowcount)
+
+
+def min_internal_date(session: Session, account_id: int, message_ids: List[str]) -> Optional[int]:
+    dates = [
+        row.internal_date
+        for row in get_cached_messages(session, account_id, message_ids).values()
+        if row.internal_date is not None
+    ]
+    return min(dates) if dates else None
+
+
+def get_query_cache_entry(session: Session, key: str) -> Optional[GmailQueryCacheEntry]:
+    entry = session.get(GmailQueryCacheEntry, key)
+    if entry is None or entry.expires_at <= datetime.utcnow():
+        return None
+    return entry
+
+
+def put_query_cache_entry(session: Session, entry: GmailQueryCacheEntry, *, max_entries: int) -> None:
+    session.merge(entry)
+    session.commit()
+
+    session.exec(delete(GmailQueryCacheEntry).where(GmailQueryCacheEntry.expires_at <= datetime.utcnow()))
+    count = session.exec(select(func.count()).select_from(GmailQueryCacheEntry)).one()
+    if max_entries > 0 and count > max_entries:
+        oldest = (
+            select(GmailQueryCacheEntry.key)
+            .order_by(GmailQueryCacheEntry.created_at)
+            .limit(count - max_entries)
+        )
+        session.exec(delete(GmailQueryCacheEntry).where(col(GmailQueryCacheEntry.key).in_(oldest)))
+    session.commit()
+
+
+def delete_query_cache_entries(
+    session: Session, account_id: int, *, keep_history_id: Optional[str] = None
+) -> int:
+    statement = delete(GmailQueryCacheEntry).where(GmailQueryCacheEntry.account_id == account_id)
+    if keep_history_id is not None:
+        statement = statement.where(
+            or_(
+                col(GmailQueryCacheEntry.history_id).is_(None),
+                GmailQueryCacheEntry.history_id != keep_history_id,
+            )
+        )
+    result = session.exec(statement)
+    session.commit()
+    return result.rowcount or 0
+
+
+def get_attachment_blob(session: Session, sha256: str) -> Optional[AttachmentBlob]:
+    return session.get(AttachmentBlob, sha256)
+
+
+def get_linked_attachment(
+    session: Session, account_id: int, message_id: str, part_id: str, *, touch: bool = True
+) -> Optional[AttachmentBlob]:
+    statement = (
+        select(AttachmentBlob)
+        .join(GmailMessageAttachment, col(GmailMessageAttachment.sha256) == col(AttachmentBlob.sha256))
+        .where(
+            GmailMessageAttachment.account_id == account_id,
+            GmailMessageAttachment.message_id == message_id,
+            GmailMessageAttachment.part_id == part_id,
+        )
+    )
+    blob = session.exec(statement).first()
+    if blob is not None and touch:
+        blob.last_accessed_at = datetime.utcnow()
+        session.add(blob)
+        session.commit()
+    return blob
+
+
+def put_attachment_blob(
+    session: Session,
+    *,
+    sha256: str,
+    size: int,
+    mime_type: Optional[str],
+    link: Optional[Dict[str, object]] = None,
+) -> AttachmentBlob:
+    # Upserts the blob row and, when link is given (account_id, message_id, part_id,
+    # filename), points that message part at it. A part's bytes never change, so an
+    # existing link is left alone.
+    now = datetime.utcnow()
+    blob = session.get(AttachmentBlob, sha256)
+    if blob is None:
+        blob = AttachmentBlob(sha256=sha256, size=size, mime_type=mime_type)
+    blob.last_accessed_at = now
+    session.add(blob)
+
+    if link is not None:
+        existing = session.exec(
+            select(GmailMessageAttachment).where(
+                GmailMessageAttachment.account_id == link["account_id"],
+                GmailMessageAttachment.message_id == link["message_id"],
+                GmailMessageAttachment.part_id == link["part_id"],
+            )
+        ).first()
+        if existing is None:
+            session.add(GmailMessageAttachment(sha256=sha256, mime_type=mime_type, **link))
+            blob.refcount += 1
+
+    session.commit()
+    session.refresh(blob)
+    return blob
+
+
+def save_attachment_refs(
+    session: Session, account_id: int, message_id: str, refs: Dict[str, str]
+) -> None:
+    # refs: attachment id -> part id, replacing what an earlier fetch recorded.
+    session.exec(
+        delete(GmailAttachmentRef).where(
+            GmailAttachmentRef.account_id == account_id,
+            GmailAttachmentRef.message_id == message_id,
+        )
+    )
+    for attachment_id, part_id in refs.items():
+        session.add(
+            GmailAttachmentRef(
+                account_id=account_id, message_id=message_id, attachment_id=attachment_id, part_id=part_id
+            )
+        )
+    session.commit()
+
+
+def get_attachment_ref(
+    session: Session, account_id: int, message_id: str, attachment_id: str
+) -> Optional[str]:
+    # The part id recorded for this attachment id, if the message was fetched with it.
+    statement = select(GmailAttachmentRef.part_id).where(
+        GmailAttachmentRef.account_id == account_id,
+        GmailAttachmentRef.message_id == message_id,
+        GmailAttachmentRef.attachment_id == attachment_id,
+    )
+    return session.exec(statement).first()
+
+
+def _unlink_attachments(session: Session, account_id: int, message_ids: List[str]) -> None:
+    links = session.exec(
+        select(GmailMessageAttachment).where(
+            GmailMessageAttachment.account_id == account_id,
+            col(GmailMessageAttachment.message_id).in_(message_ids),
+        )
+    ).all()
+    session.exec(
+        delete(GmailAttachmentRef).where(
+            GmailAttachmentRef.account_id == account_id,
+            col(GmailAttachmentRef.message_id).in_(message_ids),
+        )
+    )
+    released: Dict[str, int] = {}
+    for link in links:
+        released[link.sha256] = released.get(link.sha256, 0) + 1
+        session.delete(link)
+    for sha256, count in released.items():
+        blob = session.get(AttachmentBlob, sha256)
+        if blob is not None:
+            blob.refcount = max(0, blob.refcount - count)
+            session.add(blob)
+
+
+def attachment_store_size(session: Session) -> int:
+    return int(session.exec(select(func.coalesce(func.sum(AttachmentBlob.size), 0))).one())
+
+
+def count_attachment_blobs(session: Session) -> int:
+    return int(session.exec(select(func.count()).select_from(AttachmentBlob)).one())
+
+
+def select_attachment_blobs_to_evict(
+    session: Session,
+    *,
+    max_bytes: int,
+    unreferenced_before: datetime,
+    keep: Optional[str] = None,
+) -> List[AttachmentBlob]:
+    # Unreferenced blobs past the grace period go first; then, while the store is over
+    # max_bytes, least recently used blobs whether referenced or not. keep is never chosen.
+    victims = [
+        b
+        for b in session.exec(
+            select(AttachmentBlob).where(
+                AttachmentBlob.refcount <= 0, AttachmentBlob.last_accessed_at < unreferenced_before
+            )
+        )
+        if b.sha256 != keep
+    ]
+    total = attachment_store_size(session) - sum(b.size for b in victims)
+    if max_bytes > 0 and total > max_bytes:
+        chosen = {b.sha256 for b in victims}
+        for blob in session.exec(select(AttachmentBlob).order_by(AttachmentBlob.last_accessed_at)):
+            if total <= max_bytes:
+                break
+            if blob.sha256 in chosen or blob.sha256 == keep:
+                continue
+            victims.append(blob)
+            total -= blob.size
+    return victims
+
+
+def delete_attachment_blobs(session: Session, sha256s: List[str]) -> int:
+    # Links to an evicted blob go too; the part is downloaded again on next request.
+    removed = 0
+    for i in range(0, len(sha256s), _IN_CHUNK_SIZE):
+        chunk = sha256s[i : i + _IN_CHUNK_SIZE]
+        session.exec(delete(GmailMessageAttachment).where(col(GmailMessageAttachment.sha256).in_(chunk)))
+        result = session.exec(delete(AttachmentBlob).where(col(AttachmentBlob.sha256).in_(chunk)))
+        removed += result.rowcount or 0
+    session.commit()
+    return removed
+
+
+def get_backfill_job(session: Session, account_id: int) -> Optional[GmailBackfillJob]:
+    statement = select(GmailBackfillJob).where(GmailBackfillJob.account_id == account_id)
+    return session.exec(statement).first()
+
+
+def list_backfill_jobs(session: Session, *, status: str) -> List[GmailBackfillJob]:
+    return list(session.exec(select(GmailBackfillJob).where(GmailBackfillJob.status == status)))
+
+
+def save_backfill_job(session: Session, job: GmailBackfillJob) -> GmailBackfillJob:
+    job.updated_at = datetime.utcnow()
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def claim_backfill_job(
+    session: Session, job_id: int, *, owner: str, expected_owner: Optional[str]
+) -> bool:
+    # Compare-and-swap on owner: of several processes racing for a job, one wins.
+    now = datetime.utcnow()
+    current = (
+        GmailBackfillJob.owner.is_(None)
+        if expected_owner is None
+        else GmailBackfillJob.owner == expected_owner
+    )
+    result = session.exec(
+        update(GmailBackfillJob)
+        .where(GmailBackfillJob.id == job_id, current)
+        .values(
+            owner=owner,
+            status="running",
+            last_error=None,
+            resumed_at=now,
+            processed_at_resume=GmailBackfillJob.stored + GmailBackfillJob.skipped + GmailBackfillJob.failed,
+            updated_at=now,
+        )
+    )
+    session.commit()
+    return bool(result.rowcount)
+
+
+def checkpoint_backfill_job(
+    session: Session,
+    job_id: int,
+    *,
+    owner: str,
+    page_token: Optional[str],
+    listed: int = 0,
+    stored: int = 0,
+    skipped: int = 0,
+    failed: int = 0,
+    bodies: int = 0,
+    status: Optional[str] = None,
+    last_error: Optional[str] = None,
+) -> bool:
+    # Adds one page's counts and moves the checkpoint, only while this process still owns
+    # a running job. False means the job was paused or taken over: stop.
+    now = datetime.utcnow()
+    values = {
+        "page_token": page_token,
+        "listed": GmailBackfillJob.listed + listed,
+        "stored": GmailBackfillJob.stored + stored,
+        "skipped": GmailBackfillJob.skipped + skipped,
+        "failed": GmailBackfillJob.failed + failed,
+        "bodies": GmailBackfillJob.bodies + bodies,
+        "updated_at": now,
+    }
+    if status is not None:
+        values["status"] = status
+        values["last_error"] = last_error
+        if status in ("completed", "failed"):
+            values["finished_at"] = now
+    result = session.exec(
+        update(GmailBackfillJob)
+        .where(
+            GmailBackfillJob.id == job_id,
+            GmailBackfillJob.owner == owner,
+            GmailBackfillJob.status == "running",
+        )
+        .values(**values)
+    )
+    session.commit()
+    return bool(result.rowcount)
+
+
+def pause_backfill_job(session: Session, account_id: int) -> Optional[GmailBackfillJob]:
+    job = get_backfill_job(session, account_id)
+    if job is None or job.status != "running":
+        return job
+    job.status = "paused"
+    return save_backfill_job(session, job)
+
+
+def get_watch(session: Session, account_id: int) -> Optional[GmailWatch]:
+    return session.exec(select(GmailWatch).where(GmailWatch.account_id == account_id)).first()
+
+
+def save_watch(
+    session: Session,
+    account_id: int,
+    *,
+    topic_name: str,
+    label_ids: Optional[str],
+    history_id: Optional[str],
+    expires_at: datetime,
+) -> GmailWatch:
+    watch = get_watch(session, account_id) or GmailWatch(
+        account_id=account_id, topic_name=topic_name, expires_at=expires_at
+    )
+    watch.topic_name = topic_name
+    watch.label_ids = label_ids
+    watch.history_id = history_id
+    watch.expires_at = expires_at
+    watch.updated_at = datetime.utcnow()
+    session.add(watch)
+    session.commit()
+    session.refresh(watch)
+    return watch
+
+
+def delete_watch(session: Session, account_id: int) -> bool:
+    result = session.exec(delete(GmailWatch).where(GmailWatch.account_id == account_id))
+    session.commit()
+    return bool(result.rowcount)
+
+
+def list_watches_expiring_before(session: Session, cutoff: datetime) -> List[GmailWatch]:
+    return list(session.exec(select(GmailWatch).where(GmailWatch.expires_at <= cutoff)))
+
+
+def record_watch_notification(session: Session, account_id: int) -> None:
+    session.exec(
+        update(GmailWatch)
+        .where(GmailWatch.account_id == account_id)
+        .values(last_notification_at=datetime.utcnow(), notifications=GmailWatch.notifications + 1)
+    )
+    session.commit()
+
+
+def get_semantic_vectors(
+    session: Session, account_id: int, space: str, message_ids: List[str]
+) -> Dict[str, GmailSemanticVector]:
+    found: Dict[str, GmailSemanticVector] = {}
+    for i in range(0, len(message_ids), _IN_CHUNK_SIZE):
+        chunk = message_ids[i : i + _IN_CHUNK_SIZE]
+        statement = select(GmailSemanticVector).where(
+            GmailSemanticVector.account_id == account_id,
+            GmailSemanticVector.space == space,
+            col(GmailSemanticVector.message_id).in_(chunk),
+        )
+        for row in session.exec(statement):
+            found[row.message_id] = row
+    return found
+
+
+def allocate_semantic_rows(
+    session: Session, account_id: int, space: str, message_ids: List[str], *, attempts: int = 5
+) -> Dict[str, int]:
+    # Appends message_ids (new, or tombstoned and back again) as consecutive rows after the
+    # last one. Another process allocating at the same time makes the unique row constraint
+    # fail; the loser retries past the winner's rows.
+    for attempt in range(attempts):
+        existing = get_semantic_vectors(session, account_id, space, message_ids)
+        wanted = [mid for mid in message_ids if mid not in existing or existing[mid].deleted]
+        if not wanted:
+            return {}
+        last = session.exec(
+            select(func.max(GmailSemanticVector.row)).where(
+                GmailSemanticVector.account_id == account_id, GmailSemanticVector.space == space
+            )
+        ).one()
+        start = 0 if last is None else last + 1
+        rows = {mid: start + i for i, mid in enumerate(wanted)}
+        for mid, row in rows.items():
+            vector = existing.get(mid) or GmailSemanticVector(
+                account_id=account_id, space=space, message_id=mid, row=row
+            )
+            vector.row = row
+            vector.deleted = False
+            session.add(vector)
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            if attempt == attempts - 1:
+                raise
+            continue
+        return rows
+    return {}
+
+
+def list_semantic_rows_after(
+    session: Session, account_id: int, space: str, after_row: int
+) -> List[tuple]:
+    statement = (
+        select(GmailSemanticVector.row, GmailSemanticVector.message_id)
+        .where(
+            GmailSemanticVector.account_id == account_id,
+            GmailSemanticVector.space == space,
+            GmailSemanticVector.row > after_row,
+        )
+        .order_by(GmailSemanticVector.row)
+    )
+    return list(session.exec(statement))
+
+
+def tombstone_semantic_vectors(
+    session: Session, account_id: int, space: str, message_ids: List[str]
+) -> List[int]:
+    # Returns the rows to zero out in the matrix.
+    vectors = [v for v in get_semantic_vectors(session, account_id, space, message_ids).values() if not v.deleted]
+    for vector in vectors:
+        vector.deleted = True
+        session.add(vector)
+    if vectors:
+        session.commit()
+    return [v.row for v in vectors]
+
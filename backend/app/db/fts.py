@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from app.db import crud
+from app.db.models import GmailMessageMetadata
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "gmail_message_fts"
+
+# Gmail reads date-only after:/before: operators as midnight Pacific time, not UTC.
+GMAIL_SEARCH_TZ = ZoneInfo("America/Los_Angeles")
+
+# Standalone FTS5 table whose rowid mirrors gmail_message_metadata.id. Triggers keep the
+# header/snippet columns in step with the metadata table; `body` is filled separately.
+_CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+    subject, from_email, snippet, body,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON gmail_message_metadata BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, subject, from_email, snippet)
+        VALUES (new.id, new.subject, new.from_email, new.snippet);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF subject, from_email, snippet ON gmail_message_metadata BEGIN
+        UPDATE {FTS_TABLE}
+        SET subject = new.subject, from_email = new.from_email, snippet = new.snippet
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON gmail_message_metadata BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+# bm25 column weights: subject, from_email, snippet, body
+_BM25 = f"bm25({FTS_TABLE}, 10.0, 5.0, 2.0, 1.0)"
+
+
+class UnsupportedLocalQuery(ValueError):
+    pass
+
+
+def init_fts(engine: Engine) -> None:
+    if engine.dialect.name != "sqlite":
+        logger.info("fts skipped dialect=%s", engine.dialect.name)
+        return
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        if not exists:
+            conn.execute(text(_CREATE_TABLE))
+            # Index rows cached before the FTS table existed.
+            conn.execute(
+                text(
+                    f"INSERT INTO {FTS_TABLE}(rowid, subject, from_email, snippet) "
+                    "SELECT id, subject, from_email, snippet FROM gmail_message_metadata"
+                )
+            )
+            logger.info("fts created table=%s", FTS_TABLE)
+        for ddl in _TRIGGERS:
+            conn.execute(text(ddl))
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match_expression(
+    *,
+    from_email: Optional[str] = None,
+    context: Optional[str] = None,
+    context_field: str = "subject",
+) -> str:
+    parts: List[str] = []
+
+    if from_email:
+        parts.append(f"from_email : {_quote(from_email.strip())}")
+
+    if context:
+        ctx = context.strip()
+        if ":" in ctx:
+            raise UnsupportedLocalQuery("Advanced Gmail search syntax is not supported locally")
+        terms = " ".join(_quote(t) for t in ctx.split())
+        if terms:
+            parts.append(f"({terms})" if context_field == "any" else f"subject : ({terms})")
+
+    return " AND ".join(parts)
+
+
+def day_start_millis(day: date) -> int:
+    # Start of `day` the way Gmail search draws it, so local date filters match upstream ones.
+    return int(datetime(day.year, day.month, day.day, tzinfo=GMAIL_SEARCH_TZ).timestamp() * 1000)
+
+
+def search_messages(
+    session: Session,
+    account_id: int,
+    *,
+    from_email: Optional[str] = None,
+    after_date: Optional[date] = None,
+    context: Optional[str] = None,
+    context_field: str = "subject",
+    limit: int = 10,
+    offset: int = 0,
+    since_ms: Optional[int] = None,
+    until_ms: Optional[int] = None,
+    exclude_labels: Sequence[str] = (),
+    order: str = "relevance",
+) -> List[GmailMessageMetadata]:
+    # since_ms/until_ms bound internal_date to [since, until); order is "relevance" (bm25)
+    # or "date" (newest first, as Gmail lists).
+    match = build_match_expression(
+        from_email=from_email, context=context, context_field=context_field
+    )
+    params = {"account_id": account_id, "limit": limit, "offset": offset}
+
+    filters = ["m.account_id = :account_id"]
+    if after_date:
+        filters.append("m.internal_date >= :after")
+        params["after"] = day_start_millis(after_date)
+    if since_ms is not None:
+        filters.append("m.internal_date >= :since")
+        params["since"] = since_ms
+    if until_ms is not None:
+        filters.append("m.internal_date < :until")
+        params["until"] = until_ms
+    for i, label in enumerate(exclude_labels):
+        filters.append(f"(',' || COALESCE(m.label_ids, '') || ',') NOT LIKE :label{i}")
+        params[f"label{i}"] = f"%,{label},%"
+
+    if match:
+        params["match"] = match
+        ranking = f"{_BM25}, m.internal_date DESC" if order == "relevance" else "m.internal_date DESC"
+        # CROSS JOIN pins the FTS match as the outer loop; otherwise SQLite may walk the
+        # (account_id, internal_date) index for a date order and probe FTS once per row.
+        sql = (
+            f"SELECT m.id FROM {FTS_TABLE} CROSS JOIN gmail_message_metadata m ON m.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match AND {' AND '.join(filters)} "
+            f"ORDER BY {ranking} LIMIT :limit OFFSET :offset"
+        )
+    else:
+        sql = (
+            f"SELECT m.id FROM gmail_message_metadata m WHERE {' AND '.join(filters)} "
+            "ORDER BY m.internal_date DESC LIMIT :limit OFFSET :offset"
+        )
+
+    row_ids = [r[0] for r in session.connection().execute(text(sql), params)]
+    rows = crud.get_cached_messages_by_row_ids(session, row_ids)
+    return [rows[i] for i in row_ids if i in rows]
+
+
+def index_message_body(session: Session, account_id: int, message_id: str, body: str) -> bool:
+    return index_message_bodies(session, account_id, {message_id: body}) == 1
+
+
+def index_message_bodies(session: Session, account_id: int, bodies: Dict[str, str]) -> int:
+    # One transaction for the lot; messages missing from the local mirror are skipped.
+    rows = crud.get_cached_messages(session, account_id, list(bodies))
+    params = [{"body": bodies[mid], "rowid": row.id} for mid, row in rows.items()]
+    if params:
+        session.connection().execute(
+            text(f"UPDATE {FTS_TABLE} SET body = :body WHERE rowid = :rowid"), params
+        )
+        session.commit()
+    return len(params)
+
+
+def message_ids_without_body(session: Session, account_id: int, message_ids: List[str]) -> List[str]:
+    missing: List[str] = []
+    for i in range(0, len(message_ids), 500):
+        chunk = message_ids[i : i + 500]
+        placeholders = ", ".join(f":id{j}" for j in range(len(chunk)))
+        params = {f"id{j}": mid for j, mid in enumerate(chunk)}
+        params["account_id"] = account_id
+        sql = (
+            f"SELECT m.message_id FROM gmail_message_metadata m JOIN {FTS_TABLE} f ON f.rowid = m.id "
+            f"WHERE m.account_id = :account_id AND m.message_id IN ({placeholders}) AND f.body IS NULL"
+        )
+        missing.extend(r[0] for r in session.connection().execute(text(sql), params))
+    return missing
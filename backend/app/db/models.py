@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 
@@ -22,3 +23,212 @@ class GmailAccountToken(SQLModel, table=True):
 
     created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
     updated_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+
+class GmailTokenRefreshLease(SQLModel, table=True):
+    __tablename__ = "gmail_token_refresh_leases"
+
+    # Held by the one process refreshing an account's token; others wait and reread.
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", primary_key=True)
+    owner: str
+    expires_at: datetime
+
+
+class GmailMessageMetadata(SQLModel, table=True):
+    __tablename__ = "gmail_message_metadata"
+    __table_args__ = (
+        UniqueConstraint("account_id", "message_id", name="uq_gmail_message_metadata_account_message"),
+        Index("ix_gmail_message_metadata_account_internal_date", "account_id", "internal_date"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", index=True)
+    message_id: str
+
+    thread_id: Optional[str] = None
+    snippet: Optional[str] = None
+    from_email: Optional[str] = None
+    subject: Optional[str] = None
+    date: Optional[str] = None
+
+    # Gmail's internalDate (epoch millis) and a comma-separated labelIds list.
+    internal_date: Optional[int] = None
+    label_ids: Optional[str] = None
+
+    cached_at: datetime = Field(default_factory=lambda: datetime.utcnow(), index=True)
+
+
+class GmailSyncState(SQLModel, table=True):
+    __tablename__ = "gmail_sync_state"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", index=True, unique=True)
+
+    # Last Gmail historyId applied to the local mirror (gmail_message_metadata).
+    history_id: Optional[str] = None
+
+    last_synced_at: Optional[datetime] = None
+    last_full_sync_at: Optional[datetime] = None
+
+
+class GmailSyncCoverage(SQLModel, table=True):
+    __tablename__ = "gmail_sync_coverage"
+
+    # Every message with internalDate >= covered_since (epoch millis; 0 = the whole
+    # mailbox) is in the local mirror, kept current by incremental sync. Written when a
+    # full sync or backfill lists the mailbox without gaps, dropped once rows are evicted.
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", primary_key=True)
+    covered_since: int
+    # full_sync | backfill
+    source: str
+    recorded_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+
+class GmailQueryCacheEntry(SQLModel, table=True):
+    __tablename__ = "gmail_query_cache"
+
+    # Shared query-result cache used when QUERY_CACHE_BACKEND=db, so uvicorn workers share hits.
+    key: str = Field(primary_key=True)
+    account_id: int = Field(index=True)
+    history_id: Optional[str] = None
+    payload: str
+
+    expires_at: datetime = Field(index=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+
+class AttachmentBlob(SQLModel, table=True):
+    __tablename__ = "attachment_blobs"
+
+    # Content address: the file lives at ATTACHMENT_STORE_DIR/<sha256[:2]>/<sha256>.
+    sha256: str = Field(primary_key=True)
+    size: int
+    mime_type: Optional[str] = None
+
+    # Number of gmail_message_attachments rows pointing here (any account).
+    refcount: int = 0
+
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    last_accessed_at: datetime = Field(default_factory=lambda: datetime.utcnow(), index=True)
+
+
+class GmailMessageAttachment(SQLModel, table=True):
+    __tablename__ = "gmail_message_attachments"
+    __table_args__ = (
+        UniqueConstraint(
+            "account_id", "message_id", "part_id", name="uq_gmail_message_attachments_message_part"
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", index=True)
+    message_id: str
+    # Gmail attachment ids change between fetches; the MIME part id is the stable key.
+    part_id: str
+
+    sha256: str = Field(foreign_key="attachment_blobs.sha256", index=True)
+    filename: Optional[str] = None
+    mime_type: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+
+class GmailAttachmentRef(SQLModel, table=True):
+    # The attachment list GET /gmail/messages/{id} last returned: which part each Gmail
+    # attachment id belongs to. Downloads are only linked into the store through these,
+    # never through a part_id the client merely claims.
+    __tablename__ = "gmail_attachment_refs"
+    __table_args__ = (Index("ix_gmail_attachment_refs_message", "account_id", "message_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id")
+    message_id: str
+    attachment_id: str
+    part_id: str
+
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+
+class GmailBackfillJob(SQLModel, table=True):
+    __tablename__ = "gmail_backfill_jobs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", index=True, unique=True)
+
+    # running | paused | completed | failed
+    status: str = "running"
+    include_bodies: bool = False
+    # 0 = no cap (the metadata cache row limit still applies to later writes).
+    max_messages: int = 0
+
+    # Checkpoint: the list page to process next; pages before it are fully stored.
+    page_token: Optional[str] = None
+    # Mailbox historyId when the pass began; seeds incremental sync once it completes.
+    history_id: Optional[str] = None
+    estimated_total: Optional[int] = None
+
+    listed: int = 0
+    stored: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bodies: int = 0
+
+    # Process running the job; claims compare-and-swap on it so one worker runs it.
+    owner: Optional[str] = None
+    last_error: Optional[str] = None
+
+    # When the current run was claimed, and messages processed by then (for throughput).
+    resumed_at: Optional[datetime] = None
+    processed_at_resume: int = 0
+
+    started_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    updated_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    finished_at: Optional[datetime] = None
+
+
+class GmailWatch(SQLModel, table=True):
+    __tablename__ = "gmail_watches"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", index=True, unique=True)
+
+    topic_name: str
+    # Comma-separated labelIds the watch is filtered to (empty = all mail).
+    label_ids: Optional[str] = None
+
+    # historyId and expiration returned by users.watch; Gmail drops a watch after 7 days.
+    history_id: Optional[str] = None
+    expires_at: datetime = Field(index=True)
+
+    last_notification_at: Optional[datetime] = None
+    notifications: int = 0
+
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    updated_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+
+class GmailSemanticVector(SQLModel, table=True):
+    __tablename__ = "gmail_semantic_vectors"
+    __table_args__ = (
+        UniqueConstraint("account_id", "space", "message_id", name="uq_gmail_semantic_vectors_message"),
+        UniqueConstraint("account_id", "space", "row", name="uq_gmail_semantic_vectors_row"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    account_id: int = Field(foreign_key="gmail_account_tokens.id", index=True)
+    # Embedder name and dimension (e.g. "hashing-256"); each space has its own matrix file.
+    space: str
+    message_id: str
+    # Row of the message's vector in SEMANTIC_INDEX_DIR/<account_id>/<space>.f32.
+    row: int
+    # Tombstoned: the row is zeroed in the matrix and is reused by nothing.
+    deleted: bool = False
+
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
@@ -1,21 +1,96 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from sqlalchemy import event
 from sqlmodel import Session, SQLModel, create_engine
 
 from app.core.config import get_settings
+from app.db.fts import init_fts
+
+T = TypeVar("T")
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url == "sqlite://" or (url.startswith("sqlite") and ":memory:" in url)
+
+
+def _configure_sqlite(dbapi_connection, _connection_record) -> None:
+    settings = get_settings()
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer commits; NORMAL sync is durable enough under WAL.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kib)}")
+    cursor.close()
 
 
 def get_engine():
     settings = get_settings()
-    connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
-    return create_engine(settings.database_url, echo=False, connect_args=connect_args)
+    is_sqlite = settings.database_url.startswith("sqlite")
+    connect_args = {"check_same_thread": False} if is_sqlite else {}
+
+    pool_args = {}
+    if not _is_memory_sqlite(settings.database_url):
+        pool_args = {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout_seconds,
+        }
+
+    engine = create_engine(settings.database_url, echo=False, connect_args=connect_args, **pool_args)
+    if is_sqlite:
+        event.listen(engine, "connect", _configure_sqlite)
+    return engine
 
 
 engine = get_engine()
 
+# DB work from async code runs here so commits never block the event loop. Sized to the
+# connection pool so workers do not queue on pool checkout.
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        settings = get_settings()
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.db_pool_size + settings.db_max_overflow,
+            thread_name_prefix="db",
+        )
+    return _executor
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # Calls fn(session, *args, **kwargs) on the DB executor with a fresh session. Loaded
+    # attributes stay readable afterwards (expire_on_commit=False).
+    def _call() -> T:
+        with Session(engine, expire_on_commit=False) as session:
+            return fn(session, *args, **kwargs)
+
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, _call))
+
+
+def shutdown_db_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    init_fts(engine)
 
 
 def get_session():
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import AttachmentBlob
+from app.db.session import run_db
+from app.gmail import client as gmail_client
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed attachment blobs: one file per distinct SHA-256, shared by every
+# message (and account) carrying the same bytes. Rows in attachment_blobs hold the size,
+# refcount and last access; gmail_message_attachments links message parts to blobs.
+
+# Serializes "file appears/disappears" against "row appears/disappears" within this
+# process, so GC never deletes a file that a concurrent store just linked.
+_lock = asyncio.Lock()
+
+
+def _root() -> Path:
+    return Path(get_settings().attachment_store_dir).resolve()
+
+
+def blob_path(sha256: str) -> Path:
+    return _root() / sha256[:2] / sha256
+
+
+def open_blob(sha256: str) -> Optional[BinaryIO]:
+    # An open handle keeps the bytes readable even if GC unlinks the file meanwhile.
+    try:
+        return open(blob_path(sha256), "rb")
+    except FileNotFoundError:
+        return None
+
+
+async def fetch_to_store(
+    access_token: str,
+    account_id: int,
+    message_id: str,
+    attachment_id: str,
+    *,
+    part_id: Optional[str],
+    filename: Optional[str],
+    mime_type: Optional[str],
+) -> AttachmentBlob:
+    # Streams the attachment to a temp file while hashing it, then moves it into place
+    # unless a blob with the same digest already exists. Memory use is one chunk. part_id
+    # links the blob to that message part, so it must be the part Gmail listed for
+    # attachment_id (crud.get_attachment_ref), not one taken from the request.
+    settings = get_settings()
+    tmp_dir = _root() / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = tmp_dir / uuid.uuid4().hex
+
+    chunks = await gmail_client.stream_attachment(
+        access_token,
+        message_id,
+        attachment_id,
+        max_bytes=settings.attachment_max_bytes,
+        chunk_size=settings.gmail_stream_chunk_bytes,
+    )
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+
+        link = None
+        if part_id is not None:
+            link = {
+                "account_id": account_id,
+                "message_id": message_id,
+                "part_id": part_id,
+                "filename": filename,
+            }
+        async with _lock:
+            path = blob_path(sha256)
+            is_new = not path.is_file()
+            if is_new:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+            blob = await run_db(
+                crud.put_attachment_blob, sha256=sha256, size=size, mime_type=mime_type, link=link
+            )
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+
+    logger.info(
+        "attachment_store stored account_id=%s id=%s sha256=%s size=%s dedup=%s",
+        account_id,
+        message_id,
+        sha256[:12],
+        size,
+        not is_new,
+    )
+    if is_new:
+        await collect_garbage(keep=sha256)
+    return blob
+
+
+def iter_blob(f: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    # Reads through a read-only mmap: pages come straight from the OS page cache, and the
+    # (sync) iterator is run in a worker thread by StreamingResponse, so page faults never
+    # stall the event loop. Closes f when done.
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(0, size, chunk_size):
+                yield mm[offset : offset + chunk_size]
+
+
+async def collect_garbage(*, keep: Optional[str] = None) -> int:
+    settings = get_settings()
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.attachment_store_unreferenced_grace_seconds)
+    async with _lock:
+        victims = await run_db(
+            crud.select_attachment_blobs_to_evict,
+            max_bytes=settings.attachment_store_max_bytes,
+            unreferenced_before=cutoff,
+            keep=keep,
+        )
+        if not victims:
+            return 0
+        sha256s = [b.sha256 for b in victims]
+        await run_db(crud.delete_attachment_blobs, sha256s)
+        for sha256 in sha256s:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(blob_path(sha256))
+
+    logger.info(
+        "attachment_store gc blobs=%s bytes=%s", len(victims), sum(b.size for b in victims)
+    )
+    return len(victims)
+
+
+async def stats() -> dict:
+    def _stats(session) -> dict:
+        return {
+            "bytes": crud.attachment_store_size(session),
+            "blobs": crud.count_attachment_blobs(session),
+        }
+
+    return {**await run_db(_stats), "max_bytes": get_settings().attachment_store_max_bytes}
@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.process import PROCESS_ID
+from app.db import crud, fts
+from app.db.models import GmailAccountToken, GmailBackfillJob
+from app.db.session import run_db
+from app.gmail import cache as message_cache
+from app.gmail import client as gmail_client
+from app.gmail import content as gmail_content
+from app.gmail import quota, tokens
+
+logger = logging.getLogger(__name__)
+
+# Bulk import of a whole mailbox into the local mirror. A job walks messages.list page by
+# page; each page's missing metadata is fetched in batches by a bounded pool of workers and
+# written in one transaction, then the page token is checkpointed. An interrupted job
+# resumes from its last checkpoint, and messages already stored are skipped.
+
+# gmail_backfill_jobs.owner of jobs running in this process.
+OWNER = PROCESS_ID
+
+# account_id -> job task running in this process
+_tasks: Dict[int, asyncio.Task] = {}
+
+_resume_task: Optional[asyncio.Task] = None
+
+
+def _owner_gone(job: GmailBackfillJob) -> bool:
+    # True when the process that owned a running job is known to be gone, or has not
+    # checkpointed for backfill_stale_seconds.
+    if job.owner is None:
+        return True
+    if job.owner == OWNER:
+        return job.account_id not in _tasks
+    stale_before = datetime.utcnow() - timedelta(seconds=get_settings().backfill_stale_seconds)
+    if job.updated_at < stale_before:
+        return True
+    host, _, rest = job.owner.partition(":")
+    pid, _, _ = rest.partition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        # Same pid, different nonce: a previous incarnation (e.g. a restarted container).
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _target(job: GmailBackfillJob) -> Optional[int]:
+    if job.max_messages and job.estimated_total is not None:
+        return min(job.max_messages, job.estimated_total)
+    return job.max_messages or job.estimated_total
+
+
+def job_to_dict(job: GmailBackfillJob) -> Dict[str, Any]:
+    # Throughput covers the current run (since the job was last started or resumed), as of
+    # its latest checkpoint; the ETA extrapolates it to the estimated total.
+    processed = job.stored + job.skipped + job.failed
+    target = _target(job)
+    rate = None
+    if job.resumed_at is not None:
+        elapsed = (job.updated_at - job.resumed_at).total_seconds()
+        done_this_run = processed - job.processed_at_resume
+        if elapsed > 0 and done_this_run > 0:
+            rate = done_this_run / elapsed
+    eta = None
+    if job.status == "running" and rate and target is not None:
+        eta = max(0, target - processed) / rate
+    return {
+        "account_id": job.account_id,
+        "status": job.status,
+        "include_bodies": job.include_bodies,
+        "max_messages": job.max_messages,
+        "listed": job.listed,
+        "stored": job.stored,
+        "skipped": job.skipped,
+        "failed": job.failed,
+        "bodies": job.bodies,
+        "processed": processed,
+        "estimated_total": target,
+        "progress": round(min(1.0, processed / target), 4) if target else None,
+        "messages_per_second": round(rate, 2) if rate else None,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "running_here": job.account_id in _tasks,
+        "started_at": job.started_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+        "last_error": job.last_error,
+    }
+
+
+async def _fetch_metadata(access_token: str, message_ids: List[str]) -> Tuple[list, int]:
+    settings = get_settings()
+    summaries = []
+    failed = 0
+    async for chunk in gmail_client.iter_messages_metadata_batch(
+        access_token,
+        message_ids,
+        batch_size=settings.gmail_batch_size,
+        concurrency=settings.backfill_workers,
+        max_retries=settings.gmail_batch_max_retries,
+    ):
+        for message_id, result in chunk.items():
+            if isinstance(result, BaseException):
+                logger.warning("gmail_backfill message_failed id=%s error=%r", message_id, result)
+                failed += 1
+            else:
+                summaries.append(gmail_client.to_summary(result))
+    return summaries, failed
+
+
+async def _fetch_bodies(access_token: str, message_ids: List[str]) -> Dict[str, str]:
+    # Text bodies for full-text search. Messages without text (or over the size limit)
+    # get an empty body so later passes do not fetch them again.
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(max(1, settings.backfill_workers))
+    bodies: Dict[str, str] = {}
+
+    async def _fetch(message_id: str) -> None:
+        async with semaphore:
+            try:
+                message = await gmail_client.get_message(
+                    access_token, message_id, format="full", max_bytes=settings.message_max_bytes
+                )
+            except gmail_content.ContentTooLargeError:
+                bodies[message_id] = ""
+                return
+            except Exception as e:
+                logger.warning("gmail_backfill body_failed id=%s error=%r", message_id, e)
+                return
+        result = gmail_content.content_from_full(message, max_text_bytes=settings.message_text_max_bytes)
+        bodies[message_id] = result.text or ""
+
+    await asyncio.gather(*(_fetch(mid) for mid in message_ids))
+    return bodies
+
+
+async def _process_page(
+    account_id: int, access_token: str, message_ids: List[str], *, include_bodies: bool
+) -> Dict[str, int]:
+    cached = await run_db(crud.get_cached_messages, account_id, message_ids)
+    missing = [mid for mid in message_ids if mid not in cached]
+
+    summaries, failed = await _fetch_metadata(access_token, missing) if missing else ([], 0)
+    if summaries:
+        # Straight upsert: the cache row limits are not applied to a backfill.
+        await run_db(
+            crud.upsert_cached_messages,
+            account_id,
+            [message_cache.summary_to_row(s) for s in summaries],
+        )
+    await run_db(message_cache.index_semantic_with_cached, account_id, summaries, cached.values())
+
+    indexed = 0
+    if include_bodies:
+        need_body = await run_db(fts.message_ids_without_body, account_id, message_ids)
+        if need_body:
+            bodies = await _fetch_bodies(access_token, need_body)
+            if bodies:
+                indexed = await run_db(fts.index_message_bodies, account_id, bodies)
+
+    return {"stored": len(summaries), "skipped": len(cached), "failed": failed, "bodies": indexed}
+
+
+async def _access_token(account_id: int) -> str:
+    # Reloaded every page: the background refresher may have replaced the token.
+    account = await run_db(crud.get_account_by_id, account_id)
+    if account is None:
+        raise tokens.TokenRefreshError("Account no longer exists", reauth_required=True)
+    return await tokens.get_valid_access_token(account)
+
+
+async def _run(job: GmailBackfillJob) -> None:
+    settings = get_settings()
+    account_id = job.account_id
+    quota.bind_account(account_id)
+    checkpoint = job.page_token
+    listed = job.listed
+    page_size = max(1, min(settings.backfill_page_size, 500))
+
+    logger.info(
+        "gmail_backfill run account_id=%s listed=%s resume=%s", account_id, listed, checkpoint is not None
+    )
+    next_page: Optional[asyncio.Task] = None
+    try:
+        access_token = await _access_token(account_id)
+        next_page = asyncio.create_task(
+            gmail_client.list_messages_page(access_token, max_results=page_size, page_token=checkpoint)
+        )
+        while True:
+            page = await next_page
+            next_page = None
+            message_ids = [m["id"] for m in page.get("messages", [])]
+            if job.max_messages:
+                message_ids = message_ids[: max(0, job.max_messages - listed)]
+            token = page.get("nextPageToken")
+            done = not token or bool(job.max_messages and listed + len(message_ids) >= job.max_messages)
+
+            # The next listing overlaps with this page's fetches and writes.
+            if not done:
+                next_page = asyncio.create_task(
+                    gmail_client.list_messages_page(access_token, max_results=page_size, page_token=token)
+                )
+            counts = await _process_page(
+                account_id, access_token, message_ids, include_bodies=job.include_bodies
+            )
+            listed += len(message_ids)
+            still_ours = await run_db(
+                crud.checkpoint_backfill_job,
+                job.id,
+                owner=OWNER,
+                page_token=None if done else token,
+                listed=len(message_ids),
+                status="completed" if done else None,
+                **counts,
+            )
+            if not still_ours:
+                logger.info("gmail_backfill stopped account_id=%s reason=paused_or_taken_over", account_id)
+                return
+            checkpoint = token
+            if done:
+                break
+            access_token = await _access_token(account_id)
+    except asyncio.CancelledError:
+        # Shutdown or pause: the job row keeps its last checkpoint.
+        raise
+    except Exception as e:
+        logger.exception("gmail_backfill failed account_id=%s", account_id)
+        await run_db(
+            crud.checkpoint_backfill_job,
+            job.id,
+            owner=OWNER,
+            page_token=checkpoint,
+            status="failed",
+            last_error=f"{e.__class__.__name__}: {e}"[:500],
+        )
+        return
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+    # The mirror now matches the mailbox as of history_id; incremental sync can take over
+    # without a full resync.
+    state = await run_db(crud.get_sync_state, account_id)
+    if job.history_id and (state is None or not state.history_id):
+        await run_db(crud.save_sync_state, account_id, history_id=job.history_id, full=True)
+    await _record_coverage(account_id, message_ids, capped=bool(token))
+    logger.info("gmail_backfill completed account_id=%s listed=%s", account_id, listed)
+
+
+async def _record_coverage(account_id: int, last_page: List[str], *, capped: bool) -> None:
+    # A pass without failures mirrors every message from the oldest one listed (the last
+    # page) onwards, or the whole mailbox when the listing ran to the end.
+    job = await run_db(crud.get_backfill_job, account_id)
+    if job is None or job.failed:
+        return
+    covered_since = await run_db(crud.min_internal_date, account_id, last_page) if capped else 0
+    if covered_since is None:
+        return
+    # Incremental sync keeps a wider earlier coverage valid; do not narrow it.
+    existing = await run_db(crud.get_sync_coverage, account_id)
+    if existing is not None and existing.covered_since <= covered_since:
+        return
+    await run_db(crud.save_sync_coverage, account_id, covered_since=covered_since, source="backfill")
+
+
+def _spawn(job: GmailBackfillJob) -> None:
+    task = asyncio.create_task(_run(job))
+    _tasks[job.account_id] = task
+
+    def _done(t: asyncio.Task) -> None:
+        if _tasks.get(job.account_id) is t:
+            del _tasks[job.account_id]
+
+    task.add_done_callback(_done)
+
+
+async def _claim_and_spawn(job: GmailBackfillJob) -> bool:
+    if not await run_db(crud.claim_backfill_job, job.id, owner=OWNER, expected_owner=job.owner):
+        return False
+    job = await run_db(crud.get_backfill_job, job.account_id)
+    _spawn(job)
+    return True
+
+
+async def start(
+    account: GmailAccountToken,
+    access_token: str,
+    *,
+    include_bodies: bool = False,
+    max_messages: Optional[int] = None,
+    restart: bool = False,
+) -> GmailBackfillJob:
+    # Starts a new pass, or resumes a paused / failed / orphaned one from its checkpoint.
+    # include_bodies and max_messages apply to new passes only.
+    job = await run_db(crud.get_backfill_job, account.id)
+    if job is not None and job.status == "running" and not _owner_gone(job):
+        return job
+
+    if job is None or job.status == "completed" or restart:
+        previous = job.owner if job is not None else None
+        task = _tasks.get(account.id)
+        if task is not None:
+            task.cancel()
+        profile = await gmail_client.get_profile(access_token)
+        if max_messages is None:
+            max_messages = get_settings().message_cache_max_rows_per_account
+        job = job or GmailBackfillJob(account_id=account.id)
+        job.status = "paused"
+        job.include_bodies = include_bodies
+        job.max_messages = max(0, max_messages)
+        job.page_token = None
+        job.history_id = profile.get("historyId")
+        job.estimated_total = profile.get("messagesTotal")
+        job.listed = job.stored = job.skipped = job.failed = job.bodies = 0
+        job.started_at = datetime.utcnow()
+        job.finished_at = None
+        job.owner = previous
+        job = await run_db(crud.save_backfill_job, job)
+    else:
+        task = _tasks.get(account.id)
+        if task is not None:
+            task.cancel()
+
+    if await _claim_and_spawn(job):
+        logger.info(
+            "gmail_backfill started account_id=%s include_bodies=%s max_messages=%s",
+            account.id,
+            job.include_bodies,
+            job.max_messages,
+        )
+    return await run_db(crud.get_backfill_job, account.id)
+
+
+async def pause(account_id: int) -> Optional[GmailBackfillJob]:
+    # Another worker running the job stops at its next checkpoint.
+    job = await run_db(crud.pause_backfill_job, account_id)
+    task = _tasks.pop(account_id, None)
+    if task is not None:
+        task.cancel()
+        logger.info("gmail_backfill paused account_id=%s", account_id)
+    return job
+
+
+async def status(account_id: int) -> Optional[GmailBackfillJob]:
+    return await run_db(crud.get_backfill_job, account_id)
+
+
+async def _resume_interrupted() -> None:
+    try:
+        jobs = await run_db(crud.list_backfill_jobs, status="running")
+        for job in jobs:
+            if _owner_gone(job) and await _claim_and_spawn(job):
+                logger.info("gmail_backfill resumed account_id=%s", job.account_id)
+    except Exception:
+        logger.exception("gmail_backfill resume_failed")
+
+
+def start_backfills() -> None:
+    global _resume_task
+    if get_settings().backfill_resume_on_startup and _resume_task is None:
+        _resume_task = asyncio.create_task(_resume_interrupted())
+
+
+async def stop_backfills() -> None:
+    # Running jobs stay "running" in the database and resume at the next startup.
+    global _resume_task
+    tasks = list(_tasks.values())
+    if _resume_task is not None:
+        tasks.append(_resume_task)
+        _resume_task = None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _tasks.clear()
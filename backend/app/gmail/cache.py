@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailAccountToken, GmailMessageMetadata
+from app.db.session import run_db
+from app.gmail import client as gmail_client
+from app.gmail import semantic
+from app.gmail.client import MessageSummary, ThreadSummary
+
+logger = logging.getLogger(__name__)
+
+
+def summary_to_row(summary: MessageSummary) -> GmailMessageMetadata:
+    return GmailMessageMetadata(
+        account_id=0,
+        message_id=summary.id,
+        thread_id=summary.thread_id,
+        snippet=summary.snippet,
+        from_email=summary.from_email,
+        subject=summary.subject,
+        date=summary.date,
+        internal_date=summary.internal_date,
+        label_ids=",".join(summary.label_ids) if summary.label_ids is not None else None,
+    )
+
+
+def row_to_summary(row: GmailMessageMetadata) -> MessageSummary:
+    return MessageSummary(
+        id=row.message_id,
+        thread_id=row.thread_id,
+        snippet=row.snippet,
+        from_email=row.from_email,
+        subject=row.subject,
+        date=row.date,
+        internal_date=row.internal_date,
+        label_ids=row.label_ids.split(",") if row.label_ids else [],
+    )
+
+
+def store_summaries(session: Session, account_id: int, summaries: List[MessageSummary]) -> None:
+    settings = get_settings()
+    crud.upsert_cached_messages(session, account_id, [summary_to_row(s) for s in summaries])
+    index_semantic(session, account_id, summaries)
+    max_age_days = settings.message_cache_max_age_days
+    evicted = crud.evict_cached_messages(
+        session,
+        account_id,
+        max_rows=settings.message_cache_max_rows_per_account,
+        max_age=timedelta(days=max_age_days) if max_age_days > 0 else None,
+    )
+    if evicted:
+        # Evicted rows leave holes the query planner cannot see, so it stops answering locally.
+        crud.clear_sync_coverage(session, account_id)
+        logger.info("message_cache evicted account_id=%s rows=%s", account_id, evicted)
+
+
+def index_semantic(session: Session, account_id: int, summaries: List[MessageSummary]) -> None:
+    # Best effort: a failing embedder must not stop messages from being cached.
+    try:
+        semantic.index_summaries(session, account_id, summaries)
+    except Exception:
+        session.rollback()
+        logger.exception("semantic index_failed account_id=%s", account_id)
+
+
+def index_semantic_with_cached(
+    session: Session,
+    account_id: int,
+    summaries: List[MessageSummary],
+    cached: Iterable[GmailMessageMetadata],
+) -> None:
+    # For passes over the whole mailbox (full sync, backfill) that skip refetching ids the
+    # mirror already has: rows cached before semantic search was enabled get their vectors
+    # here. Rows already indexed are skipped by semantic.index_summaries.
+    index_semantic(session, account_id, summaries + [row_to_summary(row) for row in cached])
+
+
+def _count_lookups(hits: int, misses: int) -> None:
+    if hits:
+        metrics.MESSAGE_CACHE_LOOKUPS.labels("hit").inc(hits)
+    if misses:
+        metrics.MESSAGE_CACHE_LOOKUPS.labels("miss").inc(misses)
+
+
+async def fetch_and_store(
+    account: GmailAccountToken,
+    access_token: str,
+    message_ids: List[str],
+    *,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Tuple[Dict[str, MessageSummary], Dict[str, BaseException]]:
+    # A projected fetch (fields set) leaves summaries incomplete, so it is not stored.
+    settings = get_settings()
+
+    fetched: Dict[str, MessageSummary] = {}
+    errors: Dict[str, BaseException] = {}
+    if not message_ids:
+        return fetched, errors
+
+    results = await gmail_client.get_messages_metadata_batch(
+        access_token,
+        message_ids,
+        batch_size=settings.gmail_batch_size,
+        concurrency=settings.gmail_metadata_concurrency,
+        max_retries=settings.gmail_batch_max_retries,
+        fields=fields,
+    )
+    for message_id, result in zip(message_ids, results):
+        if isinstance(result, BaseException):
+            errors[message_id] = result
+        else:
+            fetched[message_id] = gmail_client.to_summary(result)
+
+    if fetched and settings.message_cache_enabled and fields is None:
+        await run_db(store_summaries, account.id, list(fetched.values()))
+    return fetched, errors
+
+
+# Once delivered, only a message's labels change (read state, archiving, user labels);
+# headers, snippet and internalDate stay as they were cached.
+_LABEL_FIELDS = ("id", "label_ids")
+
+
+async def refresh_labels(
+    account: GmailAccountToken, access_token: str, message_ids: List[str]
+) -> Tuple[int, Dict[str, BaseException]]:
+    # Rereads labelIds for cached messages and renews their cached_at, without refetching
+    # the rest of the summary. Returns the number of rows updated and per-id failures.
+    settings = get_settings()
+    errors: Dict[str, BaseException] = {}
+    if not message_ids:
+        return 0, errors
+
+    results = await gmail_client.get_messages_metadata_batch(
+        access_token,
+        message_ids,
+        batch_size=settings.gmail_batch_size,
+        concurrency=settings.gmail_metadata_concurrency,
+        max_retries=settings.gmail_batch_max_retries,
+        fields=_LABEL_FIELDS,
+    )
+    labels: Dict[str, List[str]] = {}
+    for message_id, result in zip(message_ids, results):
+        if isinstance(result, BaseException):
+            errors[message_id] = result
+        else:
+            labels[message_id] = result.get("labelIds") or []
+    updated = await run_db(crud.update_cached_labels, account.id, labels, touch=True) if labels else 0
+    return updated, errors
+
+
+async def load_summaries(
+    account: GmailAccountToken,
+    access_token: str,
+    message_ids: List[str],
+    *,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Tuple[List[MessageSummary], Dict[str, BaseException]]:
+    # Read-through: only cache misses go upstream. Order follows message_ids.
+    settings = get_settings()
+
+    cached: Dict[str, GmailMessageMetadata] = {}
+    if settings.message_cache_enabled:
+        cached = await run_db(crud.get_cached_messages, account.id, message_ids)
+    misses = [mid for mid in message_ids if mid not in cached]
+    _count_lookups(len(cached), len(misses))
+
+    fetched, errors = await fetch_and_store(account, access_token, misses, fields=fields)
+
+    logger.info(
+        "message_cache account_id=%s hits=%s misses=%s errors=%s",
+        account.id,
+        len(cached),
+        len(misses),
+        len(errors),
+    )
+
+    summaries: List[MessageSummary] = []
+    for message_id in message_ids:
+        if message_id in cached:
+            summaries.append(row_to_summary(cached[message_id]))
+        elif message_id in fetched:
+            summaries.append(fetched[message_id])
+    return summaries, errors
+
+
+async def iter_summaries(
+    account: GmailAccountToken,
+    access_token: str,
+    message_ids: List[str],
+    *,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> AsyncIterator[Tuple[str, MessageSummary | BaseException]]:
+    # Streaming variant of load_summaries: cache hits first, then each batch as it lands.
+    settings = get_settings()
+
+    cached: Dict[str, GmailMessageMetadata] = {}
+    if settings.message_cache_enabled:
+        cached = await run_db(crud.get_cached_messages, account.id, message_ids)
+    for message_id in message_ids:
+        if message_id in cached:
+            yield message_id, row_to_summary(cached[message_id])
+
+    misses = [mid for mid in message_ids if mid not in cached]
+    _count_lookups(len(cached), len(misses))
+    if not misses:
+        return
+
+    async for chunk in gmail_client.iter_messages_metadata_batch(
+        access_token,
+        misses,
+        batch_size=settings.gmail_batch_size,
+        concurrency=settings.gmail_metadata_concurrency,
+        max_retries=settings.gmail_batch_max_retries,
+        fields=fields,
+    ):
+        fetched: List[MessageSummary] = []
+        for message_id, result in chunk.items():
+            if isinstance(result, BaseException):
+                yield message_id, result
+                continue
+            summary = gmail_client.to_summary(result)
+            fetched.append(summary)
+            yield message_id, summary
+        if fetched and settings.message_cache_enabled and fields is None:
+            await run_db(store_summaries, account.id, fetched)
+
+
+async def load_threads(
+    account: GmailAccountToken,
+    access_token: str,
+    thread_ids: List[str],
+    *,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Tuple[List[ThreadSummary], Dict[str, BaseException]]:
+    # Threads always come from Gmail (new replies change them), but the message summaries
+    # they carry warm the metadata cache. Order follows thread_ids.
+    settings = get_settings()
+    results = await gmail_client.get_threads_metadata_batch(
+        access_token,
+        thread_ids,
+        batch_size=settings.gmail_batch_size,
+        concurrency=settings.gmail_metadata_concurrency,
+        max_retries=settings.gmail_batch_max_retries,
+        fields=fields,
+    )
+    threads: List[ThreadSummary] = []
+    errors: Dict[str, BaseException] = {}
+    for thread_id, result in zip(thread_ids, results):
+        if isinstance(result, BaseException):
+            errors[thread_id] = result
+        else:
+            threads.append(gmail_client.to_thread_summary(result))
+
+    summaries = [m for t in threads for m in t.messages]
+    if summaries and settings.message_cache_enabled and fields is None:
+        await run_db(store_summaries, account.id, summaries)
+    return threads, errors
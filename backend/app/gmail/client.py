@@ -1,18 +1,76 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import time
+import uuid
 from dataclasses import dataclass
 from datetime import date
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
 
 import httpx
 
+from app.core import metrics
+from app.core.config import get_settings
+from app.gmail import content, quota
+from app.gmail.http import get_http_client
+
 logger = logging.getLogger(__name__)
 
-GMAIL_API_BASE = "https://gmail.googleapis.com/gmail/v1"
+# Path prefix of Gmail REST calls inside a batch body (relative to the batch host).
+GMAIL_API_PATH = "/gmail/v1"
+
+# Gmail rejects batches with more than 100 sub-requests.
+GMAIL_BATCH_MAX_SIZE = 100
+
+METADATA_HEADERS = ["From", "Subject", "Date"]
+
+# Everything a MessageSummary carries, in output order; `fields=` picks a subset.
+SUMMARY_FIELDS: Tuple[str, ...] = (
+    "id",
+    "thread_id",
+    "snippet",
+    "from_email",
+    "subject",
+    "date",
+    "internal_date",
+    "label_ids",
+)
+# Summary field -> Gmail partial-response selector. Header fields come from payload/headers.
+_GMAIL_FIELD_SELECTORS = {
+    "id": "id",
+    "thread_id": "threadId",
+    "snippet": "snippet",
+    "internal_date": "internalDate",
+    "label_ids": "labelIds",
+}
+_HEADER_FIELDS = {"From": "from_email", "Subject": "subject", "Date": "date"}
+_HEADER_FIELDS_LOWER = {name.lower(): field for name, field in _HEADER_FIELDS.items()}
+
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+class GmailApiError(Exception):
+    def __init__(
+        self,
+        status_code: int,
+        message: str = "",
+        *,
+        reason: Optional[str] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(f"Gmail API error {status_code}: {message}".rstrip(": "))
+        self.status_code = status_code
+        self.message = message
+        self.reason = reason
+        self.retry_after = retry_after
 
 
-@dataclass
+@dataclass(slots=True)
 class MessageSummary:
     id: str
     thread_id: str
@@ -20,13 +78,72 @@ class MessageSummary:
     from_email: str | None
     subject: str | None
     date: str | None
+    internal_date: int | None = None
+    label_ids: List[str] | None = None
+
+
+@dataclass(slots=True)
+class ThreadSummary:
+    id: str
+    snippet: str | None
+    history_id: str | None
+    messages: List[MessageSummary]
+
+
+def summary_to_dict(summary: MessageSummary, fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+    return {f: getattr(summary, f) for f in (fields or SUMMARY_FIELDS)}
+
+
+def thread_to_dict(thread: ThreadSummary, fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+    return {
+        "id": thread.id,
+        "snippet": thread.snippet,
+        "history_id": thread.history_id,
+        "message_count": len(thread.messages),
+        "messages": [summary_to_dict(m, fields) for m in thread.messages],
+    }
+
+
+def parse_fields(spec: Optional[str]) -> Optional[Tuple[str, ...]]:
+    # "subject,from_email" -> ("id", "from_email", "subject"); None means every field.
+    # id is always kept so callers can correlate results.
+    if not spec:
+        return None
+    requested = {f.strip() for f in spec.split(",") if f.strip()}
+    unknown = sorted(requested - set(SUMMARY_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    requested.add("id")
+    if len(requested) == len(SUMMARY_FIELDS):
+        return None
+    return tuple(f for f in SUMMARY_FIELDS if f in requested)
+
+
+def _metadata_params(fields: Optional[Tuple[str, ...]] = None) -> List[Tuple[str, str]]:
+    if fields is None:
+        return [("format", "metadata")] + [("metadataHeaders", h) for h in METADATA_HEADERS]
+    headers = [name for name, field in _HEADER_FIELDS.items() if field in fields]
+    selectors = [_GMAIL_FIELD_SELECTORS[f] for f in fields if f in _GMAIL_FIELD_SELECTORS]
+    if headers:
+        selectors.append("payload/headers")
+    return (
+        [("format", "metadata")]
+        + [("metadataHeaders", h) for h in headers]
+        + [("fields", ",".join(selectors))]
+    )
+
+
+def _thread_params(fields: Optional[Tuple[str, ...]] = None) -> List[Tuple[str, str]]:
+    # Same projection as _metadata_params, applied to each message of the thread.
+    params = _metadata_params(fields)
+    if fields is None:
+        return params
+    name, selectors = params[-1]
+    return params[:-1] + [(name, f"id,messages({selectors})")]
 
 
-def _header_value(headers: List[Dict[str, Any]], name: str) -> Optional[str]:
-    for h in headers:
-        if h.get("name", "").lower() == name.lower():
-            return h.get("value")
-    return None
+def _api_base() -> str:
+    return get_settings().gmail_api_base.rstrip("/")
 
 
 def build_gmail_query(
@@ -60,53 +177,622 @@ def build_gmail_query(
     return " ".join(parts)
 
 
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _error_details(body: bytes) -> Tuple[str, Optional[str]]:
+    try:
+        error = json.loads(body).get("error", {})
+        reasons = [e.get("reason") for e in error.get("errors", [])]
+        return error.get("message", ""), next((r for r in reasons if r), None)
+    except (ValueError, AttributeError):
+        return "", None
+
+
+def _is_rate_limit_response(resp: httpx.Response) -> bool:
+    if resp.status_code == 429:
+        return True
+    return resp.status_code == 403 and _error_details(resp.content)[1] in _RATE_LIMIT_REASONS
+
+
+async def _send(
+    method: str,
+    url: str,
+    *,
+    access_token: str,
+    operation: str,
+    units: Optional[int] = None,
+    headers: Optional[Dict[str, str]] = None,
+    stream: bool = False,
+    **kwargs: Any,
+) -> httpx.Response:
+    # Every Gmail call goes through here: charge the account's quota bucket, then retry
+    # throttling, 5xx and transport errors with jittered backoff. With stream=True the
+    # successful response body is left unread; the caller must aclose() it.
+    settings = get_settings()
+    key = quota.account_key(access_token)
+    if units is None:
+        units = quota.cost(operation)
+    request_headers = {"Authorization": f"Bearer {access_token}", **(headers or {})}
+    client = get_http_client()
+
+    attempt = 0
+    while True:
+        await quota.scheduler.acquire(key, units)
+        started = time.perf_counter()
+        try:
+            with metrics.UPSTREAM_REQUESTS_IN_FLIGHT.labels("gmail").track_inprogress():
+                request = client.build_request(method, url, headers=request_headers, **kwargs)
+                resp = await client.send(request, stream=stream)
+                if stream and resp.status_code >= 400:
+                    # Error bodies are small and needed for the reason / Retry-After checks.
+                    await resp.aread()
+        except httpx.TransportError:
+            metrics.observe_upstream("gmail", operation, "transport_error", started)
+            if attempt >= settings.gmail_max_retries:
+                raise
+            delay = quota.backoff_delay(attempt)
+            logger.info("gmail_retry transport_error attempt=%s delay=%.2fs", attempt + 1, delay)
+        else:
+            metrics.observe_upstream("gmail", operation, str(resp.status_code), started)
+            rate_limited = _is_rate_limit_response(resp)
+            retryable = rate_limited or resp.status_code in _RETRYABLE_STATUS
+            if not retryable or attempt >= settings.gmail_max_retries:
+                if resp.is_error and stream:
+                    await resp.aclose()
+                resp.raise_for_status()
+                return resp
+            if stream:
+                await resp.aclose()
+            delay = quota.backoff_delay(
+                attempt, retry_after=_parse_retry_after(resp.headers.get("retry-after"))
+            )
+            if rate_limited:
+                quota.scheduler.penalize(key, delay)
+            logger.info(
+                "gmail_retry status=%s attempt=%s delay=%.2fs", resp.status_code, attempt + 1, delay
+            )
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def list_messages_page(
+    access_token: str,
+    *,
+    q: str = "",
+    max_results: int = 100,
+    page_token: Optional[str] = None,
+) -> Dict[str, Any]:
+    url = f"{_api_base()}/users/me/messages"
+    params: Dict[str, Any] = {"q": q, "maxResults": max_results}
+    if page_token:
+        params["pageToken"] = page_token
+
+    resp = await _send("GET", url, access_token=access_token, operation="messages.list", params=params)
+    return resp.json()
+
+
 async def list_messages(access_token: str, *, q: str, max_results: int = 10) -> List[Dict[str, Any]]:
-    url = f"{GMAIL_API_BASE}/users/me/messages"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    params = {"q": q, "maxResults": max_results}
+    data = await list_messages_page(access_token, q=q, max_results=max_results)
+    return data.get("messages", [])
+
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("messages", [])
+async def iter_message_ids(
+    access_token: str,
+    *,
+    q: str = "",
+    page_size: int = 500,
+    limit: Optional[int] = None,
+    page_token: Optional[str] = None,
+) -> AsyncIterator[str]:
+    # Lazily walks every result page; the next page is requested while the current one is consumed.
+    yielded = 0
+    next_page: Optional[asyncio.Task] = asyncio.create_task(
+        list_messages_page(access_token, q=q, max_results=page_size, page_token=page_token)
+    )
+    try:
+        while next_page is not None:
+            page = await next_page
+            next_page = None
+            messages = page.get("messages", [])
+
+            token = page.get("nextPageToken")
+            if token and (limit is None or yielded + len(messages) < limit):
+                next_page = asyncio.create_task(
+                    list_messages_page(access_token, q=q, max_results=page_size, page_token=token)
+                )
+
+            for m in messages:
+                if limit is not None and yielded >= limit:
+                    return
+                yield m["id"]
+                yielded += 1
+    finally:
+        if next_page is not None:
+            next_page.cancel()
 
 
-async def get_message_metadata(access_token: str, message_id: str) -> Dict[str, Any]:
-    url = f"{GMAIL_API_BASE}/users/me/messages/{message_id}"
-    headers = {"Authorization": f"Bearer {access_token}"}
+async def list_threads_page(
+    access_token: str,
+    *,
+    q: str = "",
+    max_results: int = 100,
+    page_token: Optional[str] = None,
+) -> Dict[str, Any]:
+    url = f"{_api_base()}/users/me/threads"
+    params: Dict[str, Any] = {"q": q, "maxResults": max_results}
+    if page_token:
+        params["pageToken"] = page_token
+
+    resp = await _send("GET", url, access_token=access_token, operation="threads.list", params=params)
+    return resp.json()
 
-    params = {
-        "format": "metadata",
-        "metadataHeaders": ["From", "Subject", "Date"],
+
+async def list_history(
+    access_token: str,
+    *,
+    start_history_id: str,
+    page_token: Optional[str] = None,
+    max_results: int = 500,
+) -> Dict[str, Any]:
+    url = f"{_api_base()}/users/me/history"
+    params: Dict[str, Any] = {
+        "startHistoryId": start_history_id,
+        "maxResults": max_results,
+        "historyTypes": ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
     }
+    if page_token:
+        params["pageToken"] = page_token
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        return resp.json()
+    resp = await _send("GET", url, access_token=access_token, operation="history.list", params=params)
+    return resp.json()
 
 
-async def get_profile_email(access_token: str) -> Optional[str]:
-    url = f"{GMAIL_API_BASE}/users/me/profile"
-    headers = {"Authorization": f"Bearer {access_token}"}
+async def get_thread_metadata(
+    access_token: str, thread_id: str, *, fields: Optional[Tuple[str, ...]] = None
+) -> Dict[str, Any]:
+    # One call returns metadata for every message in the thread.
+    url = f"{_api_base()}/users/me/threads/{thread_id}"
+    params = _thread_params(fields)
+    resp = await _send("GET", url, access_token=access_token, operation="threads.get", params=params)
+    return resp.json()
+
+
+def _build_batch_body(boundary: str, requests: List[Tuple[str, str]]) -> bytes:
+    # requests: (content_id, "GET /gmail/v1/...") pairs
+    lines: List[str] = []
+    for content_id, request_line in requests:
+        lines.extend(
+            [
+                f"--{boundary}",
+                "Content-Type: application/http",
+                f"Content-ID: <{content_id}>",
+                "",
+                f"{request_line} HTTP/1.1",
+                "",
+            ]
+        )
+    lines.append(f"--{boundary}--")
+    lines.append("")
+    return "\r\n".join(lines).encode("utf-8")
+
+
+def _split_head(raw: bytes) -> Tuple[bytes, bytes]:
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        idx = raw.find(sep)
+        if idx != -1:
+            return raw[:idx], raw[idx + len(sep):]
+    return raw, b""
+
+
+def _parse_headers(raw: bytes) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    for line in raw.decode("utf-8", "replace").splitlines():
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def parse_batch_response(
+    content_type: str, body: bytes
+) -> Dict[str, Tuple[int, Dict[str, str], bytes]]:
+    # Maps each part's Content-ID to its (status, headers, body).
+    boundary = None
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            boundary = value.strip('"')
+    if not boundary:
+        raise ValueError("Batch response is missing a multipart boundary")
+
+    parts: Dict[str, Tuple[int, Dict[str, str], bytes]] = {}
+    delimiter = f"--{boundary}".encode("utf-8")
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith(b"--"):
+            break
+        outer_head, http_message = _split_head(chunk.lstrip(b"\r\n"))
+        content_id = _parse_headers(outer_head).get("content-id", "").strip("<>")
+        # Gmail echoes our ids back as "response-<id>".
+        if content_id.startswith("response-"):
+            content_id = content_id[len("response-"):]
+
+        inner_head, inner_body = _split_head(http_message)
+        status_line, _, header_block = inner_head.partition(b"\n")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            status = 0
+        parts[content_id] = (status, _parse_headers(header_block), inner_body.rstrip(b"\r\n"))
+    return parts
+
+
+def _part_error(status: int, headers: Dict[str, str], body: bytes) -> GmailApiError:
+    message, reason = _error_details(body)
+    return GmailApiError(
+        status,
+        message,
+        reason=reason,
+        retry_after=_parse_retry_after(headers.get("retry-after")),
+    )
+
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.get(url, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("emailAddress")
+def _metadata_request_line(message_id: str, fields: Optional[Tuple[str, ...]] = None) -> str:
+    params = urlencode(_metadata_params(fields))
+    return f"GET {GMAIL_API_PATH}/users/me/messages/{quote(message_id, safe='')}?{params}"
+
+
+def _thread_request_line(thread_id: str, fields: Optional[Tuple[str, ...]] = None) -> str:
+    params = urlencode(_thread_params(fields))
+    return f"GET {GMAIL_API_PATH}/users/me/threads/{quote(thread_id, safe='')}?{params}"
+
+
+async def _send_batch(
+    access_token: str, requests: Dict[str, str], *, operation: str
+) -> Dict[str, Dict[str, Any] | BaseException]:
+    # requests: {key: request_line}; results are keyed the same way.
+    boundary = f"batch_{uuid.uuid4().hex}"
+    content_ids = {f"item-{i}": key for i, key in enumerate(requests)}
+    body = _build_batch_body(boundary, [(cid, requests[key]) for cid, key in content_ids.items()])
+    resp = await _send(
+        "POST",
+        get_settings().gmail_batch_url,
+        access_token=access_token,
+        operation="batch",
+        units=quota.cost(operation, len(requests)),
+        headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+        content=body,
+    )
+
+    parts = parse_batch_response(resp.headers.get("content-type", ""), resp.content)
+    results: Dict[str, Dict[str, Any] | BaseException] = {}
+    for cid, key in content_ids.items():
+        part = parts.get(cid)
+        if part is None:
+            results[key] = GmailApiError(0, "Missing part in batch response")
+            continue
+        status, part_headers, part_body = part
+        if status == 200:
+            try:
+                results[key] = json.loads(part_body)
+            except ValueError as e:
+                results[key] = e
+        else:
+            results[key] = _part_error(status, part_headers, part_body)
+    return results
+
+
+def _is_rate_limited(result: Any) -> bool:
+    if not isinstance(result, GmailApiError):
+        return False
+    return result.status_code == 429 or (
+        result.status_code == 403 and result.reason in _RATE_LIMIT_REASONS
+    )
+
+
+async def _fetch_batch(
+    access_token: str,
+    ids: List[str],
+    request_line: Callable[[str], str],
+    *,
+    operation: str,
+    max_retries: int,
+) -> Dict[str, Dict[str, Any] | BaseException]:
+    # Sends one batch and re-sends only the throttled parts, up to max_retries times.
+    results: Dict[str, Dict[str, Any] | BaseException] = {}
+    pending = list(ids)
+    attempt = 0
+    while pending:
+        try:
+            batch = await _send_batch(
+                access_token, {key: request_line(key) for key in pending}, operation=operation
+            )
+        except Exception as e:
+            for key in pending:
+                results[key] = e
+            break
+
+        throttled = [key for key in pending if _is_rate_limited(batch[key])]
+        results.update(batch)
+        if not throttled or attempt >= max_retries:
+            break
+
+        retry_after = max((batch[key].retry_after or 0.0) for key in throttled)
+        delay = quota.backoff_delay(attempt, retry_after=retry_after)
+        logger.info("gmail_batch throttled count=%s retry_in=%.2fs", len(throttled), delay)
+        quota.scheduler.penalize(quota.account_key(access_token), delay)
+        await asyncio.sleep(delay)
+        pending = throttled
+        attempt += 1
+    return results
+
+
+async def _fetch_metadata_batch(
+    access_token: str,
+    message_ids: List[str],
+    *,
+    max_retries: int,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Dict[str, Dict[str, Any] | BaseException]:
+    return await _fetch_batch(
+        access_token,
+        message_ids,
+        lambda mid: _metadata_request_line(mid, fields),
+        operation="messages.get",
+        max_retries=max_retries,
+    )
+
+
+async def iter_messages_metadata_batch(
+    access_token: str,
+    message_ids: List[str],
+    *,
+    batch_size: int = 50,
+    concurrency: int = 4,
+    max_retries: int = 2,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> AsyncIterator[Dict[str, Dict[str, Any] | BaseException]]:
+    # Yields {message_id: metadata | error} per batch, in completion order.
+    batch_size = max(1, min(batch_size, GMAIL_BATCH_MAX_SIZE))
+    unique_ids = list(dict.fromkeys(message_ids))
+    chunks = [unique_ids[i : i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(chunk: List[str]) -> Dict[str, Dict[str, Any] | BaseException]:
+        async with semaphore:
+            return await _fetch_metadata_batch(
+                access_token, chunk, max_retries=max_retries, fields=fields
+            )
+
+    tasks = [asyncio.create_task(_run(c)) for c in chunks]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_messages_metadata_batch(
+    access_token: str,
+    message_ids: List[str],
+    *,
+    batch_size: int = 50,
+    concurrency: int = 4,
+    max_retries: int = 2,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[Dict[str, Any] | BaseException]:
+    # One HTTP call per batch_size ids. Results line up with message_ids; failures are
+    # returned in place instead of raised.
+    merged: Dict[str, Dict[str, Any] | BaseException] = {}
+    async for chunk_results in iter_messages_metadata_batch(
+        access_token,
+        message_ids,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        max_retries=max_retries,
+        fields=fields,
+    ):
+        merged.update(chunk_results)
+    return [merged[mid] for mid in message_ids]
+
+
+async def get_messages_metadata(
+    access_token: str,
+    message_ids: List[str],
+    *,
+    concurrency: int = 10,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[Dict[str, Any] | BaseException]:
+    # Kept for callers of the per-message API; goes through the batch endpoint, with
+    # concurrency bounding batch calls in flight.
+    settings = get_settings()
+    return await get_messages_metadata_batch(
+        access_token,
+        message_ids,
+        batch_size=settings.gmail_batch_size,
+        concurrency=concurrency,
+        max_retries=settings.gmail_batch_max_retries,
+        fields=fields,
+    )
+
+
+async def get_message_metadata(
+    access_token: str, message_id: str, *, fields: Optional[Tuple[str, ...]] = None
+) -> Dict[str, Any]:
+    [result] = await get_messages_metadata(access_token, [message_id], fields=fields)
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+async def get_threads_metadata_batch(
+    access_token: str,
+    thread_ids: List[str],
+    *,
+    batch_size: int = 50,
+    concurrency: int = 4,
+    max_retries: int = 2,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> List[Dict[str, Any] | BaseException]:
+    # threads.get?format=metadata for each id, batched like get_messages_metadata_batch.
+    # Results line up with thread_ids; failures are returned in place.
+    batch_size = max(1, min(batch_size, GMAIL_BATCH_MAX_SIZE))
+    unique_ids = list(dict.fromkeys(thread_ids))
+    chunks = [unique_ids[i : i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(chunk: List[str]) -> Dict[str, Dict[str, Any] | BaseException]:
+        async with semaphore:
+            return await _fetch_batch(
+                access_token,
+                chunk,
+                lambda tid: _thread_request_line(tid, fields),
+                operation="threads.get",
+                max_retries=max_retries,
+            )
+
+    merged: Dict[str, Dict[str, Any] | BaseException] = {}
+    for chunk_results in await asyncio.gather(*(_run(c) for c in chunks)):
+        merged.update(chunk_results)
+    return [merged[tid] for tid in thread_ids]
+
+
+async def _iter_body(resp: httpx.Response, chunk_size: int) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in resp.aiter_bytes(chunk_size):
+            yield chunk
+    finally:
+        await resp.aclose()
+
+
+async def get_message(
+    access_token: str, message_id: str, *, format: str = "full", max_bytes: int
+) -> Dict[str, Any]:
+    # format=full carries inline bodies, so the JSON is read under a size cap.
+    url = f"{_api_base()}/users/me/messages/{quote(message_id, safe='')}"
+    resp = await _send(
+        "GET",
+        url,
+        access_token=access_token,
+        operation="messages.get",
+        params={"format": format},
+        stream=True,
+    )
+    buf = bytearray()
+    async for chunk in _iter_body(resp, 64 * 1024):
+        buf += chunk
+        if len(buf) > max_bytes:
+            raise content.ContentTooLargeError(max_bytes)
+    return json.loads(buf)
+
+
+async def stream_raw_message(
+    access_token: str, message_id: str, *, max_bytes: int, chunk_size: int = 64 * 1024
+) -> AsyncIterator[bytes]:
+    # The request is made (and errors raised) here; the returned iterator yields the
+    # decoded RFC 822 bytes as they arrive and must be consumed to release the connection.
+    url = f"{_api_base()}/users/me/messages/{quote(message_id, safe='')}"
+    resp = await _send(
+        "GET",
+        url,
+        access_token=access_token,
+        operation="messages.get",
+        params={"format": "raw", "fields": "raw"},
+        stream=True,
+    )
+    return content.decode_json_field(_iter_body(resp, chunk_size), "raw", max_bytes=max_bytes)
+
+
+async def stream_attachment(
+    access_token: str,
+    message_id: str,
+    attachment_id: str,
+    *,
+    max_bytes: int,
+    chunk_size: int = 64 * 1024,
+) -> AsyncIterator[bytes]:
+    # Same contract as stream_raw_message, for users.messages.attachments.get.
+    url = (
+        f"{_api_base()}/users/me/messages/{quote(message_id, safe='')}"
+        f"/attachments/{quote(attachment_id, safe='')}"
+    )
+    resp = await _send(
+        "GET",
+        url,
+        access_token=access_token,
+        operation="messages.attachments.get",
+        params={"fields": "data"},
+        stream=True,
+    )
+    return content.decode_json_field(_iter_body(resp, chunk_size), "data", max_bytes=max_bytes)
+
+
+async def watch(
+    access_token: str, *, topic_name: str, label_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    # users.watch: Gmail publishes mailbox changes to the Pub/Sub topic. Returns the
+    # current historyId and the expiration (epoch millis); calling it again renews.
+    url = f"{_api_base()}/users/me/watch"
+    body: Dict[str, Any] = {"topicName": topic_name}
+    if label_ids:
+        body["labelIds"] = label_ids
+        body["labelFilterBehavior"] = "include"
+    resp = await _send("POST", url, access_token=access_token, operation="watch", json=body)
+    return resp.json()
+
+
+async def stop_watch(access_token: str) -> None:
+    url = f"{_api_base()}/users/me/stop"
+    await _send("POST", url, access_token=access_token, operation="stop")
+
+
+async def get_profile(access_token: str) -> Dict[str, Any]:
+    url = f"{_api_base()}/users/me/profile"
+    resp = await _send("GET", url, access_token=access_token, operation="getProfile")
+    return resp.json()
+
+
+async def get_profile_email(access_token: str) -> Optional[str]:
+    data = await get_profile(access_token)
+    return data.get("emailAddress")
 
 
 def to_summary(message: Dict[str, Any]) -> MessageSummary:
-    payload = message.get("payload", {})
-    headers = payload.get("headers", [])
+    # One pass over the headers; the first occurrence of each wins.
+    found: Dict[str, Optional[str]] = {}
+    for h in message.get("payload", {}).get("headers", ()):
+        field = _HEADER_FIELDS_LOWER.get(h.get("name", "").lower())
+        if field is not None and field not in found:
+            found[field] = h.get("value")
+            if len(found) == len(_HEADER_FIELDS_LOWER):
+                break
 
+    internal_date = message.get("internalDate")
     return MessageSummary(
         id=message.get("id"),
         thread_id=message.get("threadId"),
         snippet=message.get("snippet"),
-        from_email=_header_value(headers, "From"),
-        subject=_header_value(headers, "Subject"),
-        date=_header_value(headers, "Date"),
+        from_email=found.get("from_email"),
+        subject=found.get("subject"),
+        date=found.get("date"),
+        internal_date=int(internal_date) if internal_date else None,
+        label_ids=message.get("labelIds"),
+    )
+
+
+def to_thread_summary(thread: Dict[str, Any]) -> ThreadSummary:
+    # Gmail returns a thread's messages oldest first.
+    messages = [to_summary(m) for m in thread.get("messages", ())]
+    return ThreadSummary(
+        id=thread.get("id"),
+        snippet=thread.get("snippet") or (messages[-1].snippet if messages else None),
+        history_id=thread.get("historyId"),
+        messages=messages,
     )
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import base64
+import email.policy
+import re
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.parser import BytesFeedParser
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+# Decoding helpers for message bodies and attachments. Gmail returns both as base64url
+# strings inside a JSON document; these work on the byte stream so nothing needs the
+# whole document (or the decoded payload) in memory at once.
+
+
+class ContentTooLargeError(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Content exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+class Base64UrlDecoder:
+    # Decodes base64url fed in arbitrary slices: whole 4-character groups are decoded as
+    # they arrive, the remainder is carried to the next feed().
+    def __init__(self) -> None:
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._pending + chunk
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return base64.urlsafe_b64decode(data[:usable]) if usable else b""
+
+    def flush(self) -> bytes:
+        data, self._pending = self._pending.rstrip(b"="), b""
+        if not data:
+            return b""
+        return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class JsonStringField:
+    # Pulls one top-level string field (e.g. "raw" or "data") out of a streamed Gmail JSON
+    # response. Base64url values contain no escapes, so the value ends at the next quote.
+    # Inside other JSON strings quotes are escaped, so the opening pattern cannot match there.
+    def __init__(self, name: str) -> None:
+        self._opening = re.compile(rb'"' + re.escape(name.encode()) + rb'"\s*:\s*"')
+        self._buffer = b""
+        self._state = "seek"  # seek -> value -> done
+
+    @property
+    def found(self) -> bool:
+        return self._state != "seek"
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._state == "done":
+            return b""
+        if self._state == "seek":
+            self._buffer += chunk
+            match = self._opening.search(self._buffer)
+            if match is None:
+                # Keep a tail in case the opening pattern straddles two chunks.
+                self._buffer = self._buffer[-64:]
+                return b""
+            chunk, self._buffer = self._buffer[match.end() :], b""
+            self._state = "value"
+        end = chunk.find(b'"')
+        if end == -1:
+            return chunk
+        self._state = "done"
+        return chunk[:end]
+
+
+async def decode_json_field(
+    chunks: AsyncIterator[bytes], name: str, *, max_bytes: int
+) -> AsyncIterator[bytes]:
+    # Streams the decoded bytes of a base64url string field; raises ContentTooLargeError
+    # as soon as more than max_bytes have been decoded.
+    extractor = JsonStringField(name)
+    decoder = Base64UrlDecoder()
+    total = 0
+    async for chunk in chunks:
+        decoded = decoder.feed(extractor.feed(chunk))
+        if decoded:
+            total += len(decoded)
+            if total > max_bytes:
+                raise ContentTooLargeError(max_bytes)
+            yield decoded
+    if not extractor.found:
+        raise ValueError(f"Response has no {name!r} field")
+    tail = decoder.flush()
+    if tail:
+        if total + len(tail) > max_bytes:
+            raise ContentTooLargeError(max_bytes)
+        yield tail
+
+
+@dataclass
+class AttachmentInfo:
+    filename: str
+    mime_type: str
+    size: Optional[int]
+    part_id: Optional[str] = None
+    attachment_id: Optional[str] = None
+
+
+@dataclass
+class MessageContent:
+    id: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    text: Optional[str] = None
+    html: Optional[str] = None
+    attachments: List[AttachmentInfo] = field(default_factory=list)
+    truncated: bool = False
+
+
+_CONTENT_HEADERS = ("From", "To", "Cc", "Subject", "Date", "Message-ID")
+
+
+def _charset(headers: List[Dict[str, Any]]) -> str:
+    for h in headers:
+        if h.get("name", "").lower() == "content-type":
+            match = re.search(r'charset="?([\w.-]+)', h.get("value", ""), re.IGNORECASE)
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+
+def _decode_text(data: bytes, charset: str) -> str:
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def content_from_full(message: Dict[str, Any], *, max_text_bytes: int) -> MessageContent:
+    # format=full: walks the part tree. Inline bodies arrive as base64url; large parts and
+    # attachments only carry an attachmentId and are listed, not downloaded.
+    payload = message.get("payload", {})
+    content = MessageContent(
+        id=message.get("id"),
+        headers={
+            h["name"]: h.get("value", "")
+            for h in payload.get("headers", [])
+            if h.get("name") in _CONTENT_HEADERS
+        },
+    )
+    budget = max_text_bytes
+
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        stack.extend(reversed(part.get("parts", [])))
+        body = part.get("body", {})
+        mime_type = part.get("mimeType", "")
+        if part.get("filename") or body.get("attachmentId"):
+            content.attachments.append(
+                AttachmentInfo(
+                    filename=part.get("filename", ""),
+                    mime_type=mime_type,
+                    size=body.get("size"),
+                    part_id=part.get("partId"),
+                    attachment_id=body.get("attachmentId"),
+                )
+            )
+            continue
+        if mime_type not in ("text/plain", "text/html") or not body.get("data"):
+            continue
+        if (mime_type == "text/plain" and content.text is not None) or (
+            mime_type == "text/html" and content.html is not None
+        ):
+            continue
+        data = base64.urlsafe_b64decode(body["data"] + "=" * (-len(body["data"]) % 4))
+        if len(data) > budget:
+            data, content.truncated = data[:budget], True
+        budget -= len(data)
+        text = _decode_text(data, _charset(part.get("headers", [])))
+        if mime_type == "text/plain":
+            content.text = text
+        else:
+            content.html = text
+    return content
+
+
+def _walk_raw(part: EmailMessage, part_id: str = "") -> Iterator[Tuple[str, EmailMessage]]:
+    # Yields (partId, part) for the leaves of the MIME tree, numbered the way Gmail's
+    # format=full does it: "" for the root, "0", "1", ... below it, then "1.0", "1.1", ...
+    # An attached message/rfc822 is one leaf, as Gmail lists it as one attachment.
+    if not part.is_multipart() or part.get_content_type() == "message/rfc822":
+        yield part_id, part
+        return
+    for index, child in enumerate(part.iter_parts()):
+        yield from _walk_raw(child, f"{part_id}.{index}" if part_id else str(index))
+
+
+def _raw_payload(part: EmailMessage) -> bytes:
+    if part.get_content_type() == "message/rfc822" and part.is_multipart():
+        return part.get_payload(0).as_bytes()
+    return part.get_payload(decode=True) or b""
+
+
+class RawMessageParser:
+    # Incremental RFC 822 parser for format=raw: feed decoded chunks as they stream in.
+    def __init__(self) -> None:
+        self._parser = BytesFeedParser(policy=email.policy.default)
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.feed(chunk)
+
+    def close(self, message_id: str, *, max_text_bytes: int) -> MessageContent:
+        message: EmailMessage = self._parser.close()  # type: ignore[assignment]
+        content = MessageContent(
+            id=message_id,
+            headers={name: str(message[name]) for name in _CONTENT_HEADERS if message[name] is not None},
+        )
+        budget = max_text_bytes
+        for part_id, part in _walk_raw(message):
+            mime_type = part.get_content_type()
+            filename = part.get_filename()
+            if filename or part.get_content_disposition() == "attachment":
+                content.attachments.append(
+                    AttachmentInfo(
+                        filename=filename or "",
+                        mime_type=mime_type,
+                        size=len(_raw_payload(part)),
+                        part_id=part_id,
+                    )
+                )
+                continue
+            if mime_type not in ("text/plain", "text/html"):
+                continue
+            if (mime_type == "text/plain" and content.text is not None) or (
+                mime_type == "text/html" and content.html is not None
+            ):
+                continue
+            data = part.get_payload(decode=True) or b""
+            if len(data) > budget:
+                data, content.truncated = data[:budget], True
+            budget -= len(data)
+            text = _decode_text(data, part.get_content_charset() or "utf-8")
+            if mime_type == "text/plain":
+                content.text = text
+            else:
+                content.html = text
+        return content
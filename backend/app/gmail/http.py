@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+# Whether the current client negotiates HTTP/2: the setting, unless h2 is missing.
+_http2_applied = False
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_client() -> httpx.AsyncClient:
+    global _http2_applied
+    settings = get_settings()
+
+    http2 = settings.http_http2
+    if http2 and not _http2_available():
+        logger.warning("http_client http2_unavailable hint=pip_install_httpx[http2]")
+        http2 = False
+    _http2_applied = http2
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(
+            settings.http_timeout_seconds,
+            connect=settings.http_connect_timeout_seconds,
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # Created lazily so scripts that never run the app lifespan still work.
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    client = get_http_client()
+    logger.info("http_client started http2=%s", _http2_applied)
+    return client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is None:
+        return
+    client, _client = _client, None
+    await client.aclose()
+    logger.info("http_client closed")
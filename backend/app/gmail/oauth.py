@@ -12,7 +12,9 @@ from typing import Any, Dict, Optional
 
 import httpx
 
+from app.core import metrics
 from app.core.config import get_settings
+from app.gmail.http import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +86,20 @@ def build_authorization_url(state: str, scope: Optional[str] = None) -> str:
     return f"{settings.google_auth_url}?{urlencode(params)}"
 
 
+async def _post_token(data: Dict[str, str], *, operation: str) -> Dict[str, Any]:
+    client = get_http_client()
+    started = time.perf_counter()
+    with metrics.UPSTREAM_REQUESTS_IN_FLIGHT.labels("oauth").track_inprogress():
+        try:
+            resp = await client.post(get_settings().google_token_url, data=data)
+        except httpx.TransportError:
+            metrics.observe_upstream("oauth", operation, "transport_error", started)
+            raise
+    metrics.observe_upstream("oauth", operation, str(resp.status_code), started)
+    resp.raise_for_status()
+    return resp.json()
+
+
 async def exchange_code_for_tokens(code: str) -> Dict[str, Any]:
     settings = get_settings()
 
@@ -95,10 +111,7 @@ async def exchange_code_for_tokens(code: str) -> Dict[str, Any]:
         "grant_type": "authorization_code",
     }
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.post(settings.google_token_url, data=data)
-        resp.raise_for_status()
-        return resp.json()
+    return await _post_token(data, operation="authorization_code")
 
 
 async def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
@@ -111,10 +124,7 @@ async def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
         "grant_type": "refresh_token",
     }
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.post(settings.google_token_url, data=data)
-        resp.raise_for_status()
-        return resp.json()
+    return await _post_token(data, operation="refresh_token")
 
 
 def compute_expires_at(expires_in_seconds: Optional[int]) -> Optional[datetime]:
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from app.core.config import get_settings
+from app.db import crud, fts
+from app.db.models import GmailMessageMetadata, GmailSyncCoverage, GmailSyncState, GmailWatch
+from app.db.session import run_db
+from app.gmail import client as gmail_client
+
+logger = logging.getLogger(__name__)
+
+# Hybrid search for /gmail/messages?source=auto. gmail_sync_coverage records from which
+# internalDate on the local mirror is complete; while incremental sync keeps it fresh, that
+# part of a query is answered from SQLite and only the older remainder goes to Gmail,
+# bounded with before:<epoch seconds>. Anything the mirror cannot evaluate (full-text
+# terms, labels, negation, ...) goes to Gmail as is.
+
+# Gmail search leaves these out by default; history sync can still bring them into the mirror.
+_HIDDEN_LABELS = ("SPAM", "TRASH")
+
+# op:value, op:(...), op:"..." | "phrase" | bare word
+_TOKEN = re.compile(r'(-?)(\w+):(\([^)]*\)|"[^"]*"|\S+)|"[^"]*"|\S+')
+_RELATIVE = re.compile(r"^(\d+)([dmy])$")
+_RELATIVE_DAYS = {"d": 1, "m": 30, "y": 365}
+
+
+@dataclass
+class StructuredQuery:
+    gmail_query: str
+    from_email: Optional[str] = None
+    subject_terms: List[str] = field(default_factory=list)
+    # internalDate range in epoch millis: [after_ms, before_ms)
+    after_ms: Optional[int] = None
+    before_ms: Optional[int] = None
+    # Parts the local index cannot evaluate; any entry sends the whole query to Gmail.
+    unsupported: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Plan:
+    # local | split | upstream
+    mode: str
+    reason: str
+    # The local part covers internalDate >= boundary_ms, the upstream part what is older.
+    boundary_ms: Optional[int] = None
+    coverage: Optional[Dict[str, Any]] = None
+
+
+def _iso(millis: Optional[int]) -> Optional[str]:
+    if millis is None:
+        return None
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _parse_date(value: str) -> Optional[int]:
+    # Gmail takes YYYY/MM/DD (dashes work too), starting at midnight Pacific, or epoch seconds.
+    if value.isdigit():
+        return int(value) * 1000
+    for fmt in ("%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return fts.day_start_millis(datetime.strptime(value, fmt).date())
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_relative(value: str) -> Optional[int]:
+    match = _RELATIVE.match(value.lower())
+    if match is None:
+        return None
+    days = int(match.group(1)) * _RELATIVE_DAYS[match.group(2)]
+    return int((datetime.now(timezone.utc) - timedelta(days=days)).timestamp() * 1000)
+
+
+def _set_after(query: StructuredQuery, millis: int) -> None:
+    query.after_ms = millis if query.after_ms is None else max(query.after_ms, millis)
+
+
+def _set_before(query: StructuredQuery, millis: int) -> None:
+    query.before_ms = millis if query.before_ms is None else min(query.before_ms, millis)
+
+
+def _set_from(query: StructuredQuery, value: str) -> None:
+    value = value.strip().strip("()").strip('"').strip()
+    if not value or any(c.isspace() for c in value) or ":" in value:
+        query.unsupported.append(f"from:{value}")
+    elif query.from_email is not None and query.from_email.lower() != value.lower():
+        query.unsupported.append("multiple from:")
+    else:
+        query.from_email = value
+
+
+def _apply_operator(query: StructuredQuery, op: str, value: str) -> None:
+    if op == "from":
+        _set_from(query, value)
+    elif op == "subject":
+        if value.startswith('"'):
+            query.unsupported.append("subject phrase")
+            return
+        terms = value.strip("()").split()
+        if any(t.upper() in ("OR", "AND") or t.startswith("-") or '"' in t or ":" in t for t in terms):
+            query.unsupported.append(f"subject:{value}")
+        else:
+            query.subject_terms.extend(terms)
+    elif op in ("after", "before", "newer_than", "older_than"):
+        millis = _parse_date(value) if op in ("after", "before") else _parse_relative(value)
+        if millis is None:
+            query.unsupported.append(f"{op}:{value}")
+        elif op in ("after", "newer_than"):
+            _set_after(query, millis)
+        else:
+            _set_before(query, millis)
+    else:
+        query.unsupported.append(f"{op}:")
+
+
+def parse_query(
+    *,
+    from_email: Optional[str] = None,
+    after_date: Optional[date] = None,
+    context: Optional[str] = None,
+    context_field: str = "subject",
+) -> StructuredQuery:
+    # Same inputs as build_gmail_query, which still produces the upstream query string.
+    query = StructuredQuery(
+        gmail_query=gmail_client.build_gmail_query(
+            from_email=from_email,
+            after_date=after_date,
+            context=context,
+            context_field=context_field,
+        )
+    )
+    if from_email:
+        _set_from(query, from_email)
+    if after_date:
+        _set_after(query, fts.day_start_millis(after_date))
+
+    ctx = (context or "").strip()
+    if not ctx:
+        return query
+    if ":" not in ctx:
+        if context_field == "any":
+            # Gmail matches these against whole messages; the mirror has headers and snippets.
+            query.unsupported.append("full-text terms")
+        else:
+            query.subject_terms.extend(ctx.split())
+        return query
+
+    for match in _TOKEN.finditer(ctx):
+        negated, op, value = match.groups()
+        if op is None:
+            query.unsupported.append(f"full-text term {match.group(0)}")
+        elif negated:
+            query.unsupported.append(f"-{op}:")
+        else:
+            _apply_operator(query, op.lower(), value)
+    return query
+
+
+def _freshness(
+    state: Optional[GmailSyncState], watch: Optional[GmailWatch], now: datetime
+) -> Optional[str]:
+    # How the mirror is known to be current, or None when it may lag Gmail.
+    if state is None or not state.history_id or state.last_synced_at is None:
+        return None
+    settings = get_settings()
+    age = now - state.last_synced_at
+    if age <= timedelta(seconds=settings.query_planner_max_staleness_seconds):
+        return "recent_sync"
+    # A watch only vouches for the mirror when it reports changes to all mail: one filtered
+    # to labels (INBOX by default) stays silent about sent or filtered-away mail, and the
+    # planner cannot restrict a query to labels. Pushes can also stop arriving unnoticed
+    # (a broken subscription), so the trust is capped too.
+    if (
+        watch is None
+        or watch.label_ids
+        or watch.expires_at <= now
+        or age > timedelta(seconds=settings.query_planner_push_max_staleness_seconds)
+    ):
+        return None
+    # Every change Gmail pushed so far has been synced since.
+    if watch.last_notification_at is None or watch.last_notification_at <= state.last_synced_at:
+        return "push_watch"
+    return None
+
+
+def plan_for_boundary(
+    query: StructuredQuery,
+    boundary_ms: Optional[int],
+    *,
+    reason: str,
+    coverage: Optional[Dict[str, Any]] = None,
+) -> Plan:
+    if boundary_ms is None:
+        return Plan("upstream", reason, coverage=coverage)
+    since = max(query.after_ms or 0, boundary_ms)
+    local_empty = query.before_ms is not None and since >= query.before_ms
+    upstream_empty = boundary_ms == 0 or (query.after_ms is not None and query.after_ms >= boundary_ms)
+    if upstream_empty:
+        return Plan("local", reason, boundary_ms, coverage)
+    if local_empty:
+        return Plan("upstream", "outside_coverage" if reason == "covered" else reason, coverage=coverage)
+    return Plan("split", "partially_covered" if reason == "covered" else reason, boundary_ms, coverage)
+
+
+def choose_plan(
+    query: StructuredQuery,
+    coverage: Optional[GmailSyncCoverage],
+    state: Optional[GmailSyncState],
+    watch: Optional[GmailWatch],
+    *,
+    now: Optional[datetime] = None,
+) -> Plan:
+    if query.unsupported:
+        return Plan("upstream", "unsupported_locally")
+    if coverage is None:
+        return Plan("upstream", "no_coverage")
+
+    fresh_via = _freshness(state, watch, now or datetime.utcnow())
+    info = {
+        "since": _iso(coverage.covered_since) if coverage.covered_since else None,
+        "complete": coverage.covered_since == 0,
+        "source": coverage.source,
+        "last_synced_at": state.last_synced_at if state is not None else None,
+        "fresh_via": fresh_via,
+    }
+    if fresh_via is None:
+        return Plan("upstream", "stale_mirror", coverage=info)
+    # Whole seconds, so before:<seconds> upstream and >= boundary locally split exactly.
+    boundary_ms = -(-coverage.covered_since // 1000) * 1000
+    return plan_for_boundary(query, boundary_ms, reason="covered", coverage=info)
+
+
+def _load(session: Session, account_id: int):
+    return (
+        crud.get_sync_coverage(session, account_id),
+        crud.get_sync_state(session, account_id),
+        crud.get_watch(session, account_id),
+    )
+
+
+async def plan_query(account_id: int, query: StructuredQuery) -> Plan:
+    coverage, state, watch = await run_db(_load, account_id)
+    return choose_plan(query, coverage, state, watch)
+
+
+def local_range(query: StructuredQuery, plan: Plan) -> Tuple[int, Optional[int]]:
+    return max(query.after_ms or 0, plan.boundary_ms or 0), query.before_ms
+
+
+def upstream_query(query: StructuredQuery, plan: Plan) -> str:
+    if plan.mode == "upstream":
+        return query.gmail_query
+    return f"{query.gmail_query} before:{plan.boundary_ms // 1000}".strip()
+
+
+async def search_local(
+    account_id: int, query: StructuredQuery, plan: Plan, *, offset: int, limit: int
+) -> List[GmailMessageMetadata]:
+    # Newest first, like Gmail, so the local page lines up with the upstream one after it.
+    since, until = local_range(query, plan)
+    return await run_db(
+        fts.search_messages,
+        account_id,
+        from_email=query.from_email,
+        context=" ".join(query.subject_terms) or None,
+        context_field="subject",
+        since_ms=since,
+        until_ms=until,
+        exclude_labels=_HIDDEN_LABELS,
+        order="date",
+        offset=offset,
+        limit=limit,
+    )
+
+
+def explain(
+    query: StructuredQuery, plan: Plan, *, local_results: Optional[int], upstream_results: Optional[int]
+) -> dict:
+    result: Dict[str, Any] = {"plan": plan.mode, "reason": plan.reason, "coverage": plan.coverage}
+    if query.unsupported:
+        result["unsupported"] = query.unsupported
+    if plan.mode != "upstream":
+        since, until = local_range(query, plan)
+        result["local"] = {"since": _iso(since) if since else None, "until": _iso(until), "results": local_results}
+    if plan.mode != "local":
+        result["upstream"] = {"query": upstream_query(query, plan), "results": upstream_results}
+    return result
+
+
+# Cursor positions: "l:<boundary>:<offset>" within the local part, "u:<boundary>:<page token>"
+# within the upstream one (boundary empty for a plain upstream plan). Continuing a cursor
+# keeps the boundary it started with, so pages neither overlap nor skip messages.
+
+
+def encode_position(phase: str, boundary_ms: Optional[int], value: Any) -> str:
+    return f"{phase}:{'' if boundary_ms is None else boundary_ms}:{value}"
+
+
+def decode_position(position: str) -> Tuple[str, Optional[int], str]:
+    phase, boundary, value = position.split(":", 2)
+    if phase not in ("l", "u") or (phase == "l" and (not boundary or not value.isdigit())):
+        raise ValueError(position)
+    return phase, int(boundary) if boundary else None, value
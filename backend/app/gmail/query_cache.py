@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailQueryCacheEntry
+from app.db.session import run_db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    account_id: int
+    payload: Dict[str, Any]
+    expires_at: float
+    history_id: Optional[str]
+
+
+def make_key(
+    account_id: int,
+    q: str,
+    max_results: int,
+    cursor: Optional[str] = None,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> str:
+    # Gmail search is case-insensitive and whitespace-insensitive between terms.
+    normalized = " ".join(q.lower().split())
+    raw = json.dumps(
+        [account_id, normalized, max_results, cursor or "", ",".join(fields or ())],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def invalidate(self, account_id: int, *, keep_history_id: Optional[str] = None) -> int:
+        stale = [
+            k
+            for k, e in self._entries.items()
+            if e.account_id == account_id and (keep_history_id is None or e.history_id != keep_history_id)
+        ]
+        for k in stale:
+            del self._entries[k]
+        return len(stale)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class DatabaseBackend:
+    # Rows live in gmail_query_cache, so every worker sharing the database shares hits.
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[_Entry]:
+        row = await run_db(crud.get_query_cache_entry, key)
+        if row is None:
+            return None
+        return _Entry(
+            account_id=row.account_id,
+            payload=json.loads(row.payload),
+            expires_at=(row.expires_at - datetime.utcnow()).total_seconds() + time.time(),
+            history_id=row.history_id,
+        )
+
+    async def set(self, key: str, entry: _Entry) -> None:
+        row = GmailQueryCacheEntry(
+            key=key,
+            account_id=entry.account_id,
+            history_id=entry.history_id,
+            payload=json.dumps(entry.payload, default=str),
+            expires_at=datetime.utcnow() + timedelta(seconds=entry.expires_at - time.time()),
+        )
+        await run_db(crud.put_query_cache_entry, row, max_entries=self.max_entries)
+
+    async def invalidate(self, account_id: int, *, keep_history_id: Optional[str] = None) -> int:
+        return await run_db(
+            crud.delete_query_cache_entries, account_id, keep_history_id=keep_history_id
+        )
+
+    def size(self) -> Optional[int]:
+        # Not tracked per worker; the table is bounded by put_query_cache_entry.
+        return None
+
+
+class QueryCache:
+    def __init__(self, backend, ttl_seconds: float):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        # Latest mailbox historyId seen per account (from sync / push notifications).
+        self._history: Dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, account_id: int, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self.backend.get(key)
+        current = self._history.get(account_id)
+        if entry is None or (current is not None and entry.history_id != current):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.payload
+
+    async def set(self, account_id: int, key: str, payload: Dict[str, Any]) -> None:
+        entry = _Entry(
+            account_id=account_id,
+            payload=payload,
+            expires_at=time.time() + self.ttl_seconds,
+            history_id=self._history.get(account_id),
+        )
+        await self.backend.set(key, entry)
+
+    async def note_history_id(self, account_id: int, history_id: Optional[str]) -> None:
+        # The mailbox changed since entries were cached: drop everything older.
+        if not history_id or self._history.get(account_id) == history_id:
+            return
+        self._history[account_id] = history_id
+        removed = await self.backend.invalidate(account_id, keep_history_id=history_id)
+        if removed:
+            self.invalidations += removed
+            logger.info(
+                "query_cache invalidated account_id=%s history_id=%s entries=%s",
+                account_id,
+                history_id,
+                removed,
+            )
+
+    async def invalidate_account(self, account_id: int) -> None:
+        self.invalidations += await self.backend.invalidate(account_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.__class__.__name__,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def _build_cache() -> QueryCache:
+    settings = get_settings()
+    if settings.query_cache_backend == "db":
+        backend = DatabaseBackend(settings.query_cache_max_entries)
+    else:
+        backend = MemoryBackend(settings.query_cache_max_entries)
+    return QueryCache(backend, ttl_seconds=settings.query_cache_ttl_seconds)
+
+
+cache = _build_cache()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Gmail quota units per method: https://developers.google.com/gmail/api/reference/quota
+QUOTA_COSTS: Dict[str, int] = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.attachments.get": 5,
+    "history.list": 2,
+    "getProfile": 1,
+    "threads.list": 10,
+    "threads.get": 10,
+    "watch": 100,
+    "stop": 50,
+}
+
+# Buckets untouched for this long (and not in use) are dropped.
+_IDLE_BUCKET_SECONDS = 600
+
+current_account: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "gmail_quota_account", default=None
+)
+
+
+def bind_account(account_id: int) -> None:
+    # Charges Gmail calls made later in this task (and tasks it spawns) to account_id.
+    current_account.set(account_id)
+
+
+def account_key(access_token: str) -> str:
+    account_id = current_account.get()
+    if account_id is not None:
+        return f"account:{account_id}"
+    return "token:" + hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:12]
+
+
+def cost(operation: str, count: int = 1) -> int:
+    return QUOTA_COSTS.get(operation, 5) * count
+
+
+def backoff_delay(attempt: int, *, retry_after: Optional[float] = None) -> float:
+    # Full-jitter exponential backoff, never shorter than the server's Retry-After.
+    settings = get_settings()
+    ceiling = min(settings.gmail_backoff_max_seconds, settings.gmail_backoff_base_seconds * (2**attempt))
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Held while a caller waits for budget, so waiters are served in FIFO order.
+        self._lock = asyncio.Lock()
+
+        self.waiting = 0
+        self.acquired = 0
+        self.units = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, units: float) -> None:
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                # Requests larger than the bucket (big batches) wait for a full bucket and
+                # then run the balance negative, which delays whoever comes next.
+                needed = min(units, self.capacity)
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self.paused_until:
+                        await asyncio.sleep(self.paused_until - now)
+                        continue
+                    if self.tokens >= needed:
+                        self.tokens -= units
+                        break
+                    await asyncio.sleep((needed - self.tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+        self.acquired += 1
+        self.units += units
+        self.wait_seconds += time.monotonic() - started
+
+    def pause(self, seconds: float) -> None:
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        return self.waiting == 0 and not self._lock.locked() and now - self.updated > _IDLE_BUCKET_SECONDS
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "tokens": round(self.tokens, 2),
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "units": self.units,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "paused_for": round(max(0.0, self.paused_until - now), 3),
+        }
+
+
+class QuotaScheduler:
+    def __init__(self) -> None:
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._prune()
+            settings = get_settings()
+            bucket = TokenBucket(
+                rate=settings.gmail_quota_units_per_second,
+                capacity=settings.gmail_quota_burst_units,
+            )
+            self._buckets[key] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if b.idle(now)]:
+            del self._buckets[key]
+
+    async def acquire(self, key: str, units: float) -> None:
+        await self._bucket(key).acquire(units)
+
+    def penalize(self, key: str, seconds: float) -> None:
+        logger.info("gmail_quota throttled key=%s pause=%.2fs", key, seconds)
+        self._bucket(key).pause(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        buckets = {key: b.stats() for key, b in self._buckets.items()}
+        return {
+            "queue_depth": sum(b["queue_depth"] for b in buckets.values()),
+            "throttled": sum(b["throttled"] for b in buckets.values()),
+            "buckets": buckets,
+        }
+
+
+scheduler = QuotaScheduler()
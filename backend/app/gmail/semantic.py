@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import logging
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailMessageMetadata
+from app.gmail.client import MessageSummary
+
+logger = logging.getLogger(__name__)
+
+# Local semantic search over cached messages. Each cached message gets one embedding row
+# in a per-account float32 matrix file (SEMANTIC_INDEX_DIR/<account_id>/<space>.f32),
+# read through np.memmap; gmail_semantic_vectors maps message ids to rows. New messages
+# are appended, deleted ones are tombstoned by zeroing their row, which every worker sees
+# through the shared file at once.
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+class Embedder(Protocol):
+    # name identifies the vector space (model and dimension): vectors from different
+    # embedders never share a matrix.
+    name: str
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        # (len(texts), dim) float32, rows L2-normalized (all zero for empty text).
+        ...
+
+
+@lru_cache(maxsize=1 << 17)
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    # blake2b rather than hash(): str hashing is salted per process.
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if h >> 63 else -1.0
+
+
+class HashingEmbedder:
+    # Offline and deterministic: signed feature hashing of words plus their character
+    # trigrams (so "invoice" and "invoices" land close), sublinear term frequency.
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for word in _WORD.findall(text.lower()):
+            counts[word] = counts.get(word, 0) + 1
+            if len(word) > 3:
+                padded = f"<{word}>"
+                for i in range(len(padded) - 2):
+                    gram = "#" + padded[i : i + 3]
+                    counts[gram] = counts.get(gram, 0) + 1
+        return counts
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                index, sign = _bucket(feature, self.dim)
+                # Trigrams count half as much as whole words.
+                weight = 0.5 if feature[0] == "#" else 1.0
+                out[i, index] += sign * weight * (1.0 + math.log(count))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+_embedder: Optional[Embedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    # SEMANTIC_EMBEDDER is "hashing" or "package.module:factory", a zero-argument callable
+    # returning an Embedder (e.g. wrapping a local sentence-transformers model).
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            settings = get_settings()
+            spec = settings.semantic_embedder
+            if spec == "hashing":
+                _embedder = HashingEmbedder(settings.semantic_dim)
+            else:
+                module, _, attr = spec.partition(":")
+                _embedder = getattr(importlib.import_module(module), attr)()
+            logger.info("semantic embedder=%s dim=%s", _embedder.name, _embedder.dim)
+        return _embedder
+
+
+def message_text(summary: MessageSummary) -> str:
+    return " ".join(part for part in (summary.subject, summary.from_email, summary.snippet) if part)
+
+
+def _matrix_path(account_id: int, space: str) -> Path:
+    return Path(get_settings().semantic_index_dir).resolve() / str(account_id) / f"{space}.f32"
+
+
+def _write_rows(path: Path, dim: int, first_row: int, vectors: np.ndarray) -> None:
+    # Rows never move, so writers in different processes touch disjoint byte ranges.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.pwrite(fd, np.ascontiguousarray(vectors, dtype=np.float32).tobytes(), first_row * dim * 4)
+    finally:
+        os.close(fd)
+
+
+def index_summaries(session: Session, account_id: int, summaries: List[MessageSummary]) -> int:
+    # Embeds and appends messages not in the index yet (or tombstoned and cached again).
+    if not summaries or not get_settings().semantic_search_enabled:
+        return 0
+    embedder = get_embedder()
+    by_id = {s.id: s for s in summaries}
+    rows = crud.allocate_semantic_rows(session, account_id, embedder.name, list(by_id))
+    if not rows:
+        return 0
+    ordered = sorted(rows.items(), key=lambda item: item[1])
+    vectors = embedder.embed([message_text(by_id[mid]) for mid, _ in ordered])
+    _write_rows(_matrix_path(account_id, embedder.name), embedder.dim, ordered[0][1], vectors)
+    return len(ordered)
+
+
+def tombstone(session: Session, account_id: int, message_ids: Sequence[str]) -> int:
+    if not message_ids or not get_settings().semantic_search_enabled:
+        return 0
+    embedder = get_embedder()
+    rows = crud.tombstone_semantic_vectors(session, account_id, embedder.name, list(message_ids))
+    path = _matrix_path(account_id, embedder.name)
+    if rows and path.is_file():
+        zeros = np.zeros((1, embedder.dim), dtype=np.float32)
+        for row in rows:
+            _write_rows(path, embedder.dim, row, zeros)
+    return len(rows)
+
+
+@dataclass
+class _View:
+    # This process's read side of one matrix: the memmap and the row -> message id map.
+    matrix: Optional[np.memmap] = None
+    ids: List[Optional[str]] = field(default_factory=list)
+    last_row: int = -1
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_views: Dict[Tuple[int, str], _View] = {}
+_views_lock = threading.Lock()
+
+
+def _view(session: Session, account_id: int, embedder: Embedder) -> _View:
+    with _views_lock:
+        view = _views.setdefault((account_id, embedder.name), _View())
+    with view.lock:
+        # Only rows appended since the last search are read from the database.
+        for row, message_id in crud.list_semantic_rows_after(session, account_id, embedder.name, view.last_row):
+            if row >= len(view.ids):
+                view.ids.extend([None] * (row + 1 - len(view.ids)))
+            view.ids[row] = message_id
+            view.last_row = row
+
+        path = _matrix_path(account_id, embedder.name)
+        size = path.stat().st_size if path.is_file() else 0
+        rows = size // (embedder.dim * 4)
+        if rows == 0:
+            view.matrix = None
+        elif view.matrix is None or view.matrix.shape[0] != rows:
+            view.matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, embedder.dim))
+    return view
+
+
+def top_k(
+    matrix: np.ndarray, queries: np.ndarray, k: int, *, batch_rows: int, min_score: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Best k rows by their highest cosine similarity to any query, scanning the matrix in
+    # batches so memory stays bounded. Returns (rows, scores, query index), best first.
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    best_queries = np.empty(0, dtype=np.int64)
+    for start in range(0, matrix.shape[0], batch_rows):
+        chunk = np.asarray(matrix[start : start + batch_rows])
+        scores = chunk @ queries.T
+        which = scores.argmax(axis=1)
+        top = scores[np.arange(len(which)), which]
+        keep = np.flatnonzero(top > min_score)
+        if len(keep) > k:
+            keep = keep[np.argpartition(-top[keep], k - 1)[:k]]
+        best_rows = np.concatenate([best_rows, keep + start])
+        best_scores = np.concatenate([best_scores, top[keep]])
+        best_queries = np.concatenate([best_queries, which[keep]])
+        if len(best_rows) > k:
+            sel = np.argpartition(-best_scores, k - 1)[:k]
+            best_rows, best_scores, best_queries = best_rows[sel], best_scores[sel], best_queries[sel]
+    order = np.argsort(-best_scores, kind="stable")
+    return best_rows[order], best_scores[order], best_queries[order]
+
+
+@dataclass
+class SemanticHit:
+    message: GmailMessageMetadata
+    score: float
+    query: int
+
+
+def search(
+    session: Session, account_id: int, queries: List[str], *, k: int, min_score: float = 0.0
+) -> Tuple[List[SemanticHit], Dict[str, object]]:
+    settings = get_settings()
+    embedder = get_embedder()
+    view = _view(session, account_id, embedder)
+    # Another search may swap view.matrix for a longer one meanwhile; keep this one.
+    matrix = view.matrix
+    info: Dict[str, object] = {"space": embedder.name, "rows": 0}
+    if matrix is None:
+        return [], info
+    info["rows"] = matrix.shape[0]
+
+    query_vectors = embedder.embed(queries)
+    # Over-fetch a little: hits whose message left the metadata cache are dropped below.
+    rows, scores, which = top_k(
+        matrix, query_vectors, k + max(5, k // 2), batch_rows=settings.semantic_batch_rows, min_score=min_score
+    )
+    ids = view.ids
+    candidates = [(ids[r] if r < len(ids) else None, float(s), int(q)) for r, s, q in zip(rows, scores, which)]
+    cached = crud.get_cached_messages(session, account_id, [mid for mid, _, _ in candidates if mid])
+
+    hits: List[SemanticHit] = []
+    gone: List[str] = []
+    for message_id, score, query in candidates:
+        if message_id is None:
+            continue
+        row = cached.get(message_id)
+        if row is None:
+            gone.append(message_id)
+        elif len(hits) < k:
+            hits.append(SemanticHit(message=row, score=score, query=query))
+    if gone:
+        # Evicted from the metadata cache (or deleted): tombstone now, re-added if cached again.
+        tombstone(session, account_id, gone)
+    return hits, info
+
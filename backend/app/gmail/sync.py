@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailAccountToken
+from app.db.session import run_db
+from app.gmail import cache as message_cache
+from app.gmail import client as gmail_client
+from app.gmail import query_cache, semantic
+
+logger = logging.getLogger(__name__)
+
+# Gmail's list endpoint accepts at most 500 ids per page.
+_LIST_PAGE_SIZE = 500
+
+_locks: Dict[int, asyncio.Lock] = {}
+
+
+class HistoryExpiredError(Exception):
+    pass
+
+
+@dataclass
+class SyncResult:
+    account_id: int
+    mode: str
+    history_id: Optional[str]
+    added: int = 0
+    deleted: int = 0
+    labels_changed: int = 0
+    errors: int = 0
+
+
+def _lock_for(account_id: int) -> asyncio.Lock:
+    lock = _locks.get(account_id)
+    if lock is None:
+        lock = _locks[account_id] = asyncio.Lock()
+    return lock
+
+
+async def _collect_history(access_token: str, start_history_id: str):
+    added: Set[str] = set()
+    deleted: Set[str] = set()
+    labels: Dict[str, List[str]] = {}
+    latest = start_history_id
+
+    page_token = None
+    while True:
+        try:
+            data = await gmail_client.list_history(
+                access_token, start_history_id=start_history_id, page_token=page_token
+            )
+        except httpx.HTTPStatusError as e:
+            # Gmail answers 404 once startHistoryId is older than its retention window.
+            if e.response.status_code == 404:
+                raise HistoryExpiredError(start_history_id) from e
+            raise
+
+        for record in data.get("history", []):
+            for item in record.get("messagesAdded", []):
+                mid = item["message"]["id"]
+                added.add(mid)
+                deleted.discard(mid)
+            for item in record.get("messagesDeleted", []):
+                mid = item["message"]["id"]
+                deleted.add(mid)
+                added.discard(mid)
+                labels.pop(mid, None)
+            for key in ("labelsAdded", "labelsRemoved"):
+                for item in record.get(key, []):
+                    message = item["message"]
+                    if message["id"] not in deleted:
+                        labels[message["id"]] = message.get("labelIds", [])
+
+        latest = data.get("historyId", latest)
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            return added, deleted, labels, latest
+
+
+async def _incremental_sync(
+    account: GmailAccountToken, access_token: str, start_history_id: str
+) -> SyncResult:
+    added, deleted, labels, latest = await _collect_history(access_token, start_history_id)
+
+    result = SyncResult(account_id=account.id, mode="incremental", history_id=str(latest))
+    if deleted:
+        result.deleted = await run_db(crud.delete_cached_messages, account.id, deleted)
+        await run_db(semantic.tombstone, account.id, sorted(deleted))
+    label_updates = {mid: ids for mid, ids in labels.items() if mid not in added}
+    if label_updates:
+        result.labels_changed = await run_db(crud.update_cached_labels, account.id, label_updates)
+    if added:
+        fetched, errors = await message_cache.fetch_and_store(account, access_token, sorted(added))
+        result.added = len(fetched)
+        result.errors = len(errors)
+        # New mail missing from the mirror: local answers would silently omit it.
+        if errors or not get_settings().message_cache_enabled:
+            if await run_db(crud.clear_sync_coverage, account.id):
+                logger.info("gmail_sync coverage_dropped account_id=%s errors=%s", account.id, len(errors))
+
+    await run_db(crud.save_sync_state, account.id, history_id=result.history_id)
+    return result
+
+
+async def _record_full_coverage(
+    account_id: int, message_ids: List[str], known: Dict[str, gmail_client.MessageSummary], errors: int
+) -> None:
+    # The listing is newest first, so the mirror holds every message from the oldest one
+    # listed onwards (or the whole mailbox when the listing ran out before the cap).
+    settings = get_settings()
+    max_rows = settings.message_cache_max_rows_per_account
+    complete = len(message_ids) < settings.sync_full_max_messages
+    dates = [s.internal_date for s in known.values() if s.internal_date is not None]
+    if (
+        errors
+        or not settings.message_cache_enabled
+        or (max_rows and len(message_ids) > max_rows)
+        or (not complete and not dates)
+    ):
+        await run_db(crud.clear_sync_coverage, account_id)
+        return
+    # Eviction while storing may still have dropped listed rows (e.g. the row cap).
+    remaining = await run_db(crud.get_cached_message_ids, account_id)
+    if any(mid not in remaining for mid in message_ids):
+        await run_db(crud.clear_sync_coverage, account_id)
+        return
+    covered_since = 0 if complete else min(dates)
+    await run_db(crud.save_sync_coverage, account_id, covered_since=covered_since, source="full_sync")
+
+
+async def _full_sync(account: GmailAccountToken, access_token: str) -> SyncResult:
+    settings = get_settings()
+    limit = settings.sync_full_max_messages
+
+    # Take the checkpoint before listing so changes made during the listing are replayed next time.
+    profile = await gmail_client.get_profile(access_token)
+    history_id = profile.get("historyId")
+
+    message_ids = [
+        mid
+        async for mid in gmail_client.iter_message_ids(
+            access_token, page_size=min(_LIST_PAGE_SIZE, limit), limit=limit
+        )
+    ]
+
+    result = SyncResult(account_id=account.id, mode="full", history_id=history_id)
+
+    # Only prune local rows when the listing covered the whole mailbox.
+    if len(message_ids) < limit:
+        stale = await run_db(crud.get_cached_message_ids, account.id) - set(message_ids)
+        if stale:
+            result.deleted = await run_db(crud.delete_cached_messages, account.id, stale)
+            await run_db(semantic.tombstone, account.id, sorted(stale))
+
+    # Full metadata is only fetched for ids the mirror does not have yet. History cannot
+    # say what changed on the cached ones, so their labels are reread; that also renews
+    # their cached_at before storing the new rows runs age eviction.
+    cached = await run_db(crud.get_cached_messages, account.id, message_ids)
+    missing = [mid for mid in message_ids if mid not in cached]
+    refresh_errors: Dict[str, BaseException] = {}
+    if cached and settings.message_cache_enabled:
+        _, refresh_errors = await message_cache.refresh_labels(account, access_token, list(cached))
+    fetched, errors = await message_cache.fetch_and_store(account, access_token, missing)
+    result.added = len(fetched)
+    result.errors = len(errors) + len(refresh_errors)
+
+    # fetch_and_store indexes the messages it stores.
+    await run_db(message_cache.index_semantic_with_cached, account.id, [], cached.values())
+    known = {mid: message_cache.row_to_summary(row) for mid, row in cached.items()}
+    known.update(fetched)
+
+    await run_db(crud.save_sync_state, account.id, history_id=history_id, full=True)
+    await _record_full_coverage(account.id, message_ids, known, result.errors)
+    return result
+
+
+async def sync_account(
+    account: GmailAccountToken,
+    access_token: str,
+    *,
+    full: bool = False,
+) -> SyncResult:
+    async with _lock_for(account.id):
+        state = await run_db(crud.get_sync_state, account.id)
+        if full or state is None or not state.history_id:
+            result = await _full_sync(account, access_token)
+        else:
+            try:
+                result = await _incremental_sync(account, access_token, state.history_id)
+            except HistoryExpiredError:
+                logger.info(
+                    "gmail_sync history_expired account_id=%s history_id=%s",
+                    account.id,
+                    state.history_id,
+                )
+                result = await _full_sync(account, access_token)
+
+    await query_cache.cache.note_history_id(account.id, result.history_id)
+
+    logger.info(
+        "gmail_sync done account_id=%s mode=%s history_id=%s added=%s deleted=%s labels_changed=%s errors=%s",
+        result.account_id,
+        result.mode,
+        result.history_id,
+        result.added,
+        result.deleted,
+        result.labels_changed,
+        result.errors,
+    )
+    return result
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.process import PROCESS_ID
+from app.db import crud
+from app.db.models import GmailAccountToken
+from app.db.session import run_db
+from app.gmail import oauth
+
+logger = logging.getLogger(__name__)
+
+# One in-flight refresh per account; concurrent callers await the same task.
+_inflight: Dict[int, asyncio.Task] = {}
+
+_background_task: Optional[asyncio.Task] = None
+
+# Account rows by lookup key ((account_id, email); both None = most recent account), reused
+# for token_cache_ttl_seconds so the request path does not read SQLite every time.
+_account_cache: Dict[Tuple[Optional[int], Optional[str]], Tuple[float, GmailAccountToken]] = {}
+# The row with the latest token seen per account; refreshes here land in it at once.
+_latest: Dict[int, GmailAccountToken] = {}
+
+
+class TokenRefreshError(Exception):
+    def __init__(self, message: str, *, reauth_required: bool = False):
+        super().__init__(message)
+        self.reauth_required = reauth_required
+
+
+def needs_refresh(account: GmailAccountToken, *, within_seconds: Optional[int] = None) -> bool:
+    if not account.expires_at:
+        return False
+    if within_seconds is None:
+        within_seconds = get_settings().token_refresh_skew_seconds
+    return datetime.utcnow() >= (account.expires_at - timedelta(seconds=within_seconds))
+
+
+def _note(account: GmailAccountToken) -> GmailAccountToken:
+    # Returns whichever of account and the known row carries the later-expiring token.
+    if get_settings().token_cache_ttl_seconds <= 0:
+        return account
+    known = _latest.get(account.id)
+    if known is not None and (known.expires_at or datetime.min) >= (account.expires_at or datetime.min):
+        return known
+    _latest[account.id] = account
+    return account
+
+
+def cached_account(account_id: Optional[int], email: Optional[str]) -> Optional[GmailAccountToken]:
+    entry = _account_cache.get((account_id, email))
+    if entry is None or time.monotonic() - entry[0] > get_settings().token_cache_ttl_seconds:
+        return None
+    return _note(entry[1])
+
+
+def cache_account(account_id: Optional[int], email: Optional[str], account: GmailAccountToken) -> None:
+    if get_settings().token_cache_ttl_seconds > 0:
+        _account_cache[(account_id, email)] = (time.monotonic(), account)
+    _note(account)
+
+
+def invalidate_account_cache() -> None:
+    # After accounts are added or re-authorized.
+    _account_cache.clear()
+    _latest.clear()
+
+
+async def _refresh_under_lease(account: GmailAccountToken) -> str:
+    if not account.refresh_token:
+        raise TokenRefreshError("No refresh token stored; re-auth required", reauth_required=True)
+
+    logger.info("token_refresh start account_id=%s email=%s", account.id, account.email)
+    try:
+        refreshed = await oauth.refresh_access_token(account.refresh_token)
+    except Exception as e:
+        logger.exception("token_refresh failed account_id=%s", account.id)
+        raise TokenRefreshError("Token refresh failed") from e
+
+    new_access_token = refreshed.get("access_token")
+    if not new_access_token:
+        raise TokenRefreshError("Refresh response missing access_token")
+
+    account = await run_db(
+        crud.update_tokens,
+        account,
+        access_token=new_access_token,
+        expires_at=oauth.compute_expires_at(refreshed.get("expires_in")),
+        refresh_token=refreshed.get("refresh_token"),
+        scope=refreshed.get("scope", account.scope),
+        token_type=refreshed.get("token_type", account.token_type),
+    )
+    _note(account)
+    logger.info("token_refresh done account_id=%s expires_at=%s", account.id, account.expires_at)
+    return new_access_token
+
+
+async def _refresh(account_id: int, within_seconds: Optional[int]) -> Tuple[str, bool]:
+    # Returns (access_token, refreshed_here). Across processes only the holder of the
+    # account's refresh lease calls Google; the others poll the row until the new token
+    # appears, or take the lease over once it expires.
+    settings = get_settings()
+    deadline = time.monotonic() + settings.token_refresh_lease_seconds + 5
+    while True:
+        # Loads the account itself so it is not tied to whichever request started it.
+        account = await run_db(crud.get_account_by_id, account_id)
+        if account is None:
+            raise TokenRefreshError("Account no longer exists", reauth_required=True)
+        if not needs_refresh(account, within_seconds=within_seconds):
+            return _note(account).access_token, False
+
+        leased = await run_db(
+            crud.acquire_refresh_lease,
+            account_id,
+            owner=PROCESS_ID,
+            ttl_seconds=settings.token_refresh_lease_seconds,
+        )
+        if leased:
+            try:
+                # Reread under the lease: the previous holder may have just finished.
+                account = await run_db(crud.get_account_by_id, account_id)
+                if account is None:
+                    raise TokenRefreshError("Account no longer exists", reauth_required=True)
+                if not needs_refresh(account, within_seconds=within_seconds):
+                    return _note(account).access_token, False
+                return await _refresh_under_lease(account), True
+            finally:
+                await run_db(crud.release_refresh_lease, account_id, owner=PROCESS_ID)
+
+        if time.monotonic() >= deadline:
+            raise TokenRefreshError("Timed out waiting for another worker's token refresh")
+        await asyncio.sleep(settings.token_refresh_lease_poll_seconds)
+
+
+async def _observed_refresh(account_id: int, within_seconds: Optional[int]) -> str:
+    started = time.perf_counter()
+    try:
+        access_token, refreshed_here = await _refresh(account_id, within_seconds)
+    except BaseException:
+        metrics.TOKEN_REFRESH_TOTAL.labels("failure").inc()
+        raise
+    if refreshed_here:
+        metrics.TOKEN_REFRESH_TOTAL.labels("success").inc()
+        metrics.TOKEN_REFRESH_DURATION.observe(time.perf_counter() - started)
+    else:
+        # Another worker (or an earlier refresh) already stored a fresh token.
+        metrics.TOKEN_REFRESH_TOTAL.labels("reused").inc()
+    return access_token
+
+
+def inflight_count() -> int:
+    return len(_inflight)
+
+
+async def refresh_account_token(account_id: int, *, within_seconds: Optional[int] = None) -> str:
+    # within_seconds: a token valid for longer than this is returned as is (default: the
+    # request-path skew).
+    task = _inflight.get(account_id)
+    if task is None:
+        task = asyncio.create_task(_observed_refresh(account_id, within_seconds))
+        _inflight[account_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(account_id, None))
+    else:
+        metrics.TOKEN_REFRESH_TOTAL.labels("coalesced").inc()
+        logger.info("token_refresh coalesced account_id=%s", account_id)
+    # shield: a cancelled caller must not cancel the refresh other callers are waiting on.
+    return await asyncio.shield(task)
+
+
+async def get_valid_access_token(account: GmailAccountToken) -> str:
+    account = _note(account)
+    if not needs_refresh(account):
+        return account.access_token
+    return await refresh_account_token(account.id)
+
+
+async def refresh_expiring_tokens() -> int:
+    settings = get_settings()
+    cutoff = datetime.utcnow() + timedelta(seconds=settings.token_refresh_lead_seconds)
+    accounts = await run_db(crud.list_accounts_expiring_before, cutoff)
+    account_ids = [a.id for a in accounts]
+    if not account_ids:
+        return 0
+
+    results = await asyncio.gather(
+        *(
+            refresh_account_token(account_id, within_seconds=settings.token_refresh_lead_seconds)
+            for account_id in account_ids
+        ),
+        return_exceptions=True,
+    )
+    failed = [aid for aid, r in zip(account_ids, results) if isinstance(r, BaseException)]
+    if failed:
+        logger.warning("token_refresh_background failed account_ids=%s", failed)
+    return len(account_ids) - len(failed)
+
+
+async def _background_loop(interval_seconds: float) -> None:
+    while True:
+        try:
+            refreshed = await refresh_expiring_tokens()
+            if refreshed:
+                logger.info("token_refresh_background refreshed=%s", refreshed)
+        except Exception:
+            logger.exception("token_refresh_background error")
+        await asyncio.sleep(interval_seconds)
+
+
+def start_background_refresh() -> None:
+    global _background_task
+    settings = get_settings()
+    if not settings.token_background_refresh_enabled or _background_task is not None:
+        return
+    _background_task = asyncio.create_task(
+        _background_loop(settings.token_refresh_interval_seconds)
+    )
+    logger.info(
+        "token_refresh_background started interval=%ss lead=%ss",
+        settings.token_refresh_interval_seconds,
+        settings.token_refresh_lead_seconds,
+    )
+
+
+async def stop_background_refresh() -> None:
+    global _background_task
+    if _background_task is None:
+        return
+    task, _background_task = _background_task, None
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    logger.info("token_refresh_background stopped")
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import hmac
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Set
+
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailAccountToken, GmailWatch
+from app.db.session import run_db
+from app.gmail import client as gmail_client
+from app.gmail import quota, tokens
+from app.gmail import sync as gmail_sync
+
+logger = logging.getLogger(__name__)
+
+# Push-driven sync: users.watch makes Gmail publish "mailbox changed" notifications to a
+# Pub/Sub topic, whose push subscription POSTs them to /gmail/push. Each notification
+# triggers an incremental sync of that one account instead of clients polling Gmail.
+
+# One sync task per account; notifications arriving while it runs queue a single rerun.
+_sync_tasks: Dict[int, asyncio.Task] = {}
+_rerun: Set[int] = set()
+
+_renewal_task: Optional[asyncio.Task] = None
+
+
+class WatchNotConfigured(Exception):
+    pass
+
+
+@dataclass
+class PushNotification:
+    email: str
+    history_id: str
+    message_id: Optional[str] = None
+    subscription: Optional[str] = None
+
+
+def verify_push_token(token: Optional[str]) -> bool:
+    expected = get_settings().gmail_push_token
+    return bool(expected) and hmac.compare_digest((token or "").encode(), expected.encode())
+
+
+def parse_push(envelope: Any) -> PushNotification:
+    # Pub/Sub push envelope: {"message": {"data": base64(json), "messageId": ...},
+    # "subscription": ...}; Gmail's data is {"emailAddress": ..., "historyId": ...}.
+    try:
+        message = envelope["message"]
+        data = json.loads(base64.b64decode(message["data"], validate=False))
+        email = data["emailAddress"]
+        history_id = str(data["historyId"])
+    except (KeyError, TypeError, ValueError, binascii.Error) as e:
+        raise ValueError("Malformed push notification") from e
+    if not isinstance(email, str) or not history_id.isdigit():
+        raise ValueError("Malformed push notification")
+    return PushNotification(
+        email=email,
+        history_id=history_id,
+        message_id=message.get("messageId") or message.get("message_id"),
+        subscription=envelope.get("subscription"),
+    )
+
+
+def _label_ids() -> list[str]:
+    return [label.strip() for label in get_settings().gmail_watch_label_ids.split(",") if label.strip()]
+
+
+async def register(account: GmailAccountToken, access_token: str) -> GmailWatch:
+    # Also used for renewal: calling users.watch again extends the existing watch.
+    settings = get_settings()
+    if not settings.gmail_pubsub_topic:
+        raise WatchNotConfigured("GMAIL_PUBSUB_TOPIC is not set")
+    label_ids = _label_ids()
+    response = await gmail_client.watch(
+        access_token, topic_name=settings.gmail_pubsub_topic, label_ids=label_ids
+    )
+    expiration_ms = int(response.get("expiration") or 0)
+    expires_at = datetime.fromtimestamp(expiration_ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+    watch = await run_db(
+        crud.save_watch,
+        account.id,
+        topic_name=settings.gmail_pubsub_topic,
+        label_ids=",".join(label_ids) or None,
+        history_id=str(response.get("historyId")) if response.get("historyId") else None,
+        expires_at=expires_at,
+    )
+    logger.info(
+        "gmail_watch registered account_id=%s history_id=%s expires_at=%s",
+        account.id,
+        watch.history_id,
+        watch.expires_at.isoformat(),
+    )
+    return watch
+
+
+async def unregister(account: GmailAccountToken, access_token: str) -> bool:
+    await gmail_client.stop_watch(access_token)
+    removed = await run_db(crud.delete_watch, account.id)
+    logger.info("gmail_watch stopped account_id=%s", account.id)
+    return removed
+
+
+async def _sync_loop(account_id: int) -> None:
+    quota.bind_account(account_id)
+    try:
+        while True:
+            _rerun.discard(account_id)
+            try:
+                account = await run_db(crud.get_account_by_id, account_id)
+                if account is None:
+                    return
+                access_token = await tokens.get_valid_access_token(account)
+                await gmail_sync.sync_account(account, access_token)
+            except Exception:
+                logger.exception("gmail_push sync_failed account_id=%s", account_id)
+            if account_id not in _rerun:
+                return
+    finally:
+        # No await between the rerun check and this, so no notification slips through.
+        _sync_tasks.pop(account_id, None)
+
+
+def schedule_sync(account_id: int) -> bool:
+    # False when a sync is already running; it will run once more when done.
+    if account_id in _sync_tasks:
+        _rerun.add(account_id)
+        return False
+    _sync_tasks[account_id] = asyncio.create_task(_sync_loop(account_id))
+    return True
+
+
+async def handle_push(notification: PushNotification) -> str:
+    # Returns the outcome for logging: queued, coalesced, stale or unknown_account.
+    account = await run_db(crud.get_account_by_email, notification.email)
+    if account is None:
+        return "unknown_account"
+
+    # Pub/Sub delivers at least once and out of order; skip what the mirror already has.
+    state = await run_db(crud.get_sync_state, account.id)
+    if state is not None and state.history_id and state.history_id.isdigit():
+        if int(notification.history_id) <= int(state.history_id):
+            return "stale"
+    # Only accepted notifications count: the planner treats a notification newer than the
+    # last sync as a pending change, and a stale one never gets a sync to clear it.
+    await run_db(crud.record_watch_notification, account.id)
+    return "queued" if schedule_sync(account.id) else "coalesced"
+
+
+async def renew_expiring_watches() -> int:
+    settings = get_settings()
+    cutoff = datetime.utcnow() + timedelta(seconds=settings.gmail_watch_renew_before_seconds)
+    watches = await run_db(crud.list_watches_expiring_before, cutoff)
+    renewed = 0
+    for watch in watches:
+        try:
+            account = await run_db(crud.get_account_by_id, watch.account_id)
+            if account is None:
+                await run_db(crud.delete_watch, watch.account_id)
+                continue
+            quota.bind_account(account.id)
+            access_token = await tokens.get_valid_access_token(account)
+            await register(account, access_token)
+            renewed += 1
+        except Exception:
+            logger.exception("gmail_watch renew_failed account_id=%s", watch.account_id)
+    return renewed
+
+
+async def _renewal_loop(interval_seconds: float) -> None:
+    while True:
+        try:
+            renewed = await renew_expiring_watches()
+            if renewed:
+                logger.info("gmail_watch renewed=%s", renewed)
+        except Exception:
+            logger.exception("gmail_watch renewal_error")
+        await asyncio.sleep(interval_seconds)
+
+
+def start_background_renewal() -> None:
+    global _renewal_task
+    settings = get_settings()
+    if not settings.gmail_watch_renew_enabled or not settings.gmail_pubsub_topic:
+        return
+    if _renewal_task is None:
+        _renewal_task = asyncio.create_task(
+            _renewal_loop(settings.gmail_watch_renew_interval_seconds)
+        )
+
+
+async def stop_background_renewal() -> None:
+    # Also cancels push-triggered syncs still in flight.
+    global _renewal_task
+    tasks = list(_sync_tasks.values())
+    if _renewal_task is not None:
+        tasks.append(_renewal_task)
+        _renewal_task = None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _rerun.clear()
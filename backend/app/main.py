@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -11,18 +12,46 @@ from starlette.middleware.trustedhost import TrustedHostMiddleware
 from app.api.routes_auth import router as auth_router
 from app.api.routes_gmail import router as gmail_router
 from app.core.config import get_settings
-from app.core.logging import RequestIdMiddleware, configure_logging
-from app.db.session import init_db
+from app.core.metrics import MetricsMiddleware, metrics_endpoint
+from app.core.logging import RequestIdMiddleware, configure_logging, stop_logging
+from app.db.session import init_db, shutdown_db_executor
+from app.gmail.backfill import start_backfills, stop_backfills
+from app.gmail.http import close_http_client, start_http_client
+from app.gmail.tokens import start_background_refresh, stop_background_refresh
+from app.gmail.watch import start_background_renewal, stop_background_renewal
 
 settings = get_settings()
-configure_logging(settings.log_level)
+configure_logging(settings.log_level, fmt=settings.log_format)
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title=settings.app_name)
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    init_db()
+    logger.info("startup db_initialized")
+    await start_http_client()
+    start_background_refresh()
+    start_backfills()
+    start_background_renewal()
+    try:
+        yield
+    finally:
+        await stop_background_renewal()
+        await stop_backfills()
+        await stop_background_refresh()
+        await close_http_client()
+        shutdown_db_executor()
+        logger.info("shutdown complete")
+        stop_logging()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 # Middleware
 app.add_middleware(RequestIdMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 allowed_hosts = settings.allowed_hosts_list
 if not allowed_hosts and settings.app_env == "dev":
     allowed_hosts = ["*"]
@@ -40,17 +69,15 @@ app.include_router(auth_router)
 app.include_router(gmail_router)
 
 
-@app.on_event("startup")
-def _startup() -> None:
-    init_db()
-    logger.info("startup db_initialized")
-
-
 @app.get("/health")
 def health():
     return {"ok": True}
 
 
+if settings.metrics_enabled:
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
+
 # Serve frontend static files
 project_root = Path(__file__).resolve().parents[2]
 frontend_dir_setting = Path(settings.frontend_dir)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Compares two bench.run result files. Exits 1 when any tracked metric regresses by more
+# than --threshold percent, so it can gate CI:  python -m bench.compare base.json new.json
+
+# (path inside a scenario, True when higher is better)
+_METRICS: List[Tuple[str, bool]] = [
+    ("throughput_rps", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+    ("ops_per_second", True),
+]
+
+
+def _lookup(data: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = data
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def _rows(base: Dict[str, Any], new: Dict[str, Any]) -> Iterator[Tuple[str, str, float, float, float, bool]]:
+    for scenario in sorted(set(base["scenarios"]) & set(new["scenarios"])):
+        for path, higher_is_better in _METRICS:
+            before = _lookup(base["scenarios"][scenario], path)
+            after = _lookup(new["scenarios"][scenario], path)
+            if before is None or after is None or before == 0:
+                continue
+            change = (after - before) / before * 100
+            yield scenario, path, before, after, change, higher_is_better
+
+        calls_before = base["scenarios"][scenario].get("upstream_calls") or {}
+        calls_after = new["scenarios"][scenario].get("upstream_calls") or {}
+        for op in sorted(set(calls_before) | set(calls_after)):
+            before, after = float(calls_before.get(op, 0)), float(calls_after.get(op, 0))
+            change = (after - before) / before * 100 if before else (100.0 if after else 0.0)
+            yield scenario, f"upstream_calls.{op}", before, after, change, False
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        new = json.load(f)
+
+    rows = []
+    regressions = 0
+    for scenario, metric, before, after, change, higher_is_better in _rows(base, new):
+        regressed = (-change if higher_is_better else change) > args.threshold
+        regressions += regressed
+        rows.append(
+            {
+                "scenario": scenario,
+                "metric": metric,
+                "baseline": before,
+                "candidate": after,
+                "change_pct": round(change, 2),
+                "regressed": regressed,
+            }
+        )
+
+    if args.json:
+        print(json.dumps({"baseline": base.get("git"), "candidate": new.get("git"), "rows": rows}, indent=2))
+    else:
+        print(f"baseline  {base.get('git', {}).get('commit')}")
+        print(f"candidate {new.get('git', {}).get('commit')}")
+        for r in rows:
+            flag = "  REGRESSION" if r["regressed"] else ""
+            print(
+                f"{r['scenario']:<15} {r['metric']:<32} {r['baseline']:>12.2f} -> "
+                f"{r['candidate']:>12.2f} ({r['change_pct']:+.1f}%){flag}"
+            )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,415 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Local stand-in for the Gmail REST API and Google's OAuth token endpoint, used by the
+# benchmark runner. Only the calls the backend makes are implemented.
+
+_SENDERS = ["alice@example.com", "bob@example.org", "billing@vendor.test", "noreply@service.test"]
+_TOPICS = ["invoice", "meeting", "report", "travel", "newsletter", "security alert", "offer"]
+# Gmail reads date-only after:/before: as midnight Pacific.
+_SEARCH_TZ = ZoneInfo("America/Los_Angeles")
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    mailbox_size: int = 5000
+    token_ttl_seconds: int = 3600
+    seed: int = 1
+
+
+@dataclass
+class FakeMailbox:
+    config: FakeConfig
+    messages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    order: List[str] = field(default_factory=list)
+    threads: Dict[str, List[str]] = field(default_factory=dict)
+    history_id: int = 1000
+    # (history id, message id) for messages added after startup, for history.list.
+    added: List[Tuple[int, str]] = field(default_factory=list)
+    calls: Counter = field(default_factory=Counter)
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.config.seed)
+        now_ms = int(time.time() * 1000)
+        for i in range(self.config.mailbox_size):
+            message = self._make_message(i, now_ms - i * 60_000)
+            self.order.append(message["id"])
+
+    def _make_message(self, i: int, internal_date: int) -> Dict[str, Any]:
+        rng = self._rng
+        message_id = f"{i:016x}"
+        sender = rng.choice(_SENDERS)
+        topic = rng.choice(_TOPICS)
+        self.messages[message_id] = {
+            "id": message_id,
+            "threadId": f"{i // 3:016x}",
+            "labelIds": ["INBOX"] if rng.random() < 0.8 else ["INBOX", "UNREAD"],
+            "snippet": f"About the {topic} #{i}: lorem ipsum dolor sit amet",
+            "historyId": str(self.history_id),
+            "internalDate": str(internal_date),
+            "sizeEstimate": 2048,
+            "payload": {
+                "mimeType": "text/plain",
+                "headers": [
+                    {"name": "From", "value": f"{sender.split('@')[0].title()} <{sender}>"},
+                    {"name": "To", "value": "me@example.com"},
+                    {"name": "Subject", "value": f"{topic.title()} #{i}"},
+                    {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000")},
+                ],
+            },
+        }
+        self.threads.setdefault(self.messages[message_id]["threadId"], []).append(message_id)
+        return self.messages[message_id]
+
+    def deliver(self) -> Dict[str, Any]:
+        # A new message arrives: newest first in listings, recorded in history.
+        self.history_id += 1
+        message = self._make_message(len(self.messages), int(time.time() * 1000))
+        self.order.insert(0, message["id"])
+        self.added.append((self.history_id, message["id"]))
+        return message
+
+    def search(self, q: str) -> List[str]:
+        # Tiny subset of Gmail search: from:<x>, subject:(<x>), after:/before: (YYYY/MM/DD or
+        # epoch seconds) and bare words.
+        terms = q.replace("(", " ").replace(")", " ").split()
+        bounds = [t.split(":", 1) for t in terms if t.startswith(("after:", "before:"))]
+        terms = [t for t in terms if not t.startswith(("after:", "before:"))]
+        if not terms and not bounds:
+            return self.order
+        result = []
+        for message_id in self.order:
+            message = self.messages[message_id]
+            internal_date = int(message["internalDate"])
+            if not all(
+                (internal_date >= _bound_millis(v)) if op == "after" else (internal_date < _bound_millis(v))
+                for op, v in bounds
+            ):
+                continue
+            headers = {h["name"]: h["value"].lower() for h in message["payload"]["headers"]}
+            haystack = f"{headers.get('Subject', '')} {message['snippet'].lower()}"
+            ok = True
+            for term in terms:
+                term = term.lower()
+                if term.startswith("from:"):
+                    ok = term[5:] in headers.get("From", "")
+                elif term.startswith("subject:"):
+                    ok = term[8:] in headers.get("Subject", "")
+                else:
+                    ok = term in haystack
+                if not ok:
+                    break
+            if ok:
+                result.append(message_id)
+        return result
+
+
+def _bound_millis(value: str) -> int:
+    if value.isdigit():
+        return int(value) * 1000
+    day = datetime.strptime(value.replace("-", "/"), "%Y/%m/%d").replace(tzinfo=_SEARCH_TZ)
+    return int(day.timestamp() * 1000)
+
+
+def push_envelope(email: str, history_id: int, *, subscription: Optional[str] = None) -> Dict[str, Any]:
+    # The body Pub/Sub POSTs to a push endpoint for a Gmail watch notification.
+    data = json.dumps({"emailAddress": email, "historyId": history_id}).encode()
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode(),
+            "messageId": f"{random.getrandbits(48)}",
+            "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "subscription": subscription or "projects/bench/subscriptions/gmail-push",
+    }
+
+
+class FakeGoogle:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.mailbox = FakeMailbox(config)
+        self.app = Starlette(
+            routes=[
+                Route("/gmail/v1/users/me/messages", self.list_messages, methods=["GET"]),
+                Route("/gmail/v1/users/me/messages/{message_id}", self.get_message, methods=["GET"]),
+                Route("/gmail/v1/users/me/threads", self.list_threads, methods=["GET"]),
+                Route("/gmail/v1/users/me/threads/{thread_id}", self.get_thread, methods=["GET"]),
+                Route("/gmail/v1/users/me/profile", self.profile, methods=["GET"]),
+                Route("/gmail/v1/users/me/history", self.history, methods=["GET"]),
+                Route("/gmail/v1/users/me/watch", self.watch, methods=["POST"]),
+                Route("/gmail/v1/users/me/stop", self.stop, methods=["POST"]),
+                Route("/batch/gmail/v1", self.batch, methods=["POST"]),
+                Route("/token", self.token, methods=["POST"]),
+                Route("/_stats", self.stats, methods=["GET"]),
+                Route("/_reset", self.reset, methods=["POST"]),
+                Route("/_deliver", self.deliver, methods=["POST"]),
+            ]
+        )
+
+    async def _delay(self) -> None:
+        delay = self.config.latency_ms + random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def _injected_failure(self) -> Optional[Response]:
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self.mailbox.calls["injected_429"] += 1
+            return JSONResponse(
+                {"error": {"code": 429, "message": "Rate limit", "errors": [{"reason": "rateLimitExceeded"}]}},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.mailbox.calls["injected_500"] += 1
+            return JSONResponse({"error": {"code": 500, "message": "Backend error"}}, status_code=500)
+        return None
+
+    async def _call(self, operation: str) -> Optional[Response]:
+        self.mailbox.calls[operation] += 1
+        await self._delay()
+        return self._injected_failure()
+
+    async def list_messages(self, request: Request) -> Response:
+        failure = await self._call("messages.list")
+        if failure:
+            return failure
+        q = request.query_params.get("q", "")
+        page_size = min(int(request.query_params.get("maxResults", 100)), 500)
+        start = int(request.query_params.get("pageToken") or 0)
+        ids = self.mailbox.search(q)
+        page = ids[start : start + page_size]
+        body: Dict[str, Any] = {
+            "messages": [{"id": i, "threadId": self.mailbox.messages[i]["threadId"]} for i in page],
+            "resultSizeEstimate": len(ids),
+        }
+        if start + page_size < len(ids):
+            body["nextPageToken"] = str(start + page_size)
+        return JSONResponse(body)
+
+    def _message_body(self, message_id: str) -> Optional[Dict[str, Any]]:
+        return self.mailbox.messages.get(message_id)
+
+    async def get_message(self, request: Request) -> Response:
+        failure = await self._call("messages.get")
+        if failure:
+            return failure
+        message = self._message_body(request.path_params["message_id"])
+        if message is None:
+            return JSONResponse({"error": {"code": 404, "message": "Not Found"}}, status_code=404)
+        return JSONResponse(message)
+
+    async def list_threads(self, request: Request) -> Response:
+        failure = await self._call("threads.list")
+        if failure:
+            return failure
+        q = request.query_params.get("q", "")
+        page_size = min(int(request.query_params.get("maxResults", 100)), 500)
+        start = int(request.query_params.get("pageToken") or 0)
+        thread_ids = list(dict.fromkeys(self.mailbox.messages[i]["threadId"] for i in self.mailbox.search(q)))
+        page = thread_ids[start : start + page_size]
+        body: Dict[str, Any] = {
+            "threads": [{"id": t, "historyId": str(self.mailbox.history_id)} for t in page],
+            "resultSizeEstimate": len(thread_ids),
+        }
+        if start + page_size < len(thread_ids):
+            body["nextPageToken"] = str(start + page_size)
+        return JSONResponse(body)
+
+    def _thread_body(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        message_ids = self.mailbox.threads.get(thread_id)
+        if message_ids is None:
+            return None
+        # Oldest first, like Gmail.
+        messages = [self.mailbox.messages[i] for i in reversed(message_ids)]
+        return {"id": thread_id, "historyId": str(self.mailbox.history_id), "messages": messages}
+
+    async def get_thread(self, request: Request) -> Response:
+        failure = await self._call("threads.get")
+        if failure:
+            return failure
+        thread = self._thread_body(request.path_params["thread_id"])
+        if thread is None:
+            return JSONResponse({"error": {"code": 404, "message": "Not Found"}}, status_code=404)
+        return JSONResponse(thread)
+
+    async def profile(self, request: Request) -> Response:
+        failure = await self._call("getProfile")
+        if failure:
+            return failure
+        return JSONResponse(
+            {
+                "emailAddress": "bench@example.com",
+                "messagesTotal": len(self.mailbox.messages),
+                "historyId": str(self.mailbox.history_id),
+            }
+        )
+
+    async def history(self, request: Request) -> Response:
+        failure = await self._call("history.list")
+        if failure:
+            return failure
+        start = int(request.query_params.get("startHistoryId") or 0)
+        records = [
+            {
+                "id": str(history_id),
+                "messagesAdded": [
+                    {
+                        "message": {
+                            "id": message_id,
+                            "threadId": self.mailbox.messages[message_id]["threadId"],
+                            "labelIds": self.mailbox.messages[message_id]["labelIds"],
+                        }
+                    }
+                ],
+            }
+            for history_id, message_id in self.mailbox.added
+            if history_id > start
+        ]
+        return JSONResponse({"history": records, "historyId": str(self.mailbox.history_id)})
+
+    async def watch(self, request: Request) -> Response:
+        failure = await self._call("watch")
+        if failure:
+            return failure
+        body = await request.json()
+        if not body.get("topicName"):
+            return JSONResponse({"error": {"code": 400, "message": "topicName required"}}, status_code=400)
+        expiration = int(time.time() * 1000) + 7 * 24 * 3600 * 1000
+        return JSONResponse({"historyId": str(self.mailbox.history_id), "expiration": str(expiration)})
+
+    async def stop(self, request: Request) -> Response:
+        failure = await self._call("stop")
+        if failure:
+            return failure
+        return Response(status_code=204)
+
+    async def deliver(self, request: Request) -> Response:
+        # Test hook: adds `count` new messages, then POSTs one Pub/Sub push notification to
+        # `endpoint` (e.g. http://127.0.0.1:8000/gmail/push?token=...), like Gmail would.
+        count = int(request.query_params.get("count", 1))
+        for _ in range(count):
+            self.mailbox.deliver()
+        envelope = push_envelope(
+            request.query_params.get("email", "bench@example.com"),
+            self.mailbox.history_id,
+            subscription=request.query_params.get("subscription"),
+        )
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            resp = await client.post(request.query_params["endpoint"], json=envelope)
+        return JSONResponse({"history_id": str(self.mailbox.history_id), "push_status": resp.status_code})
+
+    async def batch(self, request: Request) -> Response:
+        failure = await self._call("batch")
+        if failure:
+            return failure
+
+        content_type = request.headers.get("content-type", "")
+        boundary = content_type.split("boundary=", 1)[-1].strip('"')
+        body = (await request.body()).decode("utf-8")
+
+        out: List[str] = []
+        for part in body.split(f"--{boundary}")[1:]:
+            if part.startswith("--"):
+                break
+            lines = part.strip().splitlines()
+            content_id = next(
+                (ln.split(":", 1)[1].strip().strip("<>") for ln in lines if ln.lower().startswith("content-id")),
+                "",
+            )
+            request_line = next((ln for ln in lines if ln.startswith("GET ")), "")
+            resource, _, rest = request_line.split("/users/me/", 1)[-1].partition("/")
+            item_id = rest.split("?", 1)[0].split(" ", 1)[0]
+            self.mailbox.calls["batch.part"] += 1
+
+            body_for = self._thread_body if resource == "threads" else self._message_body
+            status, payload, extra = "200 OK", body_for(item_id), ""
+            if random.random() < self.config.rate_limit_rate:
+                self.mailbox.calls["injected_429"] += 1
+                status, payload, extra = "429 Too Many Requests", {"error": {"code": 429}}, "Retry-After: 1\r\n"
+            elif payload is None:
+                status, payload = "404 Not Found", {"error": {"code": 404, "message": "Not Found"}}
+
+            out.append(
+                f"--batch_response\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json; charset=UTF-8\r\n{extra}\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        out.append("--batch_response--\r\n")
+        return Response(
+            "".join(out),
+            media_type="multipart/mixed; boundary=batch_response",
+        )
+
+    async def token(self, request: Request) -> Response:
+        self.mailbox.calls["oauth.token"] += 1
+        await self._delay()
+        return JSONResponse(
+            {
+                "access_token": f"fake-{random.getrandbits(64):x}",
+                "expires_in": self.config.token_ttl_seconds,
+                "token_type": "Bearer",
+                "scope": "https://www.googleapis.com/auth/gmail.readonly",
+            }
+        )
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse(dict(self.mailbox.calls))
+
+    async def reset(self, request: Request) -> Response:
+        self.mailbox.calls.clear()
+        return JSONResponse({"ok": True})
+
+
+def main() -> None:
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Gmail + OAuth server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=FakeConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeConfig.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=FakeConfig.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=FakeConfig.rate_limit_rate)
+    parser.add_argument("--mailbox-size", type=int, default=FakeConfig.mailbox_size)
+    parser.add_argument("--token-ttl-seconds", type=int, default=FakeConfig.token_ttl_seconds)
+    parser.add_argument("--seed", type=int, default=FakeConfig.seed)
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        mailbox_size=args.mailbox_size,
+        token_ttl_seconds=args.token_ttl_seconds,
+        seed=args.seed,
+    )
+    uvicorn.run(FakeGoogle(config).app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+# Drives the real app (uvicorn subprocess) against bench.fake_google and prints one JSON
+# document per run. Run from backend/:  python -m bench.run --output results.json
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+SCENARIOS = ("messages", "messages_local", "messages_auto", "semantic", "threads", "token_refresh", "to_summary")
+_TOPICS = ["invoice", "meeting", "report", "travel", "newsletter", "offer"]
+_SENDERS = ["alice@example.com", "bob@example.org", "billing@vendor.test"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"server did not become ready: {url}")
+
+
+@contextmanager
+def _process(args: List[str], env: Dict[str, str], ready_url: str) -> Iterator[subprocess.Popen]:
+    proc = subprocess.Popen(args, cwd=BACKEND_DIR, env=env)
+    try:
+        _wait_ready(ready_url)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _summarize(latencies: List[float], statuses: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": ms(_percentile(ordered, 50)),
+            "p95": ms(_percentile(ordered, 95)),
+            "p99": ms(_percentile(ordered, 99)),
+            "mean": ms(statistics.fmean(ordered)) if ordered else 0.0,
+            "max": ms(ordered[-1]) if ordered else 0.0,
+        },
+        "status_codes": statuses,
+    }
+
+
+async def _drive(
+    client: httpx.AsyncClient,
+    paths: List[str],
+    concurrency: int,
+    latencies: Optional[List[float]] = None,
+    statuses: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    latencies = [] if latencies is None else latencies
+    statuses = {} if statuses is None else statuses
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for p in paths:
+        queue.put_nowait(p)
+
+    async def worker() -> None:
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                resp = await client.get(path)
+                await resp.aread()
+                key = str(resp.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def _message_paths(
+    count: int, account_id: int, *, source: str = "gmail", endpoint: str = "messages"
+) -> List[str]:
+    paths = []
+    for i in range(count):
+        topic = _TOPICS[i % len(_TOPICS)]
+        sender = _SENDERS[(i // len(_TOPICS)) % len(_SENDERS)]
+        max_results = 10 + (i // (len(_TOPICS) * len(_SENDERS))) % 40
+        paths.append(
+            f"/gmail/{endpoint}?account_id={account_id}&source={source}&context={topic}"
+            f"&from={sender}&max_results={max_results}"
+        )
+    return paths
+
+
+def _seed_account(db_path: str) -> int:
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    with sqlite3.connect(db_path) as conn:
+        now = datetime.utcnow().isoformat(sep=" ")
+        cur = conn.execute(
+            "INSERT INTO gmail_account_tokens "
+            "(email, access_token, refresh_token, token_type, scope, expires_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'Bearer', '', ?, ?, ?)",
+            ("bench@example.com", "fake-initial", "fake-refresh", expires_at.isoformat(sep=" "), now, now),
+        )
+        return int(cur.lastrowid)
+
+
+def _expire_token(db_path: str, account_id: int) -> None:
+    expired = (datetime.utcnow() - timedelta(seconds=60)).isoformat(sep=" ")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE gmail_account_tokens SET expires_at = ? WHERE id = ?", (expired, account_id))
+
+
+async def _upstream_calls(fake: httpx.AsyncClient, *, reset: bool = False) -> Dict[str, int]:
+    if reset:
+        await fake.post("/_reset")
+        return {}
+    return (await fake.get("/_stats")).json()
+
+
+async def _run_http_scenarios(args: argparse.Namespace, app_url: str, fake_url: str, db_path: str, account_id: int):
+    results: Dict[str, Any] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, timeout=60.0, limits=limits) as client, httpx.AsyncClient(
+        base_url=fake_url, timeout=10.0
+    ) as fake:
+        if "messages" in args.scenarios or "messages_local" in args.scenarios:
+            await _upstream_calls(fake, reset=True)
+            results["messages"] = await _drive(
+                client, _message_paths(args.requests, account_id), args.concurrency
+            )
+            results["messages"]["upstream_calls"] = await _upstream_calls(fake)
+
+        if "messages_local" in args.scenarios:
+            # Local search reads the metadata cache the messages scenario just filled.
+            await _upstream_calls(fake, reset=True)
+            results["messages_local"] = await _drive(
+                client, _message_paths(args.requests, account_id, source="local"), args.concurrency
+            )
+            results["messages_local"]["upstream_calls"] = await _upstream_calls(fake)
+
+        if "messages_auto" in args.scenarios:
+            # The query planner after a full sync: the synced (recent) window is answered
+            # locally, only older mail goes upstream.
+            await client.post(f"/gmail/sync?account_id={account_id}&full=true")
+            await _upstream_calls(fake, reset=True)
+            plans: Dict[str, int] = {}
+
+            async def _count_plan(resp: httpx.Response) -> None:
+                if resp.status_code == 200:
+                    await resp.aread()
+                    plan = resp.json()["explain"]["plan"]
+                    plans[plan] = plans.get(plan, 0) + 1
+
+            client.event_hooks = {"response": [_count_plan]}
+            results["messages_auto"] = await _drive(
+                client, _message_paths(args.requests, account_id, source="auto"), args.concurrency
+            )
+            client.event_hooks = {}
+            results["messages_auto"]["plans"] = plans
+            results["messages_auto"]["upstream_calls"] = await _upstream_calls(fake)
+
+        if "semantic" in args.scenarios:
+            # Embedding top-k over the synced mirror, three reformulations per request.
+            await client.post(f"/gmail/sync?account_id={account_id}&full=true")
+            await _upstream_calls(fake, reset=True)
+            paths = []
+            for i in range(args.requests):
+                topic = _TOPICS[i % len(_TOPICS)]
+                sender = _SENDERS[(i // len(_TOPICS)) % len(_SENDERS)]
+                paths.append(
+                    f"/gmail/semantic?account_id={account_id}&k=20"
+                    f"&q={topic}s from {sender}&q={topic}&q=about the {topic}"
+                )
+            results["semantic"] = await _drive(client, paths, args.concurrency)
+            results["semantic"]["upstream_calls"] = await _upstream_calls(fake)
+
+        if "threads" in args.scenarios:
+            # Same queries grouped by conversation: one threads.get per thread instead of
+            # one messages.get per message.
+            await _upstream_calls(fake, reset=True)
+            results["threads"] = await _drive(
+                client, _message_paths(args.requests, account_id, endpoint="threads"), args.concurrency
+            )
+            results["threads"]["upstream_calls"] = await _upstream_calls(fake)
+
+        if "token_refresh" in args.scenarios:
+            # Each round expires the stored token and fires a burst of requests that all
+            # need a fresh one; upstream oauth.token calls show how well refreshes coalesce.
+            await _upstream_calls(fake, reset=True)
+            latencies: List[float] = []
+            statuses: Dict[str, int] = {}
+            started = time.perf_counter()
+            for round_no in range(args.refresh_rounds):
+                _expire_token(db_path, account_id)
+                paths = _message_paths(args.concurrency, account_id)
+                paths = [f"{p}&r={round_no}" for p in paths]
+                await _drive(client, paths, args.concurrency, latencies, statuses)
+            results["token_refresh"] = _summarize(latencies, statuses, time.perf_counter() - started)
+            results["token_refresh"]["rounds"] = args.refresh_rounds
+            results["token_refresh"]["upstream_calls"] = await _upstream_calls(fake)
+    return results
+
+
+def _run_to_summary(iterations: int, mailbox_size: int) -> Dict[str, Any]:
+    # In-process: to_summary is CPU-only, so HTTP overhead would only add noise.
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.gmail.client import to_summary
+    from bench.fake_google import FakeConfig, FakeMailbox
+
+    mailbox = FakeMailbox(FakeConfig(mailbox_size=min(mailbox_size, 1000)))
+    messages = list(mailbox.messages.values())
+    timings: List[float] = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for i in range(iterations):
+            to_summary(messages[i % len(messages)])
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "iterations": iterations,
+        "best_seconds": round(best, 6),
+        "ops_per_second": round(iterations / best, 1),
+        "ns_per_op": round(best / iterations * 1e9, 1),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    fake_port, app_port = _free_port(), _free_port()
+    fake_url, app_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{app_port}"
+
+    result: Dict[str, Any] = {
+        "git": _git_revision(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "scenarios": {},
+    }
+
+    http_scenarios = [s for s in args.scenarios if s != "to_summary"]
+    if http_scenarios:
+        with tempfile.TemporaryDirectory(prefix="gmail-bench-") as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{db_path}",
+                "SEMANTIC_INDEX_DIR": os.path.join(tmp, "semantic_index"),
+                "GMAIL_API_BASE": f"{fake_url}/gmail/v1",
+                "GMAIL_BATCH_URL": f"{fake_url}/batch/gmail/v1",
+                "GOOGLE_TOKEN_URL": f"{fake_url}/token",
+                "GOOGLE_CLIENT_ID": "bench",
+                "GOOGLE_CLIENT_SECRET": "bench",
+                "ALLOWED_HOSTS": "127.0.0.1,localhost",
+                "LOG_LEVEL": args.app_log_level,
+                "TOKEN_BACKGROUND_REFRESH_ENABLED": "false",
+                # Otherwise repeated queries measure the cache, not the request path.
+                "QUERY_CACHE_ENABLED": "true" if args.query_cache else "false",
+                # token_refresh expires the token in SQLite behind the app's back, which
+                # the in-process account/token cache would otherwise hide.
+                "TOKEN_CACHE_TTL_SECONDS": "0" if "token_refresh" in args.scenarios else "15",
+            }
+            for item in args.app_env:
+                key, _, value = item.partition("=")
+                env[key] = value
+
+            fake_cmd = [
+                sys.executable, "-m", "bench.fake_google",
+                "--port", str(fake_port),
+                "--latency-ms", str(args.latency_ms),
+                "--jitter-ms", str(args.jitter_ms),
+                "--error-rate", str(args.error_rate),
+                "--rate-limit-rate", str(args.rate_limit_rate),
+                "--mailbox-size", str(args.mailbox_size),
+            ]  # fmt: skip
+            app_cmd = [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", "127.0.0.1", "--port", str(app_port),
+                "--log-level", "warning", "--no-access-log",
+            ]  # fmt: skip
+
+            with _process(fake_cmd, dict(os.environ), f"{fake_url}/_stats"), _process(
+                app_cmd, env, f"{app_url}/health"
+            ):
+                account_id = _seed_account(db_path)
+                result["scenarios"].update(
+                    asyncio.run(_run_http_scenarios(args, app_url, fake_url, db_path, account_id))
+                )
+
+    if "to_summary" in args.scenarios:
+        result["scenarios"]["to_summary"] = _run_to_summary(args.summary_iterations, args.mailbox_size)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the backend against a fake Gmail server")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--refresh-rounds", type=int, default=5)
+    parser.add_argument("--summary-iterations", type=int, default=50000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--mailbox-size", type=int, default=5000)
+    parser.add_argument("--query-cache", action="store_true", help="leave the /gmail/messages query cache on")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--app-log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
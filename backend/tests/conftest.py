@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import os
+import tempfile
+
+# Settings are read once per process, so point everything at a scratch directory before
+# any app module is imported.
+_SCRATCH = tempfile.mkdtemp(prefix="gmail_agents_tests_")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_SCRATCH}/test.db",
+    ATTACHMENT_STORE_DIR=f"{_SCRATCH}/attachments",
+    SEMANTIC_INDEX_DIR=f"{_SCRATCH}/semantic_index",
+    GMAIL_API_BASE="http://fake/gmail/v1",
+    GMAIL_BATCH_URL="http://fake/batch/gmail/v1",
+    GOOGLE_TOKEN_URL="http://fake/token",
+    TOKEN_BACKGROUND_REFRESH_ENABLED="false",
+    LOG_LEVEL="WARNING",
+)
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from app.db import fts  # noqa: E402
+from app.db.session import engine, init_db  # noqa: E402
+from app.gmail import http as gmail_http  # noqa: E402
+from app.gmail import tokens  # noqa: E402
+
+
+@pytest.fixture
+def session():
+    # A fresh schema per test: every table emptied, caches that outlive a request reset.
+    init_db()
+    with Session(engine) as db:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            db.exec(text(f"DELETE FROM {table.name}"))
+        db.exec(text(f"DELETE FROM {fts.FTS_TABLE}"))
+        db.commit()
+    tokens.invalidate_account_cache()
+    with Session(engine, expire_on_commit=False) as db:
+        yield db
+
+
+@pytest.fixture
+def fake_gmail(monkeypatch):
+    # The benchmark's Gmail/OAuth stand-in, served in process through the shared client.
+    from bench.fake_google import FakeConfig, FakeGoogle
+
+    fake = FakeGoogle(FakeConfig(latency_ms=0, jitter_ms=0, mailbox_size=20))
+    monkeypatch.setattr(
+        gmail_http, "_build_client", lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+    )
+    monkeypatch.setattr(gmail_http, "_client", None)
+    yield fake
+    monkeypatch.setattr(gmail_http, "_client", None)
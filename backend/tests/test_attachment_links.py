@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import routes_gmail
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailAccountToken, GmailMessageMetadata
+from app.gmail import client as gmail_client
+
+ATTACHMENTS = {"att-a": b"first attachment", "att-b": b"second attachment"}
+
+
+@pytest.fixture
+def account(session, monkeypatch):
+    async def fake_token(account):
+        return "t"
+
+    async def fake_stream(access_token, message_id, attachment_id, *, max_bytes, chunk_size):
+        async def chunks():
+            yield ATTACHMENTS[attachment_id]
+
+        return chunks()
+
+    monkeypatch.setattr(routes_gmail, "_get_valid_access_token", fake_token)
+    monkeypatch.setattr(gmail_client, "stream_attachment", fake_stream)
+    return crud.upsert_account_token(session, GmailAccountToken(email="a@x", access_token="t"))
+
+
+def _download(account, attachment_id: str, part_id=None):
+    async def call():
+        response = await routes_gmail.download_attachment(
+            message_id="m",
+            attachment_id=attachment_id,
+            part_id=part_id,
+            filename=None,
+            mime_type="application/octet-stream",
+            account_id=account.id,
+            email=None,
+            settings=get_settings(),
+        )
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        return response.headers["X-Attachment-Store"], body
+
+    return asyncio.run(call())
+
+
+def _linked_sha(session, account, part_id: str):
+    blob = crud.get_linked_attachment(session, account.id, "m", part_id, touch=False)
+    return blob.sha256 if blob is not None else None
+
+
+def test_unlisted_attachment_is_served_but_not_linked(session, account):
+    assert _download(account, "att-b", part_id="1") == ("miss", ATTACHMENTS["att-b"])
+    assert _linked_sha(session, account, "1") is None
+
+
+def test_listed_parts_are_linked_and_mismatches_rejected(session, account):
+    crud.save_attachment_refs(session, account.id, "m", {"att-a": "1", "att-b": "2"})
+
+    assert _download(account, "att-a", part_id="1") == ("miss", ATTACHMENTS["att-a"])
+    with pytest.raises(HTTPException) as e:
+        _download(account, "att-b", part_id="1")
+    assert e.value.status_code == 400
+
+    # Part 1 still points at A's bytes; B is linked under its own part id.
+    assert _linked_sha(session, account, "1") == hashlib.sha256(ATTACHMENTS["att-a"]).hexdigest()
+    assert _download(account, "att-b") == ("miss", ATTACHMENTS["att-b"])
+    assert _download(account, "att-b", part_id="2") == ("hit", ATTACHMENTS["att-b"])
+
+
+def test_existing_link_is_never_moved(session, account):
+    link = {"account_id": account.id, "message_id": "m", "part_id": "1", "filename": None}
+    sha_a = hashlib.sha256(b"a").hexdigest()
+    sha_b = hashlib.sha256(b"b").hexdigest()
+    crud.put_attachment_blob(session, sha256=sha_a, size=1, mime_type=None, link=link)
+    crud.put_attachment_blob(session, sha256=sha_b, size=1, mime_type=None, link=link)
+
+    assert _linked_sha(session, account, "1") == sha_a
+    assert crud.get_attachment_blob(session, sha_a).refcount == 1
+    assert crud.get_attachment_blob(session, sha_b).refcount == 0
+
+
+def test_evicted_messages_release_their_attachments(session, account):
+    now = datetime.utcnow()
+    for message_id, age in (("old", timedelta(days=100)), ("over", timedelta(days=2)), ("new", timedelta(0))):
+        session.add(GmailMessageMetadata(account_id=account.id, message_id=message_id, cached_at=now - age))
+    session.commit()
+    sha = hashlib.sha256(b"shared").hexdigest()
+    for message_id in ("old", "over", "new"):
+        link = {"account_id": account.id, "message_id": message_id, "part_id": "1", "filename": None}
+        crud.put_attachment_blob(session, sha256=sha, size=6, mime_type=None, link=link)
+    crud.save_attachment_refs(session, account.id, "old", {"att-a": "1"})
+
+    # "old" is past the age limit, "over" the oldest row above the row limit.
+    removed = crud.evict_cached_messages(session, account.id, max_rows=1, max_age=timedelta(days=30))
+
+    assert removed == 2
+    assert crud.get_cached_message_ids(session, account.id) == {"new"}
+    assert crud.get_attachment_blob(session, sha).refcount == 1
+    assert crud.get_linked_attachment(session, account.id, "old", "1", touch=False) is None
+    assert crud.get_attachment_ref(session, account.id, "old", "att-a") is None
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.gmail import client as gmail_client
+
+
+def test_per_message_wrappers_go_through_the_batch_endpoint(fake_gmail):
+    ids = fake_gmail.mailbox.order[:3]
+
+    async def fetch():
+        many = await gmail_client.get_messages_metadata("t", ids + ["missing"])
+        one = await gmail_client.get_message_metadata("t", ids[0])
+        with pytest.raises(gmail_client.GmailApiError):
+            await gmail_client.get_message_metadata("t", "missing")
+        return many, one
+
+    many, one = asyncio.run(fetch())
+
+    assert [m["id"] for m in many[:3]] == ids
+    assert isinstance(many[3], gmail_client.GmailApiError) and many[3].status_code == 404
+    assert one["id"] == ids[0]
+    assert fake_gmail.mailbox.calls["messages.get"] == 0
+    assert fake_gmail.mailbox.calls["batch"] == 3
+
+
+def test_parse_batch_response_maps_parts_by_content_id():
+    body = (
+        b"--batch_x\r\nContent-Type: application/http\r\nContent-ID: <response-item-0>\r\n\r\n"
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n"
+        b'{"id": "m1"}\r\n'
+        b"--batch_x\r\nContent-Type: application/http\r\nContent-ID: <response-item-1>\r\n\r\n"
+        b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 3\r\n\r\n"
+        b'{"error": {"code": 429}}\r\n'
+        b"--batch_x--\r\n"
+    )
+    parts = gmail_client.parse_batch_response('multipart/mixed; boundary="batch_x"', body)
+
+    assert parts["item-0"] == (200, {"content-type": "application/json"}, b'{"id": "m1"}')
+    status, headers, _ = parts["item-1"]
+    assert (status, headers["retry-after"]) == (429, "3")
+
+
+def test_parse_batch_response_requires_a_boundary():
+    with pytest.raises(ValueError):
+        gmail_client.parse_batch_response("multipart/mixed", b"")
+
+
+def test_only_throttled_parts_are_retried(monkeypatch):
+    sent = []
+    throttled_once = {"b", "c"}
+
+    async def fake_send_batch(access_token, requests, *, operation):
+        sent.append(sorted(requests))
+        results = {}
+        for key in requests:
+            if key in throttled_once:
+                throttled_once.discard(key)
+                results[key] = gmail_client.GmailApiError(429, "slow down", retry_after=0.0)
+            elif key == "d":
+                results[key] = gmail_client.GmailApiError(403, "rate", reason="userRateLimitExceeded")
+            else:
+                results[key] = {"id": key}
+        return results
+
+    monkeypatch.setattr(gmail_client, "_send_batch", fake_send_batch)
+    monkeypatch.setattr(gmail_client.quota, "backoff_delay", lambda attempt, retry_after=None: 0.0)
+
+    results = asyncio.run(
+        gmail_client._fetch_batch("t", ["a", "b", "c", "d"], str, operation="messages.get", max_retries=2)
+    )
+
+    assert sent == [["a", "b", "c", "d"], ["b", "c", "d"], ["d"]]
+    assert [results[key] for key in "abc"] == [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    # Still throttled after max_retries: returned in place, not raised.
+    assert isinstance(results["d"], gmail_client.GmailApiError) and results["d"].status_code == 403
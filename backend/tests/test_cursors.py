@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import routes_gmail
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailAccountToken
+from app.gmail import cache as message_cache
+from app.gmail import client as gmail_client
+
+
+def test_cursor_round_trips_the_page_token():
+    cursor = routes_gmail._encode_cursor(1, "from:a@x", "token-42")
+    assert "=" not in cursor
+    assert routes_gmail._decode_cursor(cursor, 1, "from:a@x") == "token-42"
+
+
+@pytest.mark.parametrize("account_id, q", [(2, "from:a@x"), (1, "from:b@x")])
+def test_cursor_is_bound_to_account_and_query(account_id, q):
+    cursor = routes_gmail._encode_cursor(1, "from:a@x", "token-42")
+    with pytest.raises(HTTPException) as e:
+        routes_gmail._decode_cursor(cursor, account_id, q)
+    assert e.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30", "W10"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as e:
+        routes_gmail._decode_cursor(cursor, 1, "q")
+    assert (e.value.status_code, e.value.detail) == (400, "Invalid cursor")
+
+
+def test_iter_message_ids_pages_through_and_stops_at_limit(fake_gmail):
+    async def collect(**kwargs):
+        return [mid async for mid in gmail_client.iter_message_ids("t", page_size=6, **kwargs)]
+
+    assert asyncio.run(collect()) == fake_gmail.mailbox.order
+    fake_gmail.mailbox.calls.clear()
+    assert asyncio.run(collect(limit=8)) == fake_gmail.mailbox.order[:8]
+    # The page after the limit is never requested.
+    assert fake_gmail.mailbox.calls["messages.list"] == 2
+
+
+def _fetch_local(account_id: int, cursor=None) -> dict:
+    response = asyncio.run(
+        routes_gmail.fetch_messages(
+            from_email="alice@example.com",
+            date_after=None,
+            context=None,
+            context_field="subject",
+            max_results=2,
+            account_id=account_id,
+            email=None,
+            source="local",
+            cursor=cursor,
+            fields=None,
+            settings=get_settings(),
+        )
+    )
+    return json.loads(response.body)
+
+
+def test_local_source_pages_by_cursor(session):
+    account = crud.upsert_account_token(session, GmailAccountToken(email="a@x", access_token="t"))
+    summaries = [
+        gmail_client.MessageSummary(
+            id=f"m{i}",
+            thread_id=f"m{i}",
+            snippet=None,
+            from_email="alice@example.com",
+            subject=f"note {i}",
+            date=None,
+            internal_date=1000 * i,
+        )
+        for i in range(5)
+    ]
+    message_cache.store_summaries(session, account.id, summaries)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = _fetch_local(account.id, cursor)
+        seen += [m["id"] for m in page["messages"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"m{i}" for i in range(5)]
+    assert pages == 3
+
+    # A Gmail page token is not a local offset.
+    foreign = routes_gmail._encode_cursor(account.id, "local:from:alice@example.com", "CAIQAA")
+    with pytest.raises(HTTPException) as e:
+        _fetch_local(account.id, foreign)
+    assert e.value.status_code == 400
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlmodel import select
+
+from app.db import crud
+from app.db.models import GmailAccountToken, GmailMessageMetadata
+from app.gmail import cache as message_cache
+from app.gmail import client as gmail_client
+from app.gmail import sync as gmail_sync
+
+
+def _account(session) -> GmailAccountToken:
+    return crud.upsert_account_token(session, GmailAccountToken(email="a@x", access_token="t"))
+
+
+def _cache(session, account_id: int, messages, *, age: timedelta = timedelta(0)) -> None:
+    message_cache.store_summaries(session, account_id, [gmail_client.to_summary(m) for m in messages])
+    for message in messages:
+        row = crud.get_cached_messages(session, account_id, [message["id"]])[message["id"]]
+        row.cached_at = datetime.utcnow() - age
+        session.add(row)
+    session.commit()
+
+
+def _cached_rows(session, account_id: int):
+    session.expire_all()
+    return session.exec(select(GmailMessageMetadata).where(GmailMessageMetadata.account_id == account_id)).all()
+
+
+def test_full_sync_keeps_cached_rows_older_than_max_age(session, fake_gmail):
+    account = _account(session)
+    mailbox = fake_gmail.mailbox
+    old = [mailbox.messages[mid] for mid in mailbox.order[-3:]]
+    _cache(session, account.id, old, age=timedelta(days=100))
+
+    result = asyncio.run(gmail_sync.sync_account(account, "t", full=True))
+
+    assert result.errors == 0
+    assert {r.message_id for r in _cached_rows(session, account.id)} == set(mailbox.order)
+    coverage = crud.get_sync_coverage(session, account.id)
+    assert coverage is not None and coverage.covered_since == 0
+    # Only the uncached ids got full metadata; the cached ones had their labels reread.
+    assert mailbox.calls["batch.part"] == len(mailbox.order)
+
+
+def test_full_sync_refreshes_labels_of_cached_rows(session, fake_gmail):
+    account = _account(session)
+    message = fake_gmail.mailbox.messages[fake_gmail.mailbox.order[0]]
+    message["labelIds"] = ["INBOX", "UNREAD"]
+    _cache(session, account.id, [message])
+    # Read and archived in Gmail while history was unavailable.
+    message["labelIds"] = ["IMPORTANT"]
+
+    asyncio.run(gmail_sync.sync_account(account, "t", full=True))
+
+    rows = {r.message_id: r for r in _cached_rows(session, account.id)}
+    assert rows[message["id"]].label_ids == "IMPORTANT"
+
+
+def test_full_sync_drops_coverage_when_listed_rows_are_evicted(session, fake_gmail, monkeypatch):
+    account = _account(session)
+    # Eviction that drops a listed row while storing: that row must not count as covered.
+    original = crud.evict_cached_messages
+
+    def evict_one(session, account_id, **kwargs):
+        original(session, account_id, **kwargs)
+        victim = fake_gmail.mailbox.order[5]
+        return crud.delete_cached_messages(session, account_id, [victim])
+
+    monkeypatch.setattr(crud, "evict_cached_messages", evict_one)
+
+    asyncio.run(gmail_sync.sync_account(account, "t", full=True))
+
+    assert crud.get_sync_coverage(session, account.id) is None
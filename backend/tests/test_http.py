@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from app.core.config import get_settings
+from app.gmail import http as gmail_http
+
+
+def test_start_logs_http2_as_applied(monkeypatch, caplog):
+    # HTTP/2 requested but h2 is not installed: the client falls back to HTTP/1.1.
+    monkeypatch.setattr(get_settings(), "http_http2", True)
+    monkeypatch.setattr(gmail_http, "_http2_available", lambda: False)
+    monkeypatch.setattr(gmail_http, "_client", None)
+
+    async def start_and_close():
+        await gmail_http.start_http_client()
+        await gmail_http.close_http_client()
+
+    with caplog.at_level(logging.INFO, logger=gmail_http.logger.name):
+        asyncio.run(start_and_close())
+
+    assert "http_client started http2=False" in caplog.messages
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.models import GmailSyncCoverage, GmailSyncState, GmailWatch
+from app.gmail import planner
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def _state(synced_ago: timedelta) -> GmailSyncState:
+    return GmailSyncState(account_id=1, history_id="500", last_synced_at=NOW - synced_ago)
+
+
+def _watch(*, label_ids=None, notified_ago=None, expires_in=timedelta(days=3)) -> GmailWatch:
+    return GmailWatch(
+        account_id=1,
+        topic_name="projects/p/topics/t",
+        label_ids=label_ids,
+        expires_at=NOW + expires_in,
+        last_notification_at=NOW - notified_ago if notified_ago is not None else None,
+    )
+
+
+def test_recent_sync_is_fresh_without_a_watch():
+    assert planner._freshness(_state(timedelta(seconds=30)), None, NOW) == "recent_sync"
+    assert planner._freshness(_state(timedelta(minutes=30)), None, NOW) is None
+
+
+def test_unfiltered_watch_keeps_mirror_fresh_up_to_the_push_limit():
+    watch = _watch(notified_ago=timedelta(hours=2))
+    assert planner._freshness(_state(timedelta(minutes=30)), watch, NOW) == "push_watch"
+    # No notification (or sync) for longer than the push limit: pushes may have stopped.
+    assert planner._freshness(_state(timedelta(hours=3)), watch, NOW) is None
+
+
+def test_label_filtered_watch_does_not_vouch_for_the_mirror():
+    watch = _watch(label_ids="INBOX")
+    assert planner._freshness(_state(timedelta(minutes=30)), watch, NOW) is None
+
+
+def test_pending_notification_or_expired_watch_is_stale():
+    pending = _watch(notified_ago=timedelta(minutes=5))
+    assert planner._freshness(_state(timedelta(minutes=30)), pending, NOW) is None
+    expired = _watch(expires_in=timedelta(seconds=-1))
+    assert planner._freshness(_state(timedelta(minutes=30)), expired, NOW) is None
+
+
+def test_choose_plan_falls_back_upstream_when_only_a_filtered_watch_is_set():
+    query = planner.parse_query(from_email="alice@example.com")
+    coverage = GmailSyncCoverage(account_id=1, covered_since=0, source="full_sync")
+    plan = planner.choose_plan(
+        query, coverage, _state(timedelta(minutes=30)), _watch(label_ids="INBOX"), now=NOW
+    )
+    assert (plan.mode, plan.reason) == ("upstream", "stale_mirror")
+
+
+def _covered(since_ms: int) -> GmailSyncCoverage:
+    return GmailSyncCoverage(account_id=1, covered_since=since_ms, source="backfill")
+
+
+def test_choose_plan_upstream_without_coverage_or_for_unsupported_terms():
+    fresh = _state(timedelta(seconds=30))
+    plan = planner.choose_plan(planner.parse_query(from_email="alice@example.com"), None, fresh, None, now=NOW)
+    assert (plan.mode, plan.reason) == ("upstream", "no_coverage")
+
+    query = planner.parse_query(context="invoice", context_field="any")
+    plan = planner.choose_plan(query, _covered(0), fresh, None, now=NOW)
+    assert (plan.mode, plan.reason) == ("upstream", "unsupported_locally")
+
+
+def test_choose_plan_is_local_when_the_whole_range_is_covered():
+    fresh = _state(timedelta(seconds=30))
+    plan = planner.choose_plan(planner.parse_query(from_email="a@x"), _covered(0), fresh, None, now=NOW)
+    assert (plan.mode, plan.reason, plan.boundary_ms) == ("local", "covered", 0)
+    assert plan.coverage["complete"] and plan.coverage["fresh_via"] == "recent_sync"
+
+
+def test_choose_plan_splits_at_a_whole_second_boundary():
+    query = planner.parse_query(from_email="a@x")
+    plan = planner.choose_plan(query, _covered(1_700_000_000_500), _state(timedelta(seconds=30)), None, now=NOW)
+    assert (plan.mode, plan.reason, plan.boundary_ms) == ("split", "partially_covered", 1_700_000_001_000)
+    assert planner.upstream_query(query, plan) == f"{query.gmail_query} before:1700000001"
+    assert planner.local_range(query, plan) == (1_700_000_001_000, None)
+
+
+def test_plan_for_boundary_picks_the_side_holding_the_range():
+    boundary = 1_700_000_000_000
+    after = planner.parse_query(context="after:2024/01/01")
+    assert after.after_ms >= boundary
+    assert planner.plan_for_boundary(after, boundary, reason="covered").mode == "local"
+
+    before = planner.parse_query(context="before:2023/01/01")
+    assert before.before_ms <= boundary
+    plan = planner.plan_for_boundary(before, boundary, reason="covered")
+    assert (plan.mode, plan.reason) == ("upstream", "outside_coverage")
+
+    plan = planner.plan_for_boundary(before, None, reason="stale_mirror")
+    assert (plan.mode, plan.reason) == ("upstream", "stale_mirror")
+
+
+def test_position_round_trip():
+    assert planner.decode_position(planner.encode_position("l", 1_700_000_000_000, 40)) == (
+        "l",
+        1_700_000_000_000,
+        "40",
+    )
+    # Upstream page tokens may contain the separator.
+    assert planner.decode_position(planner.encode_position("u", None, "tok:en")) == ("u", None, "tok:en")
+
+
+@pytest.mark.parametrize("position", ["x:1:2", "l::5", "l:1:", "l:1:abc", "garbage"])
+def test_decode_position_rejects_malformed_positions(position):
+    with pytest.raises(ValueError):
+        planner.decode_position(position)
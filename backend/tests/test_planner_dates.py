@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+
+from app.db import fts
+from app.gmail import planner
+
+
+def _millis(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def test_date_only_bounds_use_gmail_pacific_midnight():
+    # 2024-03-11 00:00 PDT is 07:00 UTC (DST started the day before).
+    assert fts.day_start_millis(date(2024, 3, 11)) == _millis(datetime(2024, 3, 11, 7, tzinfo=timezone.utc))
+    # Winter: 00:00 PST is 08:00 UTC.
+    assert fts.day_start_millis(date(2024, 1, 5)) == _millis(datetime(2024, 1, 5, 8, tzinfo=timezone.utc))
+
+
+def test_message_near_midnight_lands_on_the_same_side_as_gmail():
+    query = planner.parse_query(context="after:2024/03/11 before:2024/03/12")
+    assert not query.unsupported
+
+    # 03:00 UTC on the 11th is still the 10th in Pacific time: Gmail leaves it out.
+    late_evening = _millis(datetime(2024, 3, 11, 3, tzinfo=timezone.utc))
+    assert late_evening < query.after_ms
+    # 03:00 UTC on the 12th is the evening of the 11th in Pacific time: Gmail includes it.
+    next_evening = _millis(datetime(2024, 3, 12, 3, tzinfo=timezone.utc))
+    assert query.after_ms <= next_evening < query.before_ms
+
+
+def test_after_date_parameter_matches_after_operator():
+    from_param = planner.parse_query(after_date=date(2024, 3, 11))
+    from_operator = planner.parse_query(context="after:2024/03/11")
+    assert from_param.after_ms == from_operator.after_ms == fts.day_start_millis(date(2024, 3, 11))
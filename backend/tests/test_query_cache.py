@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.gmail import query_cache
+
+
+def _cache(kind: str, *, ttl: float = 60.0, max_entries: int = 100) -> query_cache.QueryCache:
+    backend_cls = query_cache.DatabaseBackend if kind == "db" else query_cache.MemoryBackend
+    return query_cache.QueryCache(backend_cls(max_entries), ttl_seconds=ttl)
+
+
+@pytest.fixture(params=["memory", "db"])
+def backend_kind(request, session):
+    return request.param
+
+
+def test_key_normalizes_case_and_whitespace():
+    assert query_cache.make_key(1, "From:A@x  subject:(Hi)", 10) == query_cache.make_key(
+        1, " from:a@x subject:(hi) ", 10
+    )
+    base = query_cache.make_key(1, "q", 10)
+    assert base != query_cache.make_key(2, "q", 10)
+    assert base != query_cache.make_key(1, "q", 20)
+    assert base != query_cache.make_key(1, "q", 10, cursor="c")
+    assert base != query_cache.make_key(1, "q", 10, fields=("id",))
+
+
+def test_new_history_id_invalidates_only_that_accounts_older_entries(backend_kind):
+    async def run():
+        cache = _cache(backend_kind)
+        await cache.note_history_id(1, "100")
+        await cache.set(1, "a-old", {"n": 1})
+        await cache.set(2, "b", {"n": 2})
+
+        await cache.note_history_id(1, "101")
+        await cache.set(1, "a-new", {"n": 3})
+        return cache, [await cache.get(1, "a-old"), await cache.get(2, "b"), await cache.get(1, "a-new")]
+
+    cache, results = asyncio.run(run())
+    assert results == [None, {"n": 2}, {"n": 3}]
+    assert cache.invalidations == 1
+
+
+def test_repeated_history_id_keeps_entries(backend_kind):
+    async def run():
+        cache = _cache(backend_kind)
+        await cache.note_history_id(1, "100")
+        await cache.set(1, "k", {"n": 1})
+        await cache.note_history_id(1, "100")
+        await cache.note_history_id(1, None)
+        return await cache.get(1, "k")
+
+    assert asyncio.run(run()) == {"n": 1}
+
+
+def test_entry_from_another_workers_older_history_is_a_miss(session):
+    # Two workers sharing the database: the one that saw a newer history id ignores
+    # entries the other cached before the change, even before they are deleted.
+    async def run():
+        first, second = _cache("db"), _cache("db")
+        await first.note_history_id(1, "100")
+        await first.set(1, "k", {"n": 1})
+        second._history[1] = "101"
+        return await first.get(1, "k"), await second.get(1, "k")
+
+    assert asyncio.run(run()) == ({"n": 1}, None)
+
+
+def test_expired_and_least_recently_used_entries_are_dropped():
+    async def run():
+        expired = _cache("memory", ttl=-1)
+        await expired.set(1, "k", {"n": 1})
+
+        small = _cache("memory", max_entries=2)
+        await small.set(1, "a", {"n": 1})
+        await small.set(1, "b", {"n": 2})
+        await small.get(1, "a")
+        await small.set(1, "c", {"n": 3})
+        return await expired.get(1, "k"), [await small.get(1, k) for k in "abc"], small
+
+    missing, results, small = asyncio.run(run())
+    assert missing is None
+    assert results == [{"n": 1}, None, {"n": 3}]
+    assert small.stats()["evictions"] == 1
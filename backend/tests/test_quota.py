@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import types
+
+import pytest
+
+from app.gmail import client as gmail_client
+from app.gmail import quota
+
+
+class FakeClock:
+    # Stands in for time.monotonic and asyncio.sleep inside quota, so waits are instant
+    # and exactly measurable.
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        self.slept += seconds
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(quota, "time", types.SimpleNamespace(monotonic=fake.monotonic))
+    monkeypatch.setattr(quota, "asyncio", types.SimpleNamespace(sleep=fake.sleep, Lock=asyncio.Lock))
+    return fake
+
+
+def test_burst_is_free_then_requests_wait_for_refill(clock):
+    async def run():
+        bucket = quota.TokenBucket(rate=10, capacity=20)
+        await bucket.acquire(15)
+        assert clock.slept == 0
+        await bucket.acquire(10)  # 5 left, 5 more at 10 units/s
+        assert clock.slept == pytest.approx(0.5)
+        return bucket
+
+    bucket = asyncio.run(run())
+    assert (bucket.acquired, bucket.units) == (2, 25)
+
+
+def test_oversized_request_waits_for_a_full_bucket_and_goes_negative(clock):
+    async def run():
+        bucket = quota.TokenBucket(rate=10, capacity=20)
+        await bucket.acquire(15)
+        await bucket.acquire(50)  # waits for 20 tokens, then owes 30
+        first = clock.slept
+        await bucket.acquire(10)  # must repay the debt first
+        return first, clock.slept - first
+
+    first, second = asyncio.run(run())
+    assert first == pytest.approx(1.5)
+    assert second == pytest.approx(4.0)
+
+
+def test_pause_holds_requests_until_it_ends(clock):
+    async def run():
+        bucket = quota.TokenBucket(rate=10, capacity=20)
+        bucket.pause(3.0)
+        await bucket.acquire(1)
+        return bucket
+
+    bucket = asyncio.run(run())
+    assert clock.slept == pytest.approx(3.0)
+    assert bucket.stats()["throttled"] == 1
+
+
+def test_cost_uses_gmail_units_per_method():
+    assert quota.cost("messages.get", 50) == 250
+    assert quota.cost("history.list") == 2
+    assert quota.cost("unknown.method") == 5
+
+
+def test_unbound_calls_are_keyed_by_token():
+    key = contextvars.Context().run(quota.account_key, "secret")
+    assert key.startswith("token:") and "secret" not in key
+
+
+def test_calls_are_charged_to_the_bound_account(fake_gmail, monkeypatch):
+    scheduler = quota.QuotaScheduler()
+    monkeypatch.setattr(quota, "scheduler", scheduler)
+
+    async def run():
+        quota.bind_account(7)
+        await gmail_client.list_messages_page("t", q="", max_results=5)
+        await gmail_client.get_messages_metadata("t", fake_gmail.mailbox.order[:4])
+
+    asyncio.run(run())
+    buckets = scheduler.stats()["buckets"]
+    assert list(buckets) == ["account:7"]
+    # messages.list (5) plus one batch of four messages.get (4 x 5).
+    assert buckets["account:7"]["units"] == 25
+    assert buckets["account:7"]["acquired"] == 2
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from email.message import EmailMessage
+
+from app.gmail.content import RawMessageParser
+
+
+def _message() -> bytes:
+    # multipart/mixed
+    #   0   multipart/alternative (0.0 text/plain, 0.1 text/html)
+    #   1   report.pdf
+    #   2   multipart/mixed (2.0 notes.txt)
+    msg = EmailMessage()
+    msg["Subject"] = "parts"
+    msg.set_content("hello")
+    msg.add_alternative("<p>hello</p>", subtype="html")
+    msg.make_mixed()
+    msg.add_attachment(b"%PDF-1.4", maintype="application", subtype="pdf", filename="report.pdf")
+    nested = EmailMessage()
+    nested.add_attachment(b"notes", maintype="text", subtype="plain", filename="notes.txt")
+    msg.attach(nested)
+    return msg.as_bytes()
+
+
+def test_raw_attachments_use_gmail_part_ids():
+    parser = RawMessageParser()
+    parser.feed(_message())
+    content = parser.close("m1", max_text_bytes=1024)
+
+    assert [(a.filename, a.part_id, a.size) for a in content.attachments] == [
+        ("report.pdf", "1", 8),
+        ("notes.txt", "2.0", 5),
+    ]
+    assert content.text.strip() == "hello"
+    assert content.html.strip() == "<p>hello</p>"
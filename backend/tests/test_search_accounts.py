@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app.api import routes_gmail
+from app.core.config import get_settings
+from app.db.models import GmailAccountToken
+from app.gmail.client import MessageSummary
+
+
+def _summary(message_id: str, internal_date: int) -> MessageSummary:
+    return MessageSummary(
+        id=message_id,
+        thread_id=message_id,
+        snippet=None,
+        from_email=None,
+        subject=None,
+        date=None,
+        internal_date=internal_date,
+    )
+
+
+def test_merged_messages_keep_their_account(monkeypatch):
+    accounts = [
+        GmailAccountToken(id=1, email="a@x", access_token="t1"),
+        GmailAccountToken(id=2, email="b@x", access_token="t2"),
+        GmailAccountToken(id=3, email="c@x", access_token="t3"),
+    ]
+    # Interleaved dates, so the merge alternates between accounts.
+    mailboxes = {
+        1: [_summary("a2", 5000), _summary("a1", 2000)],
+        2: [_summary("b2", 6000), _summary("b1", 3000)],
+        3: [_summary("c2", 4000), _summary("c1", 1000)],
+    }
+
+    async def fake_run_db(fn, *args, **kwargs):
+        return accounts
+
+    async def fake_search_account(account, q, max_results):
+        return mailboxes[account.id], {}
+
+    monkeypatch.setattr(routes_gmail, "run_db", fake_run_db)
+    monkeypatch.setattr(routes_gmail, "_search_account", fake_search_account)
+
+    response = asyncio.run(
+        routes_gmail.search_accounts(
+            from_email=None,
+            date_after=None,
+            context=None,
+            context_field="subject",
+            max_results=6,
+            account_id=[],
+            settings=get_settings(),
+        )
+    )
+    messages = json.loads(response.body)["messages"]
+
+    assert [m["id"] for m in messages] == ["b2", "a2", "c2", "b1", "a1", "c1"]
+    owners = {a.id: a.email for a in accounts}
+    for message in messages:
+        account_id = {"a": 1, "b": 2, "c": 3}[message["id"][0]]
+        assert message["account_id"] == account_id
+        assert message["account_email"] == owners[account_id]
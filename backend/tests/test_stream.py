@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app.api import routes_gmail
+from app.core.config import get_settings
+from app.db import crud
+from app.db.models import GmailAccountToken
+from app.gmail import query_cache
+from app.gmail import sync as gmail_sync
+
+
+def _account(session) -> GmailAccountToken:
+    account = crud.upsert_account_token(session, GmailAccountToken(email="a@x", access_token="t"))
+    asyncio.run(query_cache.cache.invalidate_account(account.id))
+    return account
+
+
+def _args(account: GmailAccountToken, **overrides) -> dict:
+    args = dict(
+        from_email=None,
+        date_after=None,
+        context=None,
+        context_field="subject",
+        max_results=5,
+        account_id=account.id,
+        email=None,
+        source="auto",
+        cursor=None,
+        fields=None,
+        settings=get_settings(),
+    )
+    args.update(overrides)
+    return args
+
+
+def _stream(account: GmailAccountToken, **overrides):
+    async def call():
+        response = await routes_gmail.stream_messages(**_args(account, **overrides))
+        return [json.loads(line) async for line in response.body_iterator]
+
+    *messages, trailer = asyncio.run(call())
+    return [m["message"] for m in sorted(messages, key=lambda m: m["index"])], trailer
+
+
+def test_stream_answers_a_covered_query_from_the_mirror(session, fake_gmail):
+    account = _account(session)
+    asyncio.run(gmail_sync.sync_account(account, "t", full=True))
+    fake_gmail.mailbox.calls.clear()
+
+    messages, trailer = _stream(account)
+
+    assert [m["id"] for m in messages] == fake_gmail.mailbox.order[:5]
+    assert (trailer["source"], trailer["explain"]["plan"]) == ("local", "local")
+    assert sum(fake_gmail.mailbox.calls.values()) == 0
+
+
+def test_streamed_upstream_page_is_shared_with_messages_through_the_query_cache(session, fake_gmail):
+    account = _account(session)
+
+    messages, trailer = _stream(account)
+    assert trailer["source"] == "gmail" and trailer["next_cursor"]
+    calls = dict(fake_gmail.mailbox.calls)
+
+    response = asyncio.run(routes_gmail.fetch_messages(**_args(account)))
+    payload = json.loads(response.body)
+    assert payload["messages"] == messages
+    assert payload["next_cursor"] == trailer["next_cursor"]
+    assert dict(fake_gmail.mailbox.calls) == calls
+
+    # The cursor continues through the planner, on /messages and on the stream alike.
+    next_messages, _ = _stream(account, cursor=trailer["next_cursor"])
+    assert [m["id"] for m in next_messages] == fake_gmail.mailbox.order[5:10]
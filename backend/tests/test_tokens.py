@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app.db import crud
+from app.db.models import GmailAccountToken, GmailTokenRefreshLease
+from app.db.session import run_db
+from app.gmail import tokens
+
+
+def _expired_account(session) -> GmailAccountToken:
+    return crud.upsert_account_token(
+        session,
+        GmailAccountToken(
+            email="a@x",
+            access_token="stale",
+            refresh_token="r",
+            expires_at=datetime.utcnow() - timedelta(minutes=1),
+        ),
+    )
+
+
+def test_lease_is_exclusive_until_released(session):
+    account_id = _expired_account(session).id
+    assert crud.acquire_refresh_lease(session, account_id, owner="w1", ttl_seconds=30)
+    assert not crud.acquire_refresh_lease(session, account_id, owner="w2", ttl_seconds=30)
+    # Re-acquiring extends the holder's own lease.
+    assert crud.acquire_refresh_lease(session, account_id, owner="w1", ttl_seconds=30)
+    # Only the holder can release it.
+    crud.release_refresh_lease(session, account_id, owner="w2")
+    assert not crud.acquire_refresh_lease(session, account_id, owner="w2", ttl_seconds=30)
+    crud.release_refresh_lease(session, account_id, owner="w1")
+    assert crud.acquire_refresh_lease(session, account_id, owner="w2", ttl_seconds=30)
+
+
+def test_expired_lease_can_be_taken_over(session):
+    account_id = _expired_account(session).id
+    assert crud.acquire_refresh_lease(session, account_id, owner="w1", ttl_seconds=-1)
+    assert crud.acquire_refresh_lease(session, account_id, owner="w2", ttl_seconds=30)
+    session.expire_all()
+    assert session.get(GmailTokenRefreshLease, account_id).owner == "w2"
+    assert not crud.acquire_refresh_lease(session, account_id, owner="w1", ttl_seconds=30)
+
+
+def test_concurrent_refreshes_share_one_token_request(session, fake_gmail):
+    account = _expired_account(session)
+
+    async def run():
+        return await asyncio.gather(*(tokens.get_valid_access_token(account) for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert fake_gmail.mailbox.calls["oauth.token"] == 1
+    assert len(set(results)) == 1 and results[0] != "stale"
+    assert tokens.inflight_count() == 0
+    session.expire_all()
+    assert session.get(GmailTokenRefreshLease, account.id) is None
+
+
+def test_waits_for_the_lease_holder_instead_of_refreshing(session, fake_gmail):
+    account = _expired_account(session)
+    # Another worker holds the lease and stores its token shortly after.
+    crud.acquire_refresh_lease(session, account.id, owner="other", ttl_seconds=30)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        row = await run_db(crud.get_account_by_id, account.id)
+        await run_db(
+            crud.update_tokens, row, access_token="from-other", expires_at=datetime.utcnow() + timedelta(hours=1)
+        )
+
+    async def run():
+        _, token = await asyncio.gather(other_worker(), tokens.refresh_account_token(account.id))
+        return token
+
+    assert asyncio.run(run()) == "from-other"
+    assert fake_gmail.mailbox.calls["oauth.token"] == 0
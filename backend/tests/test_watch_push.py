@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.db import crud
+from app.db.models import GmailAccountToken, GmailSyncState
+from app.gmail import watch
+
+
+def _patch(monkeypatch, history_id: str):
+    recorded = []
+    scheduled = []
+    account = GmailAccountToken(id=7, email="a@x", access_token="t")
+    state = GmailSyncState(account_id=7, history_id=history_id)
+
+    async def fake_run_db(fn, *args, **kwargs):
+        if fn is crud.get_account_by_email:
+            return account
+        if fn is crud.get_sync_state:
+            return state
+        if fn is crud.record_watch_notification:
+            recorded.append(args[0])
+            return None
+        raise AssertionError(fn)
+
+    monkeypatch.setattr(watch, "run_db", fake_run_db)
+    monkeypatch.setattr(watch, "schedule_sync", lambda account_id: scheduled.append(account_id) or True)
+    return recorded, scheduled
+
+
+def test_stale_notification_is_not_recorded(monkeypatch):
+    recorded, scheduled = _patch(monkeypatch, history_id="100")
+    outcome = asyncio.run(watch.handle_push(watch.PushNotification(email="a@x", history_id="100")))
+    assert outcome == "stale"
+    assert recorded == [] and scheduled == []
+
+
+def test_new_notification_is_recorded_and_synced(monkeypatch):
+    recorded, scheduled = _patch(monkeypatch, history_id="100")
+    outcome = asyncio.run(watch.handle_push(watch.PushNotification(email="a@x", history_id="101")))
+    assert outcome == "queued"
+    assert recorded == [7] and scheduled == [7]
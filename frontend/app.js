@@ -18,6 +18,60 @@ function qs(selector) {
   return document.querySelector(selector);
 }
 
+// Reads an NDJSON response body and calls onLine for each parsed line as it arrives.
+async function streamNdjson(url, onLine) {
+  const res = await fetch(url, { headers: { "Accept": "application/x-ndjson" } });
+  if (!res.ok) {
+    const text = await res.text();
+    let msg = `Request failed: ${res.status}`;
+    try {
+      msg = JSON.parse(text).detail || msg;
+    } catch {
+      msg = text || msg;
+    }
+    throw new Error(msg);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+    let newline;
+    while ((newline = buffer.indexOf("\n")) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) onLine(JSON.parse(line));
+    }
+    if (done) break;
+  }
+  if (buffer.trim()) onLine(JSON.parse(buffer));
+}
+
+function renderMessage(msg, index) {
+  const li = document.createElement("li");
+  li.className = "result";
+  li.dataset.index = String(index);
+  li.innerHTML = `
+    <div class="subject">${(msg.subject || "(no subject)").replaceAll("<", "&lt;")}</div>
+    <div class="meta">From: ${(msg.from_email || "?").replaceAll("<", "&lt;")} • ${(msg.date || "").replaceAll("<", "&lt;")}</div>
+    <div class="snippet">${(msg.snippet || "").replaceAll("<", "&lt;")}</div>
+  `;
+  return li;
+}
+
+// Keep rows in list order even though they stream in completion order.
+function insertOrdered(list, li, index) {
+  for (const existing of list.children) {
+    if (Number(existing.dataset.index) > index) {
+      list.insertBefore(li, existing);
+      return;
+    }
+  }
+  list.appendChild(li);
+}
+
 const connectBtn = qs("#connect");
 if (connectBtn) {
   connectBtn.addEventListener("click", () => {
@@ -45,21 +99,20 @@ if (filtersForm) {
     }
 
     try {
-      const data = await fetchJson(`/gmail/messages?${params.toString()}`);
-      status.textContent = `Query: ${data.query}`;
-
-      for (const msg of data.messages || []) {
-        const li = document.createElement("li");
-        li.className = "result";
-        li.innerHTML = `
-          <div class="subject">${(msg.subject || "(no subject)").replaceAll("<", "&lt;")}</div>
-          <div class="meta">From: ${(msg.from_email || "?").replaceAll("<", "&lt;")} • ${(msg.date || "").replaceAll("<", "&lt;")}</div>
-          <div class="snippet">${(msg.snippet || "").replaceAll("<", "&lt;")}</div>
-        `;
-        results.appendChild(li);
-      }
+      let received = 0;
+      await streamNdjson(`/gmail/messages/stream?${params.toString()}`, (line) => {
+        if (line.type === "message") {
+          received += 1;
+          insertOrdered(results, renderMessage(line.message, line.index), line.index);
+          status.textContent = `Loading... ${received} received`;
+        } else if (line.type === "end") {
+          const failed = (line.errors || []).length;
+          const source = line.source ? ` [${line.source}]` : "";
+          status.textContent = `Query: ${line.query}${source}` + (failed ? ` (${failed} failed)` : "");
+        }
+      });
 
-      if (!data.messages || data.messages.length === 0) {
+      if (received === 0) {
         const li = document.createElement("li");
         li.className = "muted";
         li.textContent = "No messages found.";